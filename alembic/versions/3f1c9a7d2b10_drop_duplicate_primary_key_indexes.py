@@ -0,0 +1,45 @@
+"""Drop the redundant indexes on UUID primary keys
+
+Every table declared ``id`` with ``primary_key=True, index=True``, which
+created an ``ix_<table>_id`` index next to the primary key's own unique
+index. Lookups only ever use the primary key, so the second index just
+doubles the write and cache cost of every insert.
+
+Revision ID: 3f1c9a7d2b10
+Revises:
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c9a7d2b10'
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = (
+    "admins",
+    "donations",
+    "subscribers",
+    "newsletters",
+    "email_templates",
+    "volunteers",
+    "donors",
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table in TABLES:
+        op.drop_index(f"ix_{table}_id", table_name=table, if_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in TABLES:
+        op.create_index(f"ix_{table}_id", table, ["id"], unique=False, if_not_exists=True)
@@ -0,0 +1,38 @@
+"""Add the newsletter send lease and the scheduled-send index
+
+The scheduler claims a due newsletter by setting ``lease_owner`` and
+``lease_expires_at`` in one conditional UPDATE, so that exactly one worker
+sends it. Pending schedules are loaded by status and scheduled_at.
+
+Revision ID: 8b2e4d61c7a3
+Revises: 3f1c9a7d2b10
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b2e4d61c7a3'
+down_revision: Union[str, Sequence[str], None] = '3f1c9a7d2b10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("newsletters", sa.Column("lease_owner", sa.String(), nullable=True))
+    op.add_column("newsletters", sa.Column("lease_expires_at", sa.DateTime(), nullable=True))
+    op.create_index(
+        "ix_newsletters_status_scheduled_at", "newsletters", ["status", "scheduled_at"], if_not_exists=True,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_newsletters_status_scheduled_at", table_name="newsletters", if_exists=True)
+    op.drop_column("newsletters", "lease_expires_at")
+    op.drop_column("newsletters", "lease_owner")
@@ -0,0 +1,77 @@
+"""Declare UUID columns as CHAR(32) on existing SQLite databases
+
+SQLite gives a column declared "UUID" NUMERIC affinity. A hex id made only
+of digits, or of digits and one "e", is then stored as a number and read
+back as a float. The models now declare UUID columns as CHAR(32) on
+SQLite (api/v1/models/models.py), but that only reaches tables created
+after the change.
+
+SQLite cannot change a column's declared type in place, so each table
+that still has a "UUID" column is rebuilt: created again under a
+temporary name with CHAR(32), filled with INSERT ... SELECT, swapped in,
+and given back its indexes and triggers. SQLite does not enforce foreign
+keys in this app (PRAGMA foreign_keys is off), so dropping a referenced
+table does not cascade. Ids already stored as numbers were damaged on
+write and cannot be recovered; the rebuild keeps them as they are.
+
+Other databases are not affected.
+
+Revision ID: a6c2e9f4b1d7
+Revises: f2a8d6b3c915
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+import re
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a6c2e9f4b1d7'
+down_revision: Union[str, Sequence[str], None] = 'f2a8d6b3c915'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _rebuild(bind, table: str, uuid_columns) -> None:
+    create_sql = bind.execute(
+        sa.text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": table}
+    ).scalar()
+    dependents = bind.execute(sa.text(
+        "SELECT sql FROM sqlite_master WHERE tbl_name = :name AND type IN ('index', 'trigger') AND sql IS NOT NULL"
+    ), {"name": table}).scalars().all()
+
+    temporary = f"_{table}_rebuild"
+    create_sql = re.sub(rf'^CREATE TABLE\s+("?){re.escape(table)}\1', f'CREATE TABLE "{temporary}"', create_sql)
+    for column in uuid_columns:
+        create_sql = re.sub(rf'(\b{re.escape(column)}"?\s+)UUID\b', r"\1CHAR(32)", create_sql)
+
+    bind.execute(sa.text(create_sql))
+    bind.execute(sa.text(f'INSERT INTO "{temporary}" SELECT * FROM "{table}"'))
+    bind.execute(sa.text(f'DROP TABLE "{table}"'))
+    bind.execute(sa.text(f'ALTER TABLE "{temporary}" RENAME TO "{table}"'))
+    for sql in dependents:
+        bind.execute(sa.text(sql))
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name != "sqlite":
+        return
+    tables = bind.execute(sa.text(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+    )).scalars().all()
+    for table in tables:
+        columns = bind.execute(sa.text(f'PRAGMA table_info("{table}")')).all()
+        uuid_columns = [column.name for column in columns if column.type.upper() == "UUID"]
+        if uuid_columns:
+            _rebuild(bind, table, uuid_columns)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # CHAR(32) is what the models declare on SQLite; there is nothing to undo
+    pass
@@ -0,0 +1,68 @@
+"""Add the newsletter delivery ledger and progress counters
+
+``newsletter_deliveries`` holds one row per (newsletter, subscriber) with
+that recipient's delivery status. The counters on ``newsletters`` are
+updated in the same transactions as the ledger, so that progress is read
+without counting rows. ``checkpoint_subscriber_id`` is where a resumed
+send continues.
+
+The app's startup create_all may already have made the new table (and
+its enum type) before this runs, so it is only created when missing.
+
+Revision ID: c41f7e9a2d58
+Revises: 8b2e4d61c7a3
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41f7e9a2d58'
+down_revision: Union[str, Sequence[str], None] = '8b2e4d61c7a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COUNTERS = ("queued_count", "sent_count", "deferred_count", "bounced_count")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if not sa.inspect(op.get_bind()).has_table("newsletter_deliveries"):
+        op.create_table(
+            "newsletter_deliveries",
+            sa.Column("newsletter_id", postgresql.UUID(as_uuid=True), nullable=False),
+            sa.Column("subscriber_id", postgresql.UUID(as_uuid=True), nullable=False),
+            sa.Column("email", sa.String(), nullable=False),
+            sa.Column(
+                "status",
+                sa.Enum("QUEUED", "SENT", "DEFERRED", "BOUNCED", name="deliverystatus"),
+                nullable=False,
+            ),
+            sa.Column("attempts", sa.Integer(), nullable=False),
+            sa.Column("last_reply", sa.String(), nullable=True),
+            sa.Column("updated_at", sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(["newsletter_id"], ["newsletters.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("newsletter_id", "subscriber_id"),
+        )
+    op.create_index(
+        "ix_newsletter_deliveries_newsletter_status", "newsletter_deliveries", ["newsletter_id", "status"],
+        if_not_exists=True,
+    )
+    for column in COUNTERS:
+        op.add_column("newsletters", sa.Column(column, sa.Integer(), nullable=False, server_default="0"))
+    op.add_column("newsletters", sa.Column("checkpoint_subscriber_id", postgresql.UUID(as_uuid=True), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("newsletters", "checkpoint_subscriber_id")
+    for column in reversed(COUNTERS):
+        op.drop_column("newsletters", column)
+    op.drop_index("ix_newsletter_deliveries_newsletter_status", table_name="newsletter_deliveries")
+    op.drop_table("newsletter_deliveries")
+    sa.Enum(name="deliverystatus").drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,54 @@
+"""Add maintained row counters for subscriber, volunteer and donor stats
+
+``entity_counters`` holds total and active counts per table, split over a
+few shard rows that writers increment in their own transactions. The
+counts are seeded here from the current tables, all in shard 0.
+
+The app's startup create_all may already have made the (empty, or by now
+partly incremented) table, so it is only created when missing and each
+table's counters are replaced by the seed rather than added to.
+
+Revision ID: d7a3c5e81f46
+Revises: c41f7e9a2d58
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7a3c5e81f46'
+down_revision: Union[str, Sequence[str], None] = 'c41f7e9a2d58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COUNTED = ("subscribers", "volunteers", "donors")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if not sa.inspect(op.get_bind()).has_table("entity_counters"):
+        op.create_table(
+            "entity_counters",
+            sa.Column("name", sa.String(), nullable=False),
+            sa.Column("shard", sa.Integer(), nullable=False),
+            sa.Column("total", sa.BigInteger(), nullable=False),
+            sa.Column("active", sa.BigInteger(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint("name", "shard"),
+        )
+    for table in COUNTED:
+        op.execute(f"DELETE FROM entity_counters WHERE name = '{table}'")
+        op.execute(
+            f"INSERT INTO entity_counters (name, shard, total, active, updated_at) "
+            f"SELECT '{table}', 0, COUNT(*), COUNT(CASE WHEN is_active THEN 1 END), CURRENT_TIMESTAMP "
+            f"FROM {table}"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("entity_counters")
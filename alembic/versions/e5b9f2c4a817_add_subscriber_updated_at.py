@@ -0,0 +1,36 @@
+"""Add subscribers.updated_at for delta exports
+
+Every write to a subscriber sets ``updated_at``. Delta exports read the
+rows changed since a watermark in (updated_at, id) order, through
+``ix_subscribers_updated_at_id``. Existing rows get their last known
+change: the unsubscribe time, else the subscribe time.
+
+Revision ID: e5b9f2c4a817
+Revises: d7a3c5e81f46
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b9f2c4a817'
+down_revision: Union[str, Sequence[str], None] = 'd7a3c5e81f46'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("subscribers", sa.Column("updated_at", sa.DateTime(), nullable=True))
+    op.execute("UPDATE subscribers SET updated_at = COALESCE(unsubscribed_at, subscribed_at, CURRENT_TIMESTAMP)")
+    op.create_index("ix_subscribers_updated_at_id", "subscribers", ["updated_at", "id"], if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_subscribers_updated_at_id", table_name="subscribers")
+    op.drop_column("subscribers", "updated_at")
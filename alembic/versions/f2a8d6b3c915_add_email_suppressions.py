@@ -0,0 +1,50 @@
+"""Add the email suppression list
+
+``email_suppressions`` holds the lowercased addresses that permanently
+bounced or complained. Subscribers with these addresses are deactivated,
+and the newsletter sender skips them. ``created_at`` is indexed for the
+incremental reloads of the in-memory list, and ``lower(email)`` on
+subscribers for matching reported addresses whatever their case.
+
+The app's startup create_all may already have made the new table (and
+its enum type) before this runs, so it is only created when missing.
+
+Revision ID: f2a8d6b3c915
+Revises: e5b9f2c4a817
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a8d6b3c915'
+down_revision: Union[str, Sequence[str], None] = 'e5b9f2c4a817'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if not sa.inspect(op.get_bind()).has_table("email_suppressions"):
+        op.create_table(
+            "email_suppressions",
+            sa.Column("email", sa.String(), nullable=False),
+            sa.Column("reason", sa.Enum("BOUNCE", "COMPLAINT", name="suppressionreason"), nullable=False),
+            sa.Column("detail", sa.String(), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint("email"),
+        )
+    op.create_index("ix_email_suppressions_created_at", "email_suppressions", ["created_at"], if_not_exists=True)
+    op.create_index("ix_subscribers_email_lower", "subscribers", [sa.text("lower(email)")], if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_subscribers_email_lower", table_name="subscribers")
+    op.drop_index("ix_email_suppressions_created_at", table_name="email_suppressions")
+    op.drop_table("email_suppressions")
+    sa.Enum(name="suppressionreason").drop(op.get_bind(), checkfirst=True)
@@ -1,8 +1,18 @@
 """ The database module
 """
-from sqlalchemy.orm import sessionmaker, scoped_session, declarative_base
-from sqlalchemy import create_engine
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy.orm import sessionmaker, declarative_base
+from fastapi import Request
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from api.utils.settings import settings, BASE_DIR
+from api.db.instrumentation import (
+    instrument_engine,
+    InstrumentedQueuePool,
+    InstrumentedAsyncQueuePool,
+)
 
 
 DB_HOST = settings.DB_HOST
@@ -13,32 +23,141 @@ DB_NAME = settings.DB_NAME
 DB_TYPE = settings.DB_TYPE
 
 
+def pool_options(poolclass=InstrumentedQueuePool) -> dict:
+    """Pool settings shared by every server-side database engine"""
+    return {
+        "poolclass": poolclass,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+def postgres_connect_args() -> dict:
+    if settings.DB_STATEMENT_TIMEOUT_MS > 0:
+        return {"options": f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}"}
+    return {}
+
+
+def asyncpg_connect_args() -> dict:
+    if settings.DB_STATEMENT_TIMEOUT_MS > 0:
+        return {"server_settings": {"statement_timeout": str(settings.DB_STATEMENT_TIMEOUT_MS)}}
+    return {}
+
+
+def sqlite_path(test_mode: bool = False) -> str:
+    return str(BASE_DIR / "test.db") if test_mode else settings.SQLITE_PATH
+
+
+def configure_sqlite(sync_engine, writer: bool = False) -> None:
+    """Apply the SQLite performance profile to every new connection
+
+    WAL lets readers run alongside the single writer, synchronous=NORMAL is
+    durable across application crashes in WAL mode, and mmap plus a larger
+    page cache keep hot pages out of read() calls. pysqlite's implicit
+    transaction handling is turned off so that transactions start with an
+    explicit BEGIN; the writer uses BEGIN IMMEDIATE to take the write lock up
+    front instead of failing to upgrade a read transaction later.
+    """
+
+    @event.listens_for(sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size=-{settings.SQLITE_CACHE_SIZE_KB}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
+    @event.listens_for(sync_engine, "begin")
+    def begin_transaction(conn):
+        conn.exec_driver_sql("BEGIN IMMEDIATE" if writer else "BEGIN")
+
+
 def get_db_engine(test_mode: bool = False):
-    DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+    if DB_TYPE == "sqlite" or test_mode:
+        sqlite_engine = create_engine(
+            f"sqlite:///{sqlite_path(test_mode)}",
+            connect_args={"check_same_thread": False},
+        )
+        configure_sqlite(sqlite_engine, writer=True)
+        return sqlite_engine
 
+    DATABASE_URL = (
+        f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+    )
+    return create_engine(
+        DATABASE_URL, connect_args=postgres_connect_args(), **pool_options()
+    )
+
+
+def get_async_db_engine(test_mode: bool = False, read_only: bool = False):
+    """Engine used by the request handlers (asyncpg / aiosqlite)
+
+    On SQLite the write engine holds a single connection, so concurrent write
+    transactions queue for it in arrival order instead of spinning on
+    SQLITE_BUSY; ``read_only=True`` builds the separate reader pool.
+    """
     if DB_TYPE == "sqlite" or test_mode:
-        BASE_PATH = f"sqlite:///{BASE_DIR}"
-        DATABASE_URL = BASE_PATH + "/"
-
-        if test_mode:
-            DATABASE_URL = BASE_PATH + "test.db"
-
-            return create_engine(
-                DATABASE_URL, connect_args={"check_same_thread": False}
-            )
-    elif DB_TYPE == "postgresql":
-        DATABASE_URL = (
-            f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+        options = pool_options(InstrumentedAsyncQueuePool)
+        if read_only:
+            options.update(pool_size=settings.SQLITE_READ_POOL_SIZE, max_overflow=0)
+        else:
+            options.update(pool_size=1, max_overflow=0)
+        sqlite_engine = create_async_engine(
+            f"sqlite+aiosqlite:///{sqlite_path(test_mode)}", **options
         )
+        configure_sqlite(sqlite_engine.sync_engine, writer=not read_only)
+        return sqlite_engine
 
-    return create_engine(DATABASE_URL)
+    DATABASE_URL = (
+        f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+    )
+    return create_async_engine(
+        DATABASE_URL,
+        connect_args=asyncpg_connect_args(),
+        **pool_options(InstrumentedAsyncQueuePool)
+    )
 
 
+# Synchronous engine for startup schema checks, migrations and CLI tools
 engine = get_db_engine()
+instrument_engine(engine, "sync")
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-db_session = scoped_session(SessionLocal)
+# Asynchronous engine for the API
+async_engine = get_async_db_engine()
+instrument_engine(async_engine.sync_engine, "primary")
+
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
+
+# Safe (GET/HEAD) requests on SQLite read through their own connection pool
+# and never wait behind the writer; elsewhere both names share one engine.
+if DB_TYPE == "sqlite":
+    async_read_engine = get_async_db_engine(read_only=True)
+    instrument_engine(async_read_engine.sync_engine, "read")
+    AsyncReadSessionLocal = async_sessionmaker(
+        async_read_engine, autoflush=False, expire_on_commit=False
+    )
+else:
+    async_read_engine = async_engine
+    AsyncReadSessionLocal = AsyncSessionLocal
+
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+# The session serving the current request, for helpers that are not handed
+# one explicitly. Each request runs in its own task and therefore context.
+_current_session: ContextVar[Optional[AsyncSession]] = ContextVar(
+    "current_session", default=None
+)
 
 Base = declarative_base()
 
@@ -47,9 +166,19 @@ def create_database():
     return Base.metadata.create_all(bind=engine)
 
 
-def get_db():
-    db = db_session()
+def get_current_session() -> Optional[AsyncSession]:
+    """Return the request-scoped session opened by get_db, if any"""
+    return _current_session.get()
+
+
+async def get_db(request: Request):
+    if request.method in SAFE_METHODS:
+        db = AsyncReadSessionLocal()
+    else:
+        db = AsyncSessionLocal()
+    _current_session.set(db)
     try:
         yield db
     finally:
-        db.close()
+        _current_session.set(None)
+        await db.close()
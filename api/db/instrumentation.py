@@ -0,0 +1,180 @@
+""" SQLAlchemy engine instrumentation: per-statement timing, slow-query log
+and connection pool saturation
+"""
+import hashlib
+import logging
+import re
+import time
+from functools import lru_cache
+from typing import Tuple
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from api.utils.metrics import registry, escape_label
+from api.utils.settings import settings
+
+
+slow_query_logger = logging.getLogger("api.db.slow_query")
+
+# A summary, not a histogram: bucket lines for every fingerprint would make
+# each scrape hundreds of kilobytes
+db_query_duration_seconds = registry.summary(
+    "db_query_duration_seconds",
+    "SQL statement latency by normalized statement fingerprint",
+    ("fingerprint",),
+)
+
+# Normalized statements are bounded by the code base, but guard against
+# dynamically built SQL flooding the label space anyway.
+MAX_TRACKED_STATEMENTS = 500
+OVERFLOW_FINGERPRINT = "other"
+_statements = {}
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+# Named ":name" placeholders, but not the type in a PostgreSQL "::type" cast
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|(?<![:\w]):\w+|\$\d+|%s|\?")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+@lru_cache(maxsize=2048)
+def normalize_sql(statement: str) -> Tuple[str, str]:
+    """Return ``(normalized_sql, fingerprint)`` for a DBAPI statement
+
+    Literals and bind placeholders become ``?`` and expanded ``IN`` lists
+    collapse to ``(?...)`` so that one query shape maps to one fingerprint.
+    """
+    sql = _WHITESPACE.sub(" ", statement).strip()
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = _PLACEHOLDER.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _PLACEHOLDER_LIST.sub("(?...)", sql)
+    return sql, hashlib.sha1(sql.encode()).hexdigest()[:12]
+
+
+def parameter_shape(parameters, executemany: bool = False):
+    """Describe bound parameters by type only, never by value"""
+    if executemany and parameters:
+        return {"rows": len(parameters), "row": parameter_shape(parameters[0])}
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+def collect_statements():
+    yield "# HELP db_query_info Normalized SQL for each statement fingerprint"
+    yield "# TYPE db_query_info gauge"
+    for fingerprint, sql in sorted(_statements.items()):
+        yield f'db_query_info{{fingerprint="{fingerprint}",statement="{escape_label(sql[:300])}"}} 1'
+
+
+registry.register_collector(collect_statements)
+
+
+db_pool_checkout_wait_seconds = registry.histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a pooled connection",
+    ("pool",),
+)
+db_pool_timeouts_total = registry.counter(
+    "db_pool_timeouts_total",
+    "Checkouts that gave up after DB_POOL_TIMEOUT",
+    ("pool",),
+)
+
+
+class InstrumentedPoolMixin:
+    """Times every checkout, including the wait for a free connection"""
+
+    metrics_name = "primary"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            db_pool_timeouts_total.inc((self.metrics_name,))
+            raise
+        finally:
+            db_pool_checkout_wait_seconds.observe((self.metrics_name,), time.perf_counter() - start)
+
+    def recreate(self):
+        # engine.dispose() swaps in a fresh pool; keep its metrics label
+        pool = super().recreate()
+        pool.metrics_name = self.metrics_name
+        return pool
+
+
+class InstrumentedQueuePool(InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+_engines = {}
+
+
+def collect_pools():
+    gauges = (
+        ("db_pool_size", "Configured pool size", lambda p: p.size()),
+        ("db_pool_checked_out", "Connections currently in use", lambda p: p.checkedout()),
+        ("db_pool_checked_in", "Idle connections in the pool", lambda p: p.checkedin()),
+        ("db_pool_overflow", "Connections open beyond the pool size", lambda p: max(p.overflow(), 0)),
+    )
+    for name, documentation, read in gauges:
+        yield f"# HELP {name} {documentation}"
+        yield f"# TYPE {name} gauge"
+        for pool_name, engine in sorted(_engines.items()):
+            yield f'{name}{{pool="{pool_name}"}} {read(engine.pool)}'
+
+
+registry.register_collector(collect_pools)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+    sql, fingerprint = normalize_sql(statement)
+    if fingerprint not in _statements:
+        if len(_statements) >= MAX_TRACKED_STATEMENTS:
+            fingerprint = OVERFLOW_FINGERPRINT
+        else:
+            _statements[fingerprint] = sql
+    db_query_duration_seconds.observe((fingerprint,), elapsed)
+
+    if elapsed * 1000 >= settings.SLOW_QUERY_THRESHOLD_MS:
+        slow_query_logger.warning(
+            "slow query %.1fms fingerprint=%s params=%s sql=%s",
+            elapsed * 1000,
+            fingerprint,
+            parameter_shape(parameters, executemany),
+            sql,
+        )
+
+
+def _handle_error(exception_context):
+    # after_cursor_execute does not fire for failed statements
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_start_time"):
+        conn.info["query_start_time"].pop()
+
+
+def instrument_engine(engine, name: str = "primary") -> None:
+    """Attach timing hooks to ``engine`` (a sync Engine) and export its pool"""
+    if isinstance(engine.pool, InstrumentedPoolMixin):
+        engine.pool.metrics_name = name
+    if isinstance(engine.pool, QueuePool):
+        _engines[name] = engine
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
@@ -0,0 +1,403 @@
+""" Monthly range partitioning and archival of the donations table (PostgreSQL)
+
+With DONATION_PARTITIONING=true, ``donations`` is a table partitioned by
+RANGE (created_at) with one partition per month, so recent-month queries and
+vacuums only touch recent partitions. The primary key becomes
+(id, created_at) in the database, as PostgreSQL requires the partition key
+in every unique constraint; the ORM still identifies donations by id alone.
+
+    python -m api.db.partitions enable           # convert an existing table
+    python -m api.db.partitions ensure           # create upcoming months
+    python -m api.db.partitions list
+    python -m api.db.partitions detach 2023-01   # keep as a standalone table
+    python -m api.db.partitions archive --before 2024-01
+
+A fresh database gets the partitioned table at startup, and the app keeps
+DONATION_PARTITION_MONTHS_AHEAD months of partitions created ahead of time.
+Rows outside every monthly partition (backfills, imports, clock skew) land
+in the DEFAULT partition, donations_default; maintenance later creates the
+months it finds there, up to the look-ahead horizon, and moves the rows in.
+Archiving copies a month to DONATION_ARCHIVE_DIR as gzipped CSV, then detaches
+and drops the partition. The export endpoint still serves archived months
+from those files, and reads detached months from their standalone tables.
+"""
+import argparse
+import asyncio
+import csv
+import gzip
+import logging
+import os
+import re
+import sys
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import MetaData, PrimaryKeyConstraint, Table, inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+from api.utils.settings import settings
+from api.v1.models.models import Donation, DonationStatus
+
+
+logger = logging.getLogger("api.db.partitions")
+
+TABLE = "donations"
+# Column order of exports and archive files
+EXPORT_COLUMNS = (
+    "id",
+    "created_at",
+    "title",
+    "donor_name",
+    "donor_email",
+    "donor_phone",
+    "amount",
+    "status",
+    "payment_reference",
+    "is_anonymous",
+    "message",
+)
+MAINTENANCE_INTERVAL = 6 * 3600  # seconds
+DEFAULT_PARTITION = "donations_default"
+_PARTITION_NAME = re.compile(r"^donations_p(\d{4})_(\d{2})$")
+_ARCHIVE_NAME = re.compile(r"^donations_(\d{4})_(\d{2})\.csv\.gz$")
+_LOCK_KEY = 0x646F6E61  # pg_advisory_xact_lock key serializing partition DDL
+
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def parse_month(value: str) -> date:
+    return datetime.strptime(value, "%Y-%m").date()
+
+
+def partition_name(month: date) -> str:
+    return f"donations_p{month.year:04d}_{month.month:02d}"
+
+
+def archive_path(month: date) -> Path:
+    return Path(settings.DONATION_ARCHIVE_DIR) / f"donations_{month.year:04d}_{month.month:02d}.csv.gz"
+
+
+def partitioned_table(metadata: MetaData) -> Table:
+    """The donations table as declared by the model, partitioned by month"""
+    columns = []
+    for column in Donation.__table__.columns:
+        column = column._copy()
+        column.primary_key = False
+        if column.name == "created_at":
+            column.nullable = False
+        columns.append(column)
+    return Table(
+        TABLE,
+        metadata,
+        *columns,
+        PrimaryKeyConstraint("id", "created_at", name="donations_pkey"),
+        postgresql_partition_by="RANGE (created_at)",
+    )
+
+
+def is_partitioned(connection: Connection) -> bool:
+    return bool(connection.execute(
+        text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)"),
+        {"table": TABLE},
+    ).scalar())
+
+
+def list_partitions(connection: Connection) -> List[Tuple[date, str]]:
+    names = connection.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:table)"
+    ), {"table": TABLE}).scalars()
+    partitions = []
+    for name in names:
+        match = _PARTITION_NAME.match(name)
+        if match:
+            partitions.append((date(int(match[1]), int(match[2]), 1), name))
+    return sorted(partitions)
+
+
+def detached_partitions(connection: Connection) -> List[Tuple[date, str]]:
+    """Month tables left behind by ``detach``, no longer attached to ``donations``"""
+    names = connection.execute(text(
+        "SELECT c.relname FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE n.nspname = current_schema() AND c.relkind = 'r' AND NOT c.relispartition "
+        "AND c.relname LIKE 'donations%'"
+    )).scalars()
+    detached = []
+    for name in names:
+        match = _PARTITION_NAME.match(name)
+        if match:
+            detached.append((date(int(match[1]), int(match[2]), 1), name))
+    return sorted(detached)
+
+
+def detached_table(name: str) -> Table:
+    """A detached month as a Table typed like ``donations``, for reading it back"""
+    return Donation.__table__.to_metadata(MetaData(), name=name)
+
+
+def _lock(connection: Connection) -> None:
+    # Workers run the maintenance concurrently; serialize the DDL
+    connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _LOCK_KEY})
+
+
+def _create_partition(connection: Connection, month: date) -> None:
+    name = partition_name(month)
+    bounds = {"start": month, "end": add_months(month, 1)}
+    in_month = '"created_at" >= :start AND "created_at" < :end'
+    # PostgreSQL refuses a partition whose range has rows in the DEFAULT
+    # partition; set them aside and route them again once it exists
+    stray = connection.execute(
+        text(f'SELECT EXISTS (SELECT 1 FROM "{DEFAULT_PARTITION}" WHERE {in_month})'), bounds
+    ).scalar()
+    columns = ", ".join(f'"{column}"' for column in EXPORT_COLUMNS)
+    if stray:
+        connection.execute(text(f'CREATE TEMPORARY TABLE "{TABLE}_moving" (LIKE "{TABLE}")'))
+        connection.execute(text(
+            f'WITH moved AS (DELETE FROM "{DEFAULT_PARTITION}" WHERE {in_month} RETURNING {columns}) '
+            f'INSERT INTO "{TABLE}_moving" ({columns}) SELECT {columns} FROM moved'
+        ), bounds)
+    connection.execute(text(
+        f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{TABLE}" '
+        f"FOR VALUES FROM ('{bounds['start'].isoformat()}') TO ('{bounds['end'].isoformat()}')"
+    ))
+    if stray:
+        connection.execute(text(f'INSERT INTO "{TABLE}" ({columns}) SELECT {columns} FROM "{TABLE}_moving"'))
+        connection.execute(text(f'DROP TABLE "{TABLE}_moving"'))
+
+
+def ensure_partitions(connection: Connection, first: date, last: date) -> List[str]:
+    """Create the monthly partitions from ``first`` to ``last`` (inclusive) that are missing"""
+    _lock(connection)
+    connection.execute(text(f'CREATE TABLE IF NOT EXISTS "{DEFAULT_PARTITION}" PARTITION OF "{TABLE}" DEFAULT'))
+    existing = {name for _, name in list_partitions(connection)}
+    created = []
+    month = month_start(first)
+    while month <= last:
+        name = partition_name(month)
+        if name not in existing:
+            _create_partition(connection, month)
+            created.append(name)
+        month = add_months(month, 1)
+    return created
+
+
+def default_partition_months(connection: Connection) -> List[date]:
+    """Months that have rows in the DEFAULT partition"""
+    months = connection.execute(text(
+        f'SELECT DISTINCT date_trunc(\'month\', "created_at") FROM "{DEFAULT_PARTITION}"'
+    )).scalars()
+    return sorted(month_start(month) for month in months)
+
+
+def ensure_future_partitions(engine: Engine, months_ahead: Optional[int] = None) -> List[str]:
+    months_ahead = settings.DONATION_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    this_month = month_start(datetime.utcnow())
+    last = add_months(this_month, months_ahead)
+    with engine.begin() as connection:
+        if not is_partitioned(connection):
+            return []
+        created = ensure_partitions(connection, this_month, last)
+        # Far-future rows stay in the default partition until they come in range
+        for month in default_partition_months(connection):
+            if month <= last:
+                created += ensure_partitions(connection, month, month)
+    if created:
+        logger.info("Created donation partitions %s", ", ".join(created))
+    return created
+
+
+def create_partitioned_table(engine: Engine) -> bool:
+    """Create ``donations`` partitioned if it does not exist yet (fresh databases)"""
+    if inspect(engine).has_table(TABLE):
+        return False
+    with engine.begin() as connection:
+        partitioned_table(MetaData()).create(connection, checkfirst=True)
+    ensure_future_partitions(engine)
+    return True
+
+
+def enable_partitioning(engine: Engine) -> int:
+    """Convert an existing unpartitioned ``donations`` table in one transaction
+
+    Returns the number of rows moved. The table is locked for the duration,
+    so run it in a maintenance window on large tables.
+    """
+    legacy = f"{TABLE}_unpartitioned"
+    columns = ", ".join(f'"{name}"' for name in EXPORT_COLUMNS)
+    select_columns = columns.replace('"created_at"', 'COALESCE("created_at", now()) AS "created_at"')
+    with engine.begin() as connection:
+        _lock(connection)
+        if is_partitioned(connection):
+            return 0
+        connection.execute(text(f'ALTER TABLE "{TABLE}" RENAME TO "{legacy}"'))
+        connection.execute(text(f'ALTER TABLE "{legacy}" RENAME CONSTRAINT "donations_pkey" TO "{legacy}_pkey"'))
+        connection.execute(text('DROP INDEX IF EXISTS "ix_donations_id"'))
+        partitioned_table(MetaData()).create(connection, checkfirst=True)
+
+        oldest = connection.execute(text(f'SELECT min("created_at") FROM "{legacy}"')).scalar()
+        this_month = month_start(datetime.utcnow())
+        ensure_partitions(
+            connection,
+            month_start(oldest) if oldest else this_month,
+            add_months(this_month, settings.DONATION_PARTITION_MONTHS_AHEAD),
+        )
+        moved = connection.execute(text(
+            f'INSERT INTO "{TABLE}" ({columns}) SELECT {select_columns} FROM "{legacy}"'
+        )).rowcount
+        connection.execute(text(f'DROP TABLE "{legacy}"'))
+    return moved
+
+
+def detach_partition(engine: Engine, month: date) -> str:
+    """Detach a month, leaving it as a standalone table outside ``donations``"""
+    name = partition_name(month)
+    with engine.begin() as connection:
+        _lock(connection)
+        connection.execute(text(f'ALTER TABLE "{TABLE}" DETACH PARTITION "{name}"'))
+    return name
+
+
+def archive_partitions(engine: Engine, before: date) -> List[Path]:
+    """Move every monthly partition older than ``before`` to compressed CSV
+
+    Each month is written to a temporary file, fsynced and renamed into place
+    before its partition is detached and dropped in the same transaction, so
+    a crash leaves either the partition or a complete archive (or both).
+    """
+    archive_dir = Path(settings.DONATION_ARCHIVE_DIR)
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    columns = ", ".join(f'"{name}"' for name in EXPORT_COLUMNS)
+    archived = []
+    with engine.connect() as connection:
+        months = [item for item in list_partitions(connection) if item[0] < before]
+    for month, name in months:
+        path = archive_path(month)
+        temporary = path.with_suffix(".tmp")
+        with engine.begin() as connection:
+            _lock(connection)
+            cursor = connection.connection.driver_connection.cursor()
+            with gzip.open(temporary, "wb") as archive:
+                cursor.copy_expert(
+                    f'COPY (SELECT {columns} FROM "{name}" ORDER BY "created_at", "id") '
+                    "TO STDOUT WITH (FORMAT csv, HEADER true)",
+                    archive,
+                )
+            with open(temporary, "rb") as archive:
+                os.fsync(archive.fileno())
+            os.replace(temporary, path)
+            connection.execute(text(f'ALTER TABLE "{TABLE}" DETACH PARTITION "{name}"'))
+            connection.execute(text(f'DROP TABLE "{name}"'))
+        logger.info("Archived %s to %s", name, path)
+        archived.append(path)
+    return archived
+
+
+def run_maintenance(engine: Engine) -> None:
+    ensure_future_partitions(engine)
+    if settings.DONATION_ARCHIVE_AFTER_MONTHS > 0:
+        cutoff = add_months(month_start(datetime.utcnow()), -settings.DONATION_ARCHIVE_AFTER_MONTHS)
+        archive_partitions(engine, cutoff)
+
+
+async def maintain(engine: Engine) -> None:
+    """Background task started by the app lifespan when partitioning is on"""
+    while True:
+        try:
+            await asyncio.to_thread(run_maintenance, engine)
+        except Exception:
+            logger.exception("Donation partition maintenance failed")
+        await asyncio.sleep(MAINTENANCE_INTERVAL)
+
+
+def archived_months() -> List[Tuple[date, Path]]:
+    archive_dir = Path(settings.DONATION_ARCHIVE_DIR)
+    if not archive_dir.is_dir():
+        return []
+    months = []
+    for path in archive_dir.iterdir():
+        match = _ARCHIVE_NAME.match(path.name)
+        if match:
+            months.append((date(int(match[1]), int(match[2]), 1), path))
+    return sorted(months)
+
+
+def _parse_archived(row: Dict[str, str]) -> Dict[str, object]:
+    record: Dict[str, object] = {name: (value if value != "" else None) for name, value in row.items()}
+    record["created_at"] = datetime.fromisoformat(row["created_at"])
+    record["amount"] = float(row["amount"])
+    record["is_anonymous"] = row["is_anonymous"] in ("t", "true", "True")
+    if row["status"] in DonationStatus.__members__:  # enum columns store member names
+        record["status"] = DonationStatus[row["status"]]
+    return record
+
+
+def iter_archived(start: Optional[datetime] = None, end: Optional[datetime] = None) -> Iterator[Dict[str, object]]:
+    """Rows from archived months with ``start <= created_at < end``, oldest first"""
+    for month, path in archived_months():
+        if end is not None and month > end.date():
+            break
+        if start is not None and add_months(month, 1) <= start.date():
+            continue
+        with gzip.open(path, "rt", newline="") as archive:
+            for row in csv.DictReader(archive):
+                record = _parse_archived(row)
+                if start is not None and record["created_at"] < start:
+                    continue
+                if end is not None and record["created_at"] >= end:
+                    return
+                yield record
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("enable", help="convert donations to a partitioned table")
+    ensure = commands.add_parser("ensure", help="create partitions for upcoming months")
+    ensure.add_argument("--months-ahead", type=int, default=None)
+    commands.add_parser("list", help="list partitions, detached and archived months")
+    detach = commands.add_parser(
+        "detach", help="detach one month as a standalone table (exports still include it)"
+    )
+    detach.add_argument("month", type=parse_month, help="YYYY-MM")
+    archive = commands.add_parser("archive", help="archive months before a cutoff")
+    archive.add_argument("--before", type=parse_month, required=True, help="YYYY-MM (exclusive)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    from api.db.database import engine
+
+    if engine.dialect.name != "postgresql":
+        parser.error("partitioning needs PostgreSQL (DB_TYPE=postgresql)")
+    if args.command == "enable":
+        print(f"Moved {enable_partitioning(engine)} donations into the partitioned table")
+    elif args.command == "ensure":
+        ensure_future_partitions(engine, args.months_ahead)
+    elif args.command == "list":
+        with engine.connect() as connection:
+            for month, name in list_partitions(connection):
+                print(f"{month:%Y-%m}  partition  {name}")
+            for month, name in detached_partitions(connection):
+                print(f"{month:%Y-%m}  detached   {name}")
+            if connection.execute(text("SELECT to_regclass(:name)"), {"name": DEFAULT_PARTITION}).scalar():
+                stray = connection.execute(text(f'SELECT count(*) FROM "{DEFAULT_PARTITION}"')).scalar()
+                print(f"default  partition  {DEFAULT_PARTITION} ({stray} rows)")
+        for month, path in archived_months():
+            print(f"{month:%Y-%m}  archived   {path}")
+    elif args.command == "detach":
+        print(f"Detached {detach_partition(engine, args.month)}")
+    elif args.command == "archive":
+        for path in archive_partitions(engine, args.before):
+            print(f"Archived {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
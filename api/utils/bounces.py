@@ -0,0 +1,184 @@
+""" Parsing bounce and complaint reports into events
+
+Two kinds of input are understood:
+
+  * DSN files: RFC 3464 delivery status notifications
+    (multipart/report; report-type=delivery-status) and RFC 5965 abuse
+    reports (report-type=feedback-report), one message or an mbox of them;
+  * JSON webhooks: a generic shape, plus the shapes Amazon SES (directly
+    or wrapped in an SNS notification) and SendGrid post.
+
+The generic JSON shape is an event, a list of events or
+{"events": [...]}, where an event is
+
+    {"type": "bounce" | "complaint", "email": "...",
+     "status": "5.1.1", "permanent": true, "diagnostic": "..."}
+
+A bounce is permanent when "permanent" says so, else when its status is
+5.x.x, else by default. Only permanent bounces and complaints suppress an
+address; transient bounces are reported and otherwise ignored, because
+the sender retries those itself.
+"""
+import email
+import email.utils
+import json
+import re
+from email.message import Message
+from typing import Iterator, List, NamedTuple, Optional
+
+
+class BounceEvent(NamedTuple):
+    email: str
+    kind: str  # "bounce" or "complaint"
+    permanent: bool
+    detail: str = ""
+
+    @property
+    def suppresses(self) -> bool:
+        return self.kind == "complaint" or self.permanent
+
+
+_MBOX_SEPARATOR = re.compile(rb"^From .*\r?\n", re.MULTILINE)
+
+
+def _address(field: Optional[str]) -> Optional[str]:
+    """The address in "rfc822; someone@example.org" or "<someone@example.org>" """
+    if not field:
+        return None
+    value = field.split(";", 1)[-1].strip().strip("<>").strip()
+    return value if "@" in value else None
+
+
+def _header_blocks(part: Message) -> List[Message]:
+    payload = part.get_payload()
+    return payload if isinstance(payload, list) else []
+
+
+def _delivery_status_events(part: Message) -> Iterator[BounceEvent]:
+    # The first block holds per-message fields, then one block per recipient
+    for block in _header_blocks(part)[1:]:
+        recipient = _address(block.get("Final-Recipient")) or _address(block.get("Original-Recipient"))
+        if recipient is None:
+            continue
+        action = (block.get("Action") or "").strip().lower()
+        status = (block.get("Status") or "").strip()
+        if action not in ("failed", "delayed"):
+            continue  # delivered, relayed, expanded
+        permanent = action == "failed" and not status.startswith("4")
+        diagnostic = " ".join((block.get("Diagnostic-Code") or "").split())
+        yield BounceEvent(recipient, "bounce", permanent, f"{status} {diagnostic}".strip()[:255])
+
+
+def _feedback_events(message: Message, part: Message) -> Iterator[BounceEvent]:
+    blocks = _header_blocks(part)
+    fields = blocks[0] if blocks else Message()
+    feedback_type = (fields.get("Feedback-Type") or "abuse").strip().lower()
+    recipients = [_address(value) for value in fields.get_all("Original-Rcpt-To", []) + fields.get_all("Removal-Recipient", [])]
+    recipients = [recipient for recipient in recipients if recipient]
+    if not recipients:
+        # Otherwise the complained-about message (or its headers) names the recipient
+        for original in message.walk():
+            if original.get_content_type() == "message/rfc822":
+                inner = original.get_payload()
+                headers = inner[0] if isinstance(inner, list) and inner else None
+            elif original.get_content_type() == "text/rfc822-headers":
+                headers = email.message_from_string(original.get_payload(decode=True).decode("utf-8", "replace"))
+            else:
+                continue
+            recipient = _address(email.utils.parseaddr(headers.get("To", ""))[1]) if headers else None
+            if recipient:
+                recipients.append(recipient)
+                break
+    for recipient in recipients:
+        yield BounceEvent(recipient, "complaint", True, feedback_type[:255])
+
+
+def parse_dsn_message(raw: bytes) -> List[BounceEvent]:
+    message = email.message_from_bytes(raw)
+    events: List[BounceEvent] = []
+    for part in message.walk():
+        content_type = part.get_content_type()
+        if content_type in ("message/delivery-status", "message/global-delivery-status"):
+            events.extend(_delivery_status_events(part))
+        elif content_type == "message/feedback-report":
+            events.extend(_feedback_events(message, part))
+    return events
+
+
+def parse_dsn(raw: bytes) -> List[BounceEvent]:
+    """Events from one DSN/ARF message or an mbox of them"""
+    if not raw.startswith(b"From "):
+        return parse_dsn_message(raw)
+    events: List[BounceEvent] = []
+    for chunk in _MBOX_SEPARATOR.split(raw):
+        if chunk.strip():
+            events.extend(parse_dsn_message(chunk))
+    return events
+
+
+def _generic_event(record: dict) -> Optional[BounceEvent]:
+    address = record.get("email") or record.get("recipient")
+    kind = (record.get("type") or "bounce").lower()
+    if not isinstance(address, str) or kind not in ("bounce", "complaint"):
+        return None
+    status = str(record.get("status") or "")
+    permanent = record.get("permanent")
+    if permanent is None:
+        permanent = not status.startswith("4")
+    detail = f"{status} {record.get('diagnostic') or ''}".strip()
+    return BounceEvent(address.strip(), kind, bool(permanent), detail[:255])
+
+
+def _ses_events(notification: dict) -> Iterator[BounceEvent]:
+    kind = (notification.get("notificationType") or notification.get("eventType") or "").lower()
+    if kind == "bounce":
+        bounce = notification.get("bounce") or {}
+        permanent = bounce.get("bounceType") == "Permanent"
+        for recipient in bounce.get("bouncedRecipients") or []:
+            detail = f"{recipient.get('status') or ''} {recipient.get('diagnosticCode') or ''}".strip()
+            yield BounceEvent(recipient["emailAddress"], "bounce", permanent, detail[:255])
+    elif kind == "complaint":
+        complaint = notification.get("complaint") or {}
+        for recipient in complaint.get("complainedRecipients") or []:
+            yield BounceEvent(recipient["emailAddress"], "complaint", True,
+                              (complaint.get("complaintFeedbackType") or "abuse")[:255])
+
+
+def _sendgrid_event(record: dict) -> Optional[BounceEvent]:
+    event = record.get("event")
+    if event == "bounce":
+        # SendGrid reports temporary blocks as bounces of type "blocked"
+        permanent = record.get("type", "bounce") == "bounce"
+        detail = f"{record.get('status') or ''} {record.get('reason') or ''}".strip()
+        return BounceEvent(record["email"], "bounce", permanent, detail[:255])
+    if event == "spamreport":
+        return BounceEvent(record["email"], "complaint", True, "spamreport")
+    return None
+
+
+def _events_from(payload) -> Iterator[BounceEvent]:
+    if isinstance(payload, list):
+        for record in payload:
+            yield from _events_from(record)
+        return
+    if not isinstance(payload, dict):
+        return
+    if payload.get("Type") == "Notification" and isinstance(payload.get("Message"), str):
+        yield from _events_from(json.loads(payload["Message"]))  # SNS envelope
+    elif "events" in payload:
+        yield from _events_from(payload["events"])
+    elif "notificationType" in payload or "eventType" in payload:
+        yield from _ses_events(payload)
+    elif "event" in payload:
+        event = _sendgrid_event(payload)
+        if event:
+            yield event
+    else:
+        event = _generic_event(payload)
+        if event:
+            yield event
+
+
+def parse_json(raw: bytes) -> List[BounceEvent]:
+    """Events from a webhook body; raises ValueError on malformed JSON"""
+    return list(_events_from(json.loads(raw)))
@@ -0,0 +1,114 @@
+""" Per-table change counters and ETag helpers for conditional GETs
+
+Every committed ORM session that inserted, updated or deleted rows bumps a
+version counter for each table it touched. List and stats endpoints derive a
+weak ETag from the counters of the tables they read, so a matching
+If-None-Match can be answered with 304 before any query or serialization.
+
+The counters live in shared memory created at import time, so all workers
+forked from serve.py see each other's writes. Writes made outside this
+application's sessions (psql, other services) are not seen; set
+CONDITIONAL_GET_ENABLED=false when that matters, or when running several
+independent server processes.
+"""
+import hashlib
+import os
+from typing import Optional
+
+from fastapi import Request, Response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from api.utils.settings import settings
+from api.utils.shared_memory import SharedArray
+
+
+TRACKED_TABLES = (
+    "admins",
+    "donations",
+    "subscribers",
+    "newsletters",
+    "email_templates",
+    "volunteers",
+    "donors",
+)
+_SLOTS = {name: index for index, name in enumerate(TRACKED_TABLES)}
+_versions = SharedArray("Q", len(TRACKED_TABLES))
+
+# Changes with every restart so that ETags issued by a previous process
+# (whose counters started from zero too) never match
+EPOCH = os.urandom(8).hex()
+
+
+def bump(table: str) -> None:
+    slot = _SLOTS.get(table)
+    if slot is None:
+        return
+    with _versions.lock:
+        _versions[slot] += 1
+
+
+def table_version(table: str) -> int:
+    return _versions[_SLOTS[table]]
+
+
+def _pending(session: Session) -> set:
+    return session.info.setdefault("changed_tables", set())
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_flushed_tables(session, flush_context):
+    tables = _pending(session)
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        table = getattr(obj, "__tablename__", None)
+        if table:
+            tables.add(table)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_statement_tables(orm_execute_state):
+    # Bulk INSERT/UPDATE/DELETE statements bypass the unit of work
+    statement = orm_execute_state.statement
+    if statement.is_dml:
+        _pending(orm_execute_state.session).add(statement.table.name)
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_committed_tables(session):
+    for table in session.info.pop("changed_tables", ()):
+        bump(table)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back_tables(session):
+    session.info.pop("changed_tables", None)
+
+
+def make_etag(request: Request, *tables: str) -> str:
+    """Weak ETag for ``request`` given the current versions of ``tables``"""
+    versions = ",".join(str(table_version(table)) for table in tables)
+    raw = f"{EPOCH}|{request.url.path}?{request.url.query}|{versions}"
+    return f'W/"{hashlib.blake2b(raw.encode(), digest_size=12).hexdigest()}"'
+
+
+def check_not_modified(request: Request, response: Response, *tables: str) -> Optional[Response]:
+    """Return a 304 response if the client's copy is current, else tag ``response``
+
+    Call first thing in the endpoint:
+
+        not_modified = check_not_modified(request, response, "donations")
+        if not_modified:
+            return not_modified
+    """
+    if not settings.CONDITIONAL_GET_ENABLED:
+        return None
+    etag = make_etag(request, *tables)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        candidates = {tag.strip() for tag in if_none_match.split(",")}
+        # weak comparison: W/"x" matches "x"
+        if "*" in candidates or etag in candidates or etag[2:] in candidates:
+            return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,145 @@
+""" Negotiated response compression (brotli when installed, otherwise gzip)
+"""
+import zlib
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+
+COMPRESSIBLE_TYPES = (
+    b"application/json",
+    b"text/",
+    b"application/javascript",
+    b"application/xml",
+    b"application/x-ndjson",
+    b"image/svg+xml",
+)
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick ``br`` or ``gzip`` from an Accept-Encoding header, honouring q=0"""
+    offered = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        offered[coding.strip().lower()] = quality
+    if brotli is not None and offered.get("br", 0) > 0:
+        return "br"
+    if offered.get("gzip", offered.get("*", 0)) > 0:
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+            self._compress = self._compressor.process
+            self._sync_flush = self._compressor.flush
+            self._finish = self._compressor.finish
+        else:
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)  # 31: gzip container
+            self._compress = self._compressor.compress
+            self._sync_flush = lambda: self._compressor.flush(zlib.Z_SYNC_FLUSH)
+            self._finish = self._compressor.flush
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        """Compress a chunk; intermediate chunks are flushed so streams stay live"""
+        return self._compress(data) + (self._finish() if final else self._sync_flush())
+
+
+class CompressionMiddleware:
+    """Pure ASGI middleware compressing textual responses above a size threshold
+
+    Small bodies, already-encoded responses and non-text content types (the
+    receipt images under /media) pass through untouched.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = None
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                encoding = choose_encoding(value.decode("latin-1"))
+                break
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                headers = message.get("headers", [])
+                content_type = b""
+                already_encoded = False
+                for name, value in headers:
+                    if name == b"content-type":
+                        content_type = value
+                    elif name == b"content-encoding":
+                        already_encoded = True
+                passthrough = (
+                    already_encoded
+                    or message["status"] < 200
+                    or message["status"] in (204, 304)
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                )
+                if passthrough:
+                    await send(message)
+                else:
+                    start_message = message  # held until we see the body size
+                return
+
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is None:
+                if not more_body and len(body) < self.minimum_size:
+                    await send(start_message)
+                    await send(message)
+                    passthrough = True
+                    return
+                compressor = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+                headers = [
+                    (name, value) for name, value in start_message.get("headers", [])
+                    if name not in (b"content-length", b"vary")
+                ]
+                vary = [value for name, value in start_message.get("headers", []) if name == b"vary"]
+                headers.append((b"content-encoding", encoding.encode()))
+                headers.append((b"vary", b", ".join(vary + [b"Accept-Encoding"])))
+                compressed = compressor.compress(body, final=not more_body)
+                if not more_body:
+                    headers.append((b"content-length", str(len(compressed)).encode()))
+                await send({**start_message, "headers": headers})
+                await send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+                return
+
+            compressed = compressor.compress(body, final=not more_body)
+            await send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
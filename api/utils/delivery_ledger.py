@@ -0,0 +1,154 @@
+""" Per-recipient delivery ledger for newsletter sends
+
+One newsletter_deliveries row per (newsletter, subscriber) records the
+state of that recipient: queued, sent, deferred (4xx, retried on the next
+run) or bounced (5xx).
+
+Recipients are added a keyset page at a time. The same transaction moves
+Newsletter.checkpoint_subscriber_id past the page and adds the page to the
+newsletter's queued_count. Results are written as group commits: while
+one flush is running, results from other connections collect and go out
+in the next one. Each flush updates the rows by primary key and the
+newsletter's counters in one transaction.
+
+A send that dies resumes where it stopped. Rows still QUEUED or DEFERRED
+are retried first, then the walk over subscribers continues after the
+checkpoint. Only messages whose result was not yet written can go out
+twice. That is at most what was in flight, pool size times pipeline
+depth. Progress is read from the counters and never counts the ledger.
+"""
+import asyncio
+from collections import Counter
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import func, insert, select, update
+
+from api.utils.settings import settings
+from api.v1.models.models import DeliveryStatus, Newsletter, NewsletterDelivery, Subscriber
+
+
+COUNTER_COLUMNS = {
+    DeliveryStatus.QUEUED: "queued_count",
+    DeliveryStatus.SENT: "sent_count",
+    DeliveryStatus.DEFERRED: "deferred_count",
+    DeliveryStatus.BOUNCED: "bounced_count",
+}
+RETRYABLE = (DeliveryStatus.QUEUED, DeliveryStatus.DEFERRED)
+
+
+def result_status(result) -> DeliveryStatus:
+    if result.delivered:
+        return DeliveryStatus.SENT
+    return DeliveryStatus.DEFERRED if result.reply.transient else DeliveryStatus.BOUNCED
+
+
+class DeliveryLedger:
+    def __init__(self, session_factory, newsletter_id: UUID, max_attempts: Optional[int] = None):
+        self.session_factory = session_factory
+        self.newsletter_id = newsletter_id
+        self.max_attempts = max_attempts or settings.NEWSLETTER_MAX_ATTEMPTS
+        # (status, attempts) of recipients handed out and not yet recorded
+        self._in_flight: Dict[UUID, Tuple[DeliveryStatus, int]] = {}
+        self._pending: List = []
+        self._flush_lock = asyncio.Lock()
+
+    def _retryable(self, query):
+        return query.join(Subscriber, Subscriber.id == NewsletterDelivery.subscriber_id).where(
+            NewsletterDelivery.newsletter_id == self.newsletter_id,
+            NewsletterDelivery.status.in_(RETRYABLE),
+            NewsletterDelivery.attempts < self.max_attempts,
+            Subscriber.is_active == True,
+        )
+
+    async def unfinished(self, read_session_factory, batch_size: int) -> AsyncIterator[List[Tuple[UUID, str]]]:
+        """Recipients left queued or deferred by earlier runs, in pages"""
+        after = None
+        while True:
+            query = self._retryable(
+                select(NewsletterDelivery.subscriber_id, NewsletterDelivery.email,
+                       NewsletterDelivery.status, NewsletterDelivery.attempts)
+            )
+            if after is not None:
+                query = query.where(NewsletterDelivery.subscriber_id > after)
+            async with read_session_factory() as session:
+                rows = (await session.execute(query.order_by(NewsletterDelivery.subscriber_id).limit(batch_size))).all()
+            if not rows:
+                return
+            for subscriber_id, _, status, attempts in rows:
+                self._in_flight[subscriber_id] = (status, attempts)
+            yield [(subscriber_id, email) for subscriber_id, email, _, _ in rows]
+            after = rows[-1][0]
+
+    async def enqueue(self, rows: List[Tuple[UUID, str]]) -> None:
+        """Add a page of new recipients and move the checkpoint past it"""
+        now = datetime.utcnow()
+        async with self.session_factory() as session:
+            await session.execute(insert(NewsletterDelivery), [
+                {"newsletter_id": self.newsletter_id, "subscriber_id": subscriber_id, "email": email,
+                 "status": DeliveryStatus.QUEUED, "attempts": 0, "updated_at": now}
+                for subscriber_id, email in rows
+            ])
+            await session.execute(
+                update(Newsletter)
+                .where(Newsletter.id == self.newsletter_id)
+                .values(queued_count=Newsletter.queued_count + len(rows), checkpoint_subscriber_id=rows[-1][0])
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+        for subscriber_id, _ in rows:
+            self._in_flight[subscriber_id] = (DeliveryStatus.QUEUED, 0)
+
+    async def record(self, results: List) -> None:
+        """Queue results for writing; flushes now unless a flush is already running"""
+        self._pending.extend(results)
+        if self._flush_lock.locked():
+            return  # the running flush loops until nothing is pending
+        await self.flush()
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            while self._pending:
+                batch, self._pending = self._pending, []
+                await self._write(batch)
+
+    async def _write(self, batch: List) -> None:
+        now = datetime.utcnow()
+        deltas: Counter = Counter()
+        params = []
+        for result in batch:
+            subscriber_id = result.envelope.key
+            previous, attempts = self._in_flight.pop(subscriber_id)
+            status = result_status(result)
+            deltas[previous] -= 1
+            deltas[status] += 1
+            params.append({
+                "newsletter_id": self.newsletter_id,
+                "subscriber_id": subscriber_id,
+                "status": status,
+                "attempts": attempts + 1,
+                "last_reply": f"{result.reply.code} {result.reply.text}"[:255],
+                "updated_at": now,
+            })
+        counters = {
+            column: getattr(Newsletter, column) + deltas[status]
+            for status, column in COUNTER_COLUMNS.items()
+            if deltas[status]
+        }
+        async with self.session_factory() as session:
+            # Bulk UPDATE by primary key, executed as one executemany
+            await session.execute(update(NewsletterDelivery), params)
+            if counters:
+                await session.execute(
+                    update(Newsletter)
+                    .where(Newsletter.id == self.newsletter_id)
+                    .values(**counters)
+                    .execution_options(synchronize_session=False)
+                )
+            await session.commit()
+
+    async def remaining(self) -> int:
+        """Recipients that a later run would still retry"""
+        async with self.session_factory() as session:
+            return await session.scalar(self._retryable(select(func.count()).select_from(NewsletterDelivery)))
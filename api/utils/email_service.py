@@ -0,0 +1,613 @@
+""" Newsletter delivery over pooled, pipelined SMTP connections
+
+SMTPConnection is a small asyncio ESMTP client (STARTTLS or implicit TLS,
+AUTH PLAIN/LOGIN). When the server advertises PIPELINING (RFC 2920) it sends
+a batch of messages with one round trip per message: the body of one message
+goes out in the same write as the MAIL FROM / RCPT TO / DATA of the next.
+
+SMTPPool keeps up to SMTP_POOL_SIZE authenticated connections open and
+reuses them across batches, retiring each after
+SMTP_MAX_MESSAGES_PER_CONNECTION messages, since many servers cap that.
+
+NewsletterSender streams active subscribers in keyset-paginated batches,
+so recipients are never all loaded at once and no long-lived cursor stays
+open. It deals them out in pipelined chunks to one task per pooled
+connection, so concurrency is bounded by the pool size.
+
+Recipients are paced per domain by api/utils/send_throttle.py; 4xx
+deferrals slow that domain down and are retried within the run, up to
+NEWSLETTER_INLINE_RETRIES times.
+
+Each newsletter is rendered once into its template (api/utils/email_templates.py)
+and MessageBuilder then only fills in the recipient's fields and headers.
+
+For local runs and benchmarks point SMTP_HOST/SMTP_PORT at the stand-in in
+benchmarks/smtp_sink.py with SMTP_SECURITY=none.
+"""
+import asyncio
+import base64
+import logging
+import ssl
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from email.header import Header
+from email.utils import formatdate
+from typing import AsyncIterator, Callable, Dict, List, NamedTuple, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import select
+
+from api.utils.email_templates import (
+    PreparedTemplate, compile_template, default_layout, newsletter_context, recipient_context,
+)
+from api.utils.send_throttle import DOMAIN_DEFERRAL_CODES, DomainDispatcher, DomainThrottle, domain_of
+from api.utils.settings import settings
+from api.utils.uuid7 import uuid7
+
+
+logger = logging.getLogger("api.email")
+
+
+class SMTPReply(NamedTuple):
+    code: int
+    text: str
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.code < 400
+
+    @property
+    def transient(self) -> bool:
+        return 400 <= self.code < 500
+
+
+# Recorded for recipients on the suppression list, who are never sent to
+SUPPRESSED_REPLY = SMTPReply(550, "5.7.1 Recipient suppressed after a bounce or complaint")
+
+
+class SMTPError(Exception):
+    def __init__(self, reply: SMTPReply):
+        super().__init__(f"{reply.code} {reply.text}")
+        self.reply = reply
+
+
+class Envelope(NamedTuple):
+    recipient: str
+    data: bytes  # complete RFC 5322 message with CRLF line endings
+    key: object = None  # caller's reference, e.g. the subscriber id
+
+
+class DeliveryResult(NamedTuple):
+    envelope: Envelope
+    reply: SMTPReply
+
+    @property
+    def delivered(self) -> bool:
+        return self.reply.ok
+
+
+def dot_stuff(data: bytes) -> bytes:
+    """Escape leading dots (RFC 5321 4.5.2) and terminate the DATA section"""
+    if data.startswith(b"."):
+        data = b"." + data
+    data = data.replace(b"\r\n.", b"\r\n..")
+    if not data.endswith(b"\r\n"):
+        data += b"\r\n"
+    return data + b".\r\n"
+
+
+class SMTPConnection:
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        security: str = "starttls",
+        username: str = "",
+        password: str = "",
+        timeout: float = 30.0,
+        sender: str = "",
+    ):
+        self.host = host
+        self.port = port
+        self.security = security
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.sender = sender
+        self.extensions: Dict[str, str] = {}
+        self.messages_sent = 0
+        self.usable = False
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    @property
+    def pipelining(self) -> bool:
+        return "pipelining" in self.extensions
+
+    async def connect(self) -> None:
+        context = ssl.create_default_context() if self.security in ("tls", "starttls") else None
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                self.host, self.port,
+                ssl=context if self.security == "tls" else None,
+            ),
+            self.timeout,
+        )
+        await self._expect(await self._read_reply(), 220)
+        await self._ehlo()
+        if self.security == "starttls":
+            await self._expect(await self._command(b"STARTTLS"), 220)
+            await self._writer.start_tls(context, server_hostname=self.host)
+            await self._ehlo()
+        if self.username and "auth" in self.extensions:
+            await self._login()
+        self.usable = True
+
+    async def _ehlo(self) -> None:
+        reply = await self._command(b"EHLO " + settings.APP_NAME.encode("ascii", "ignore").replace(b" ", b"-"))
+        await self._expect(reply, 250)
+        self.extensions = {}
+        for line in reply.text.splitlines()[1:]:
+            keyword, _, params = line.partition(" ")
+            self.extensions[keyword.lower()] = params
+
+    async def _login(self) -> None:
+        mechanisms = self.extensions["auth"].upper().split()
+        if "PLAIN" in mechanisms:
+            token = base64.b64encode(f"\0{self.username}\0{self.password}".encode()).decode()
+            await self._expect(await self._command(f"AUTH PLAIN {token}".encode()), 235)
+            return
+        await self._expect(await self._command(b"AUTH LOGIN"), 334)
+        await self._expect(await self._command(base64.b64encode(self.username.encode())), 334)
+        await self._expect(await self._command(base64.b64encode(self.password.encode())), 235)
+
+    async def _read_reply(self) -> SMTPReply:
+        lines = []
+        while True:
+            line = await asyncio.wait_for(self._reader.readline(), self.timeout)
+            if not line:
+                self.usable = False
+                raise ConnectionError("SMTP server closed the connection")
+            lines.append(line[4:].decode("utf-8", "replace").rstrip("\r\n"))
+            if line[3:4] != b"-":
+                return SMTPReply(int(line[:3]), "\n".join(lines))
+
+    async def _command(self, command: bytes) -> SMTPReply:
+        self._writer.write(command + b"\r\n")
+        await self._writer.drain()
+        return await self._read_reply()
+
+    async def _expect(self, reply: SMTPReply, code: int) -> None:
+        if reply.code != code:
+            self.usable = False
+            raise SMTPError(reply)
+
+    def _envelope_commands(self, envelope: Envelope) -> bytes:
+        return (
+            f"MAIL FROM:<{self.sender}>\r\n"
+            f"RCPT TO:<{envelope.recipient}>\r\n"
+            "DATA\r\n"
+        ).encode()
+
+    async def send_many(self, envelopes: List[Envelope]) -> List[DeliveryResult]:
+        """Send a batch, pipelined when the server allows it
+
+        Per-message failures (rejected recipients, 4xx deferrals) are returned
+        as results; connection-level failures raise and leave the connection
+        unusable.
+        """
+        if not self.pipelining:
+            return [await self._send_one(envelope) for envelope in envelopes]
+
+        results = []
+        pending: Optional[Envelope] = None  # accepted DATA, body not yet sent
+        reset = False  # a failed transaction must be reset before the next
+        for envelope in envelopes:
+            chunk = b""
+            if pending is not None:
+                chunk += dot_stuff(pending.data)
+            if reset:
+                chunk += b"RSET\r\n"
+            self._writer.write(chunk + self._envelope_commands(envelope))
+            await self._writer.drain()
+            if pending is not None:
+                results.append(DeliveryResult(pending, await self._read_reply()))
+                pending = None
+            if reset:
+                await self._read_reply()
+                reset = False
+            mail, rcpt, data = await self._read_reply(), await self._read_reply(), await self._read_reply()
+            if data.code == 354:
+                pending = envelope
+            else:
+                results.append(DeliveryResult(envelope, mail if not mail.ok else rcpt if not rcpt.ok else data))
+                reset = mail.ok
+        if pending is not None:
+            self._writer.write(dot_stuff(pending.data))
+            await self._writer.drain()
+            results.append(DeliveryResult(pending, await self._read_reply()))
+        if reset:
+            await self._command(b"RSET")
+        self.messages_sent += len(envelopes)
+        return results
+
+    async def _send_one(self, envelope: Envelope) -> DeliveryResult:
+        mail = await self._command(f"MAIL FROM:<{self.sender}>".encode())
+        if not mail.ok:
+            return DeliveryResult(envelope, mail)
+        rcpt = await self._command(f"RCPT TO:<{envelope.recipient}>".encode())
+        if not rcpt.ok:
+            await self._command(b"RSET")
+            return DeliveryResult(envelope, rcpt)
+        data = await self._command(b"DATA")
+        if data.code != 354:
+            await self._command(b"RSET")
+            return DeliveryResult(envelope, data)
+        self._writer.write(dot_stuff(envelope.data))
+        await self._writer.drain()
+        self.messages_sent += 1
+        return DeliveryResult(envelope, await self._read_reply())
+
+    async def close(self) -> None:
+        if self._writer is None:
+            return
+        try:
+            if self.usable:
+                await self._command(b"QUIT")
+        except (OSError, asyncio.TimeoutError, ConnectionError):
+            pass
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except (OSError, ssl.SSLError):
+            pass
+        self._writer = None
+        self.usable = False
+
+
+def connection_from_settings() -> SMTPConnection:
+    return SMTPConnection(
+        settings.SMTP_HOST,
+        settings.SMTP_PORT,
+        security=settings.SMTP_SECURITY,
+        username=settings.SMTP_USER,
+        password=settings.SMTP_PASSWORD,
+        timeout=settings.SMTP_TIMEOUT,
+        sender=settings.FROM_EMAIL,
+    )
+
+
+class SMTPPool:
+    """Up to ``size`` reusable, authenticated connections
+
+    Create it inside the event loop that uses it and close it when done.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        factory: Callable[[], SMTPConnection] = connection_from_settings,
+        max_messages: int = 500,
+    ):
+        self.factory = factory
+        self.max_messages = max_messages
+        self._slots = asyncio.Semaphore(size)
+        self._idle: List[SMTPConnection] = []
+
+    @asynccontextmanager
+    async def connection(self, fresh: bool = False) -> AsyncIterator[SMTPConnection]:
+        """A pooled connection; ``fresh`` opens a new one instead of reusing an idle one"""
+        await self._slots.acquire()
+        connection = self._idle.pop() if self._idle and not fresh else None
+        try:
+            if connection is None:
+                connection = self.factory()
+                await connection.connect()
+            try:
+                yield connection
+            except BaseException:
+                # A timeout or error mid-exchange leaves replies unread, so
+                # the next command would read the wrong one
+                connection.usable = False
+                raise
+        finally:
+            if connection is not None:
+                if connection.usable and connection.messages_sent < self.max_messages:
+                    self._idle.append(connection)
+                else:
+                    await connection.close()
+            self._slots.release()
+
+    async def close(self) -> None:
+        idle, self._idle = self._idle, []
+        await asyncio.gather(*(connection.close() for connection in idle))
+
+
+def encode_header(value: str) -> str:
+    value = " ".join(value.splitlines())  # no header injection through subjects
+    if value.isascii() and len(value) <= 76:
+        return value
+    return Header(value, "utf-8").encode(linesep="\r\n")
+
+
+def _base64_body(text: str) -> bytes:
+    return base64.encodebytes(text.encode("utf-8")).replace(b"\n", b"\r\n")
+
+
+class MessageBuilder:
+    """RFC 5322 bytes for each recipient of a prepared template
+
+    Everything but To, Message-ID, List-Unsubscribe and the personalized
+    parts is encoded once. Bodies are base64, so personalization never
+    has to re-wrap lines.
+    """
+
+    def __init__(self, prepared: PreparedTemplate, sender: Optional[str] = None):
+        self.prepared = prepared
+        sender = sender or settings.FROM_EMAIL
+        self.domain = sender.rpartition("@")[2] or "localhost"
+        self.mailto = f"<mailto:{sender}?subject=unsubscribe>"
+        self.boundary = f"=_{uuid7().hex}"
+        self.head = (
+            f"From: {sender}\r\n"
+            f"Date: {formatdate(localtime=False)}\r\n"
+            "MIME-Version: 1.0\r\n"
+        ).encode()
+        self.multipart = f'Content-Type: multipart/alternative; boundary="{self.boundary}"\r\n\r\n'.encode()
+        self.text_head = (
+            f"--{self.boundary}\r\n"
+            'Content-Type: text/plain; charset="utf-8"\r\nContent-Transfer-Encoding: base64\r\n\r\n'
+        ).encode()
+        self.html_head = (
+            f"\r\n--{self.boundary}\r\n"
+            'Content-Type: text/html; charset="utf-8"\r\nContent-Transfer-Encoding: base64\r\n\r\n'
+        ).encode()
+        self.tail = f"\r\n--{self.boundary}--\r\n".encode()
+        self._subjects: Dict[str, bytes] = {}
+
+    def _subject(self, subject: str) -> bytes:
+        encoded = self._subjects.get(subject)
+        if encoded is None:
+            encoded = f"Subject: {encode_header(subject)}\r\n".encode()
+            if len(self._subjects) < 64:  # only campaign-wide subjects repeat
+                self._subjects[subject] = encoded
+        return encoded
+
+    def build(self, email: str) -> bytes:
+        recipient = recipient_context(email)
+        rendered = self.prepared.personalize(recipient)
+        headers = (
+            f"To: {email}\r\n"
+            f"Message-ID: <{uuid7().hex}@{self.domain}>\r\n"
+            f"List-Unsubscribe: <{recipient['unsubscribe_url']}>, {self.mailto}\r\n"
+        ).encode()
+        if rendered.html is None:
+            return b"".join((
+                headers, self._subject(rendered.subject), self.head,
+                b'Content-Type: text/plain; charset="utf-8"\r\nContent-Transfer-Encoding: base64\r\n\r\n',
+                _base64_body(rendered.text),
+            ))
+        return b"".join((
+            headers, self._subject(rendered.subject), self.head, self.multipart,
+            self.text_head, _base64_body(rendered.text),
+            self.html_head, _base64_body(rendered.html),
+            self.tail,
+        ))
+
+
+async def prepare_newsletter(session, newsletter) -> PreparedTemplate:
+    """Render a newsletter into the active "newsletter" EmailTemplate, or the default layout"""
+    from api.v1.models.models import EmailTemplate
+
+    template = await session.scalar(
+        select(EmailTemplate)
+        .where(EmailTemplate.template_type == "newsletter", EmailTemplate.is_active == True)
+        .order_by(EmailTemplate.updated_at.desc())
+        .limit(1)
+    )
+    compiled = compile_template(template) if template is not None else default_layout()
+    return compiled.prepare(newsletter_context(newsletter.subject, newsletter.content, newsletter.html_content))
+
+
+@dataclass
+class SendReport:
+    newsletter_id: UUID
+    attempted: int = 0
+    delivered: int = 0
+    deferred: int = 0
+    rejected: int = 0
+    suppressed: int = 0  # skipped, on the suppression list
+    retried: int = 0  # 4xx deferrals retried within the run
+    remaining: int = 0  # recipients a later run would retry
+    started: float = field(default_factory=time.perf_counter)
+    elapsed: float = 0.0
+
+    @property
+    def complete(self) -> bool:
+        return not self.remaining
+
+    @property
+    def per_minute(self) -> float:
+        return self.attempted / self.elapsed * 60 if self.elapsed else 0.0
+
+    def record(self, result: DeliveryResult) -> None:
+        self.attempted += 1
+        if result.delivered:
+            self.delivered += 1
+        elif result.reply.transient:
+            self.deferred += 1
+        else:
+            self.rejected += 1
+
+
+async def iter_active_subscribers(
+    session_factory, batch_size: int, after: Optional[UUID] = None,
+) -> AsyncIterator[List[Tuple[UUID, str]]]:
+    """Active subscribers in id order after ``after``, one keyset page at a time"""
+    from api.v1.models.models import Subscriber
+
+    while True:
+        query = select(Subscriber.id, Subscriber.email).where(Subscriber.is_active == True)
+        if after is not None:
+            query = query.where(Subscriber.id > after)
+        async with session_factory() as session:
+            rows = (await session.execute(query.order_by(Subscriber.id).limit(batch_size))).all()
+        if not rows:
+            return
+        yield rows
+        after = rows[-1][0]
+
+
+class NewsletterSender:
+    def __init__(
+        self,
+        session_factory=None,
+        read_session_factory=None,
+        pool_size: Optional[int] = None,
+        pipeline_depth: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        connection_factory: Callable[[], SMTPConnection] = connection_from_settings,
+        throttle: Optional[DomainThrottle] = None,
+    ):
+        if session_factory is None:
+            from api.db.database import AsyncSessionLocal, AsyncReadSessionLocal
+            session_factory = AsyncSessionLocal
+            read_session_factory = read_session_factory or AsyncReadSessionLocal
+        self.session_factory = session_factory
+        self.read_session_factory = read_session_factory or session_factory
+        self.pool_size = pool_size or settings.SMTP_POOL_SIZE
+        self.pipeline_depth = pipeline_depth or settings.SMTP_PIPELINE_DEPTH
+        self.batch_size = batch_size or settings.NEWSLETTER_BATCH_SIZE
+        self.inline_retries = settings.NEWSLETTER_INLINE_RETRIES
+        self.connection_factory = connection_factory
+        self.throttle = throttle
+
+    async def send(self, newsletter_id: UUID) -> SendReport:
+        """Send to every active subscriber not yet in the ledger, resuming an earlier run"""
+        from api.utils.delivery_ledger import DeliveryLedger
+        from api.utils.suppression import suppression_list
+        from api.v1.models.models import Newsletter, NewsletterStatus
+
+        async with self.session_factory() as session:
+            newsletter = await session.get(Newsletter, newsletter_id)
+            if newsletter is None:
+                raise LookupError(f"Newsletter {newsletter_id} not found")
+            builder = MessageBuilder(await prepare_newsletter(session, newsletter))
+            checkpoint = newsletter.checkpoint_subscriber_id
+
+        report = SendReport(newsletter_id)
+        ledger = DeliveryLedger(self.session_factory, newsletter_id)
+        await suppression_list.refresh(self.read_session_factory, force=True)
+        throttle = self.throttle
+        if throttle is None:
+            throttle = DomainThrottle() if settings.SEND_THROTTLE_ENABLED else DomainThrottle.unlimited()
+        dispatcher = DomainDispatcher(throttle, self.pipeline_depth, self.batch_size)
+        retries: Dict[UUID, int] = {}
+        chunks: asyncio.Queue = asyncio.Queue(maxsize=self.pool_size * 2)
+        pool = SMTPPool(self.pool_size, self.connection_factory, settings.SMTP_MAX_MESSAGES_PER_CONNECTION)
+
+        async def put(rows):
+            await suppression_list.refresh(self.read_session_factory)
+            suppressed = []
+            for subscriber_id, email in rows:
+                if email in suppression_list:
+                    # Bounced or complained since they were listed; recorded, never sent
+                    suppressed.append(DeliveryResult(Envelope(email, b"", subscriber_id), SUPPRESSED_REPLY))
+                    continue
+                await dispatcher.put(Envelope(email, builder.build(email), subscriber_id))
+            if suppressed:
+                report.suppressed += len(suppressed)
+                await ledger.record(suppressed)
+
+        async def produce():
+            try:
+                # Leftovers of earlier runs first, then everyone after the checkpoint
+                async for rows in ledger.unfinished(self.read_session_factory, self.batch_size):
+                    await put(rows)
+                async for rows in iter_active_subscribers(self.read_session_factory, self.batch_size, checkpoint):
+                    await ledger.enqueue(rows)
+                    await put(rows)
+            finally:
+                dispatcher.finish()
+
+        async def dispatch():
+            try:
+                async for chunk in dispatcher.chunks():
+                    await chunks.put(chunk)
+            finally:
+                for _ in range(self.pool_size):
+                    await chunks.put(None)
+
+        async def deliver():
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    return
+                final = []
+                for result in await self._send_chunk(pool, chunk):
+                    throttle.feedback(domain_of(result.envelope.recipient), result.reply.code)
+                    key = result.envelope.key
+                    if result.reply.code in DOMAIN_DEFERRAL_CODES and retries.get(key, 0) < self.inline_retries:
+                        # Paced by the domain's (now slower) bucket
+                        retries[key] = retries.get(key, 0) + 1
+                        report.retried += 1
+                        dispatcher.requeue(result.envelope)
+                        continue
+                    retries.pop(key, None)
+                    report.record(result)
+                    final.append(result)
+                dispatcher.done(len(final))
+                await ledger.record(final)
+
+        tasks = [asyncio.create_task(coroutine) for coroutine in
+                 (produce(), dispatch(), *(deliver() for _ in range(self.pool_size)))]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # A failed task (or a cancelled send) stops the others instead of
+            # leaving them blocked on the queues
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await pool.close()
+            # Write the results already in, so that a resumed send skips them
+            await ledger.flush()
+        report.remaining = await ledger.remaining()
+        report.elapsed = time.perf_counter() - report.started
+
+        if not report.complete:
+            # Left unsent; the next run retries the deferred recipients
+            logger.warning("Newsletter %s: %d recipients left to retry", newsletter_id, report.remaining)
+            return report
+        async with self.session_factory() as session:
+            newsletter = await session.get(Newsletter, newsletter_id)
+            newsletter.status = NewsletterStatus.SENT
+            newsletter.sent_at = datetime.utcnow()
+            await session.commit()
+        logger.info(
+            "Newsletter %s: %d delivered, %d deferred, %d rejected, %d suppressed in %.1fs (%.0f/min)",
+            newsletter_id, report.delivered, report.deferred, report.rejected, report.suppressed,
+            report.elapsed, report.per_minute,
+        )
+        return report
+
+    async def _send_chunk(self, pool: SMTPPool, chunk: List[Envelope]) -> List[DeliveryResult]:
+        """Send a chunk, retrying once on a fresh connection if the connection fails
+
+        A connection that dies mid-chunk leaves it unknown which messages the
+        server accepted, so the retry may duplicate a few of them; if the
+        retry fails too the chunk is reported as deferred.
+        """
+        for attempt in range(2):
+            try:
+                async with pool.connection(fresh=attempt > 0) as connection:
+                    return await connection.send_many(chunk)
+            except (OSError, ConnectionError, asyncio.TimeoutError, SMTPError) as error:
+                logger.warning("SMTP connection failed (%s), attempt %d", error, attempt + 1)
+                last_error = error
+        # 421 so that the domain throttle does not mistake it for a deferral
+        reply = SMTPReply(421, f"connection failed: {last_error}")
+        return [DeliveryResult(envelope, reply) for envelope in chunk]
+
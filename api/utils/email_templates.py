@@ -0,0 +1,284 @@
+""" Compiled, cached rendering of email templates with batch personalization
+
+Templates come from two places: EmailTemplate rows (subject, html_content
+and optional text_content are Jinja2 sources) and the layout in
+api/core/dependencies/email/templates/index.html, used for newsletters
+when no active "newsletter" EmailTemplate exists.
+
+Rendering happens in three steps:
+
+  * compile: Jinja2 sources are compiled once and cached by
+    (id, updated_at), so editing a template invalidates its entry;
+  * prepare: the template is rendered once per campaign with the shared
+    context (subject, content, ...). Recipient fields (RECIPIENT_FIELDS)
+    are rendered as markers, and the output is split into static
+    segments. A missing text part is derived from the rendered HTML at this
+    step, once;
+  * personalize: each recipient only costs joining those segments with
+    their values, escaped for HTML.
+
+Splitting needs recipient fields to appear only as plain ``{{ field }}``
+outputs. A template that branches on them or filters them is rendered in
+full for every recipient instead, which is correct but much slower.
+
+EmailTemplate rows are written by admins through the API, so they are
+compiled in Jinja2's sandbox: attribute access such as ``__class__`` or
+``__globals__`` raises SecurityError instead of reaching server objects.
+Only the layout files shipped with the code use the unsandboxed
+environments.
+"""
+import re
+import threading
+from collections import OrderedDict
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Dict, Iterable, List, Mapping, NamedTuple, Optional, Tuple
+
+from jinja2 import Environment, FileSystemLoader, Template, nodes, select_autoescape
+from jinja2.sandbox import SandboxedEnvironment
+from markupsafe import Markup, escape
+
+from api.utils.settings import settings
+
+
+TEMPLATE_DIR = Path(__file__).resolve().parent.parent / "core" / "dependencies" / "email" / "templates"
+DEFAULT_LAYOUT = "index.html"
+# Per-recipient variables; everything else in the context is per campaign
+RECIPIENT_FIELDS = ("email", "unsubscribe_url")
+# Private-use code points: untouched by escaping, case filters and whitespace handling
+_MARKER = "\ue000{}\ue001"
+_MARKER_PATTERN = re.compile("\ue000(\\d+)\ue001")
+
+html_environment = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    autoescape=select_autoescape(["html"], default_for_string=True),
+    auto_reload=False,
+)
+text_environment = Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=False, auto_reload=False)
+# For sources stored in the database
+sandboxed_html_environment = SandboxedEnvironment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    autoescape=select_autoescape(["html"], default_for_string=True),
+    auto_reload=False,
+)
+sandboxed_text_environment = SandboxedEnvironment(
+    loader=FileSystemLoader(TEMPLATE_DIR), autoescape=False, auto_reload=False
+)
+
+
+class Segments(NamedTuple):
+    """Static text interleaved with recipient fields: parts[0] field[0] parts[1] ..."""
+    parts: Tuple[str, ...]
+    fields: Tuple[str, ...]
+
+    @classmethod
+    def split(cls, rendered: str) -> "Segments":
+        pieces = _MARKER_PATTERN.split(rendered)
+        return cls(tuple(pieces[0::2]), tuple(RECIPIENT_FIELDS[int(index)] for index in pieces[1::2]))
+
+    def fill(self, values: Mapping[str, str], html_escape: bool = False) -> str:
+        if not self.fields:
+            return self.parts[0]
+        out = [self.parts[0]]
+        for field, part in zip(self.fields, self.parts[1:]):
+            value = values[field]
+            out.append(escape(value) if html_escape else value)
+            out.append(part)
+        return "".join(out)
+
+
+class RenderedEmail(NamedTuple):
+    subject: str
+    html: Optional[str]
+    text: str
+
+
+class _TextExtractor(HTMLParser):
+    BLOCKS = {"p", "div", "tr", "table", "h1", "h2", "h3", "h4", "h5", "h6", "ul", "ol", "blockquote"}
+    SKIP = {"style", "script", "head", "title"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out: List[str] = []
+        self.skipping = 0
+        self.links: List[Optional[str]] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self.skipping += 1
+        elif tag == "br":
+            self.out.append("\n")
+        elif tag == "li":
+            self.out.append("\n- ")
+        elif tag in self.BLOCKS:
+            self.out.append("\n\n")
+        elif tag == "a":
+            self.links.append(dict(attrs).get("href"))
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP:
+            self.skipping = max(0, self.skipping - 1)
+        elif tag in self.BLOCKS:
+            self.out.append("\n\n")
+        elif tag == "a" and self.links:
+            href = self.links.pop()
+            if href and not href.startswith("#"):
+                self.out.append(f" ({href})")
+
+    def handle_data(self, data):
+        if not self.skipping:
+            self.out.append(re.sub(r"\s+", " ", data))
+
+
+def html_to_text(source: str) -> str:
+    """Plain-text alternative for an HTML email: blocks become paragraphs, links keep their target"""
+    parser = _TextExtractor()
+    parser.feed(source)
+    parser.close()
+    lines = [line.strip() for line in "".join(parser.out).splitlines()]
+    text = re.sub(r"\n{3,}", "\n\n", "\n".join(lines))
+    return text.strip() + "\n"
+
+
+def text_to_html(text: str) -> Markup:
+    """HTML body for content written as plain text"""
+    paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+    return Markup("".join(f"<p>{escape(p)}</p>".replace("\n", "<br>\n") for p in paragraphs))
+
+
+def _plain_recipient_fields(ast: nodes.Template) -> bool:
+    """True if recipient fields are only used as plain ``{{ field }}`` outputs"""
+    plain = sum(
+        1
+        for output in ast.find_all(nodes.Output)
+        for node in output.nodes
+        if isinstance(node, nodes.Name) and node.name in RECIPIENT_FIELDS
+    )
+    used = sum(1 for node in ast.find_all(nodes.Name) if node.name in RECIPIENT_FIELDS)
+    return plain == used
+
+
+class CompiledTemplate:
+    def __init__(self, subject: Template, html_template: Template, text: Optional[Template], splittable: bool):
+        self.subject = subject
+        self.html = html_template
+        self.text = text
+        self.splittable = splittable
+
+    @classmethod
+    def from_sources(
+        cls, subject: str, html_source: str, text_source: Optional[str] = None, trusted: bool = False
+    ) -> "CompiledTemplate":
+        """Compile template sources; only files shipped with the code may pass trusted=True"""
+        html_env, text_env = (
+            (html_environment, text_environment) if trusted
+            else (sandboxed_html_environment, sandboxed_text_environment)
+        )
+        sources = [subject, html_source] + ([text_source] if text_source else [])
+        splittable = all(_plain_recipient_fields(html_env.parse(source)) for source in sources)
+        return cls(
+            text_env.from_string(subject),
+            html_env.from_string(html_source),
+            text_env.from_string(text_source) if text_source else None,
+            splittable,
+        )
+
+    def render(self, context: Mapping[str, object]) -> RenderedEmail:
+        html_body = self.html.render(context)
+        text = self.text.render(context) if self.text else html_to_text(html_body)
+        return RenderedEmail(self.subject.render(context).strip(), html_body, text)
+
+    def prepare(self, context: Mapping[str, object]) -> "PreparedTemplate":
+        return PreparedTemplate(self, dict(context))
+
+
+class PreparedTemplate:
+    """A template rendered for one campaign, ready to personalize per recipient"""
+
+    def __init__(self, compiled: CompiledTemplate, context: Dict[str, object]):
+        self.compiled = compiled
+        self.context = context
+        self.segments: Optional[Tuple[Segments, Segments, Segments]] = None
+        if compiled.splittable:
+            markers = {field: _MARKER.format(index) for index, field in enumerate(RECIPIENT_FIELDS)}
+            rendered = compiled.render({**context, **markers})
+            self.segments = (
+                Segments.split(rendered.subject),
+                Segments.split(rendered.html),
+                Segments.split(rendered.text),
+            )
+
+    def personalize(self, recipient: Mapping[str, str]) -> RenderedEmail:
+        if self.segments is None:
+            return self.compiled.render({**self.context, **recipient})
+        subject, html_body, text = self.segments
+        return RenderedEmail(subject.fill(recipient), html_body.fill(recipient, html_escape=True), text.fill(recipient))
+
+    def personalize_batch(self, recipients: Iterable[Mapping[str, str]]) -> List[RenderedEmail]:
+        return [self.personalize(recipient) for recipient in recipients]
+
+
+class _TemplateCache:
+    """LRU of compiled templates keyed by (id, updated_at)"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._entries: "OrderedDict[tuple, CompiledTemplate]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, build) -> CompiledTemplate:
+        with self._lock:
+            compiled = self._entries.get(key)
+            if compiled is not None:
+                self._entries.move_to_end(key)
+                return compiled
+        compiled = build()
+        with self._lock:
+            self._entries[key] = compiled
+            # Older versions of the same template are dead entries
+            for stale in [other for other in self._entries if other[0] == key[0] and other != key]:
+                del self._entries[stale]
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return compiled
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+template_cache = _TemplateCache(settings.EMAIL_TEMPLATE_CACHE_SIZE)
+
+
+def compile_template(template) -> CompiledTemplate:
+    """Compiled form of an EmailTemplate row, reused until the row is updated"""
+    return template_cache.get(
+        (template.id, template.updated_at),
+        lambda: CompiledTemplate.from_sources(template.subject, template.html_content, template.text_content),
+    )
+
+
+def default_layout() -> CompiledTemplate:
+    def build():
+        source = html_environment.loader.get_source(html_environment, DEFAULT_LAYOUT)[0]
+        return CompiledTemplate.from_sources("{{ subject }}", source, trusted=True)
+    return template_cache.get((DEFAULT_LAYOUT, None), build)
+
+
+def unsubscribe_url(email: str) -> str:
+    from urllib.parse import quote
+    return f"{settings.APP_URL.rstrip('/')}/unsubscribe?email={quote(email, safe='@')}"
+
+
+def recipient_context(email: str) -> Dict[str, str]:
+    return {"email": email, "unsubscribe_url": unsubscribe_url(email)}
+
+
+def newsletter_context(subject: str, content: str, html_content: Optional[str]) -> Dict[str, object]:
+    return {
+        "subject": subject,
+        "content": Markup(html_content) if html_content else text_to_html(content),
+        "text": content,
+        "app_name": settings.APP_NAME,
+        "app_url": settings.APP_URL,
+    }
@@ -0,0 +1,214 @@
+""" Row counters for subscribers, volunteers and donors
+
+Stats endpoints read total and active counts from entity_counters instead
+of counting the tables. The counters change in the same transaction as the
+rows they count:
+
+  * ORM writes (create, delete, setting is_active) are picked up by an
+    after_flush listener, which adds the flush's deltas;
+  * bulk statements that bypass the unit of work call adjust() with what
+    they changed (see upsert_subscribers).
+
+Each name has ENTITY_COUNTER_SHARDS rows. A write increments one of them
+at random, so concurrent writers rarely wait on the same row lock, and a
+read sums them. Writes made outside the application (psql, the seed
+scripts) are not counted. reconcile() recounts every table and rewrites
+its counters when they drifted, and bumps the table's change_tracker
+version so that cached stats responses are not answered with 304. It
+runs at startup and every ENTITY_COUNTER_RECONCILE_SECONDS, and on demand
+with
+
+    python -m api.utils.entity_counters
+
+(that runs in its own process, so a server's cached stats ETags last
+until its next write to the table).
+
+The recount scans every table, so only one worker does it each time. The
+workers claim a run through a marker row (RECONCILE_MARKER). The claim is
+one conditional upsert of its updated_at, which succeeds only when the
+last run is older than the interval. run_startup_tasks clears the marker
+before the workers start, so a (re)started deployment recounts once.
+"""
+import asyncio
+import logging
+import random
+import sys
+from collections import Counter
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, Tuple
+
+from sqlalchemy import delete, event, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, attributes
+
+from api.utils.change_tracker import bump
+from api.utils.settings import settings
+from api.v1.models.models import Donor, EntityCounter, Subscriber, Volunteer
+
+
+logger = logging.getLogger("api.db.counters")
+
+COUNTED = {model.__tablename__: model for model in (Subscriber, Volunteer, Donor)}
+# entity_counters row whose updated_at is the last reconcile; never summed
+RECONCILE_MARKER = "_reconciled"
+# How often workers try to claim the periodic recount
+RECONCILE_POLL_SECONDS = 60
+
+
+@lru_cache(maxsize=None)
+def _increment_statement(dialect: str):
+    table = EntityCounter.__table__
+    dialect_insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    statement = dialect_insert(table)
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.name, table.c.shard],
+        set_={
+            "total": table.c.total + statement.excluded.total,
+            "active": table.c.active + statement.excluded.active,
+            "updated_at": statement.excluded.updated_at,
+        },
+    )
+
+
+def _params(name: str, total: int, active: int) -> dict:
+    return {
+        "name": name,
+        "shard": random.randrange(settings.ENTITY_COUNTER_SHARDS),
+        "total": total,
+        "active": active,
+        "updated_at": datetime.utcnow(),
+    }
+
+
+async def adjust(session, name: str, total: int = 0, active: int = 0) -> None:
+    """Add to the counters of ``name`` in the session's transaction"""
+    if total or active:
+        await session.execute(_increment_statement(session.bind.dialect.name), _params(name, total, active))
+
+
+@event.listens_for(Session, "after_flush")
+def _count_flushed_rows(session, flush_context):
+    deltas: Counter = Counter()
+    for obj in session.new:
+        name = getattr(obj, "__tablename__", None)
+        if name in COUNTED:
+            deltas[name, "total"] += 1
+            deltas[name, "active"] += obj.is_active is not False  # None: the column default, True
+    for obj in session.deleted:
+        name = getattr(obj, "__tablename__", None)
+        if name in COUNTED:
+            history = attributes.get_history(obj, "is_active")
+            deltas[name, "total"] -= 1
+            deltas[name, "active"] -= bool(history.deleted[0] if history.deleted else obj.is_active)
+    for obj in session.dirty:
+        name = getattr(obj, "__tablename__", None)
+        if name not in COUNTED or obj in session.deleted:
+            continue
+        history = attributes.get_history(obj, "is_active")
+        # Without the previous value (never loaded) the change is left to reconcile()
+        if history.added and history.deleted:
+            deltas[name, "active"] += bool(history.added[0]) - bool(history.deleted[0])
+    if not deltas:
+        return
+
+    connection = session.connection()
+    statement = _increment_statement(connection.dialect.name)
+    for name in {name for name, _ in deltas}:
+        total, active = deltas[name, "total"], deltas[name, "active"]
+        if total or active:
+            connection.execute(statement, _params(name, total, active))
+
+
+async def read_counts(session, name: str) -> Tuple[int, int]:
+    """(total, active) from the counters"""
+    total, active = (await session.execute(
+        select(func.coalesce(func.sum(EntityCounter.total), 0), func.coalesce(func.sum(EntityCounter.active), 0))
+        .where(EntityCounter.name == name)
+    )).one()
+    return int(total), int(active)
+
+
+async def exact_counts(session, name: str) -> Tuple[int, int]:
+    """(total, active) counted from the table, in one scan"""
+    model = COUNTED[name]
+    total, active = (await session.execute(
+        select(func.count(), func.count().filter(model.is_active == True)).select_from(model)
+    )).one()
+    return total, active
+
+
+async def reconcile(session_factory) -> Dict[str, Tuple[int, int]]:
+    """Recount every table and rewrite drifted counters; returns the corrections"""
+    corrections = {}
+    for name in COUNTED:
+        async with session_factory() as session:
+            # Lock the counter rows first so that increments committed from
+            # here on wait for the rewrite (SQLite's writer already holds
+            # the database lock)
+            await session.execute(select(EntityCounter.shard).where(EntityCounter.name == name).with_for_update())
+            exact = await exact_counts(session, name)
+            counted = await read_counts(session, name)
+            if exact != counted:
+                await session.execute(delete(EntityCounter).where(EntityCounter.name == name))
+                await session.execute(insert(EntityCounter).values(
+                    name=name, shard=0, total=exact[0], active=exact[1], updated_at=datetime.utcnow(),
+                ))
+                corrections[name] = (exact[0] - counted[0], exact[1] - counted[1])
+            await session.commit()
+    for name, (total, active) in corrections.items():
+        # Stats ETags derive from the table's version, not from the counters
+        bump(name)
+        logger.warning("Corrected %s counters by %+d total, %+d active", name, total, active)
+    return corrections
+
+
+async def claim_reconcile(session_factory, interval: float) -> bool:
+    """True if this worker is to run the recount (the last one is older than ``interval``)"""
+    table = EntityCounter.__table__
+    now = datetime.utcnow()
+    async with session_factory() as session:
+        dialect_insert = postgresql.insert if session.bind.dialect.name == "postgresql" else sqlite.insert
+        statement = dialect_insert(table).values(name=RECONCILE_MARKER, shard=0, total=0, active=0, updated_at=now)
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.name, table.c.shard],
+            set_={"updated_at": statement.excluded.updated_at},
+            where=table.c.updated_at < now - timedelta(seconds=interval),
+        ).returning(table.c.name)
+        claimed = (await session.execute(statement)).first() is not None
+        await session.commit()
+    return claimed
+
+
+def clear_reconcile_marker(connection) -> None:
+    """Make the next claim succeed; run_startup_tasks calls it before the workers start"""
+    connection.execute(delete(EntityCounter).where(EntityCounter.name == RECONCILE_MARKER))
+
+
+async def run_reconciler(session_factory=None) -> None:
+    """Background task started by the app lifespan in every worker"""
+    if session_factory is None:
+        from api.db.database import AsyncSessionLocal
+        session_factory = AsyncSessionLocal
+    interval = settings.ENTITY_COUNTER_RECONCILE_SECONDS
+    while True:
+        try:
+            if await claim_reconcile(session_factory, interval):
+                await reconcile(session_factory)
+        except Exception:
+            logger.exception("Entity counter reconciliation failed")
+        await asyncio.sleep(min(interval, RECONCILE_POLL_SECONDS))
+
+
+def main() -> int:
+    from api.db.database import AsyncSessionLocal
+
+    corrections = asyncio.run(reconcile(AsyncSessionLocal))
+    for name in COUNTED:
+        total, active = corrections.get(name, (0, 0))
+        print(f"{name:<12} {total:+d} total, {active:+d} active")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,365 @@
+""" In-process metrics: a pure ASGI middleware, a bounded heavy-hitter
+sketch for client addresses and Prometheus text exposition.
+"""
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+KNOWN_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labelnames: Tuple[str, ...], values: Tuple) -> str:
+    """Render a label set as ``{a="1",b="2"}`` (empty string when unlabelled)"""
+    if not labelnames:
+        return ""
+    pairs = ",".join(
+        f'{name}="{escape_label(value)}"' for name, value in zip(labelnames, values)
+    )
+    return "{" + pairs + "}"
+
+
+class Counter:
+    """Monotonic counter keyed by a tuple of label values"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Tuple = (), amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, labels: Tuple = ()) -> float:
+        return self._values.get(labels, 0.0)
+
+    def collect(self) -> Iterable[str]:
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in sorted(items):
+            yield f"{self.name}{format_labels(self.labelnames, labels)} {value:g}"
+
+
+class Gauge(Counter):
+    """Value that can go up and down"""
+
+    kind = "gauge"
+
+    def dec(self, labels: Tuple = (), amount: float = 1.0) -> None:
+        self.inc(labels, -amount)
+
+    def set(self, labels: Tuple = (), value: float = 0.0) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+
+class LogLinearHistogram:
+    """Fixed-bucket log-linear histogram
+
+    Each decade between ``10**min_exp`` and ``10**max_exp`` seconds is split
+    into nine linear buckets (1x, 2x, ... 9x), which keeps relative error under
+    ~10% everywhere with only a few dozen counters. Recording is a log10, an
+    index calculation and an increment.
+    """
+
+    SUB_BUCKETS = 9
+
+    def __init__(self, min_exp: int = -4, max_exp: int = 2):
+        self.min_exp = min_exp
+        self.max_exp = max_exp
+        # bucket 0 holds everything under 10**min_exp; after that every decade
+        # contributes upper bounds 2x, 3x, ... 10x
+        self.bounds: List[float] = [10.0 ** min_exp] + [
+            (m + 1) * 10.0 ** e
+            for e in range(min_exp, max_exp)
+            for m in range(1, self.SUB_BUCKETS + 1)
+        ]
+        # one extra slot for everything above the last bound
+        self.counts: List[int] = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def _index(self, value: float) -> int:
+        if value < self.bounds[0]:
+            return 0
+        exp = math.floor(math.log10(value))
+        if exp >= self.max_exp:
+            return len(self.bounds)
+        mantissa = min(max(int(value / 10.0 ** exp), 1), self.SUB_BUCKETS)
+        # value lies in [m * 10**exp, (m + 1) * 10**exp)
+        return 1 + (exp - self.min_exp) * self.SUB_BUCKETS + mantissa - 1
+
+    def observe(self, value: float) -> None:
+        self.counts[self._index(value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Approximate quantile, reported as the upper bound of its bucket"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                return self.bounds[index] if index < len(self.bounds) else float("inf")
+        return float("inf")
+
+
+class Histogram:
+    """Family of log-linear histograms keyed by label values
+
+    Exported as a Prometheus histogram plus precomputed p50/p95/p99 gauges.
+    """
+
+    kind = "histogram"
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[Tuple, LogLinearHistogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Tuple, value: float) -> None:
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = LogLinearHistogram()
+            series.observe(value)
+
+    def series(self, labels: Tuple) -> Optional[LogLinearHistogram]:
+        return self._series.get(labels)
+
+    def collect(self) -> Iterable[str]:
+        with self._lock:
+            items = sorted(
+                (labels, list(h.counts), h.sum, h.count, h.bounds)
+                for labels, h in self._series.items()
+            )
+        for labels, counts, total, count, bounds in items:
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                yield (
+                    f"{self.name}_bucket"
+                    f"{format_labels(self.labelnames + ('le',), labels + (f'{bound:g}',))}"
+                    f" {cumulative}"
+                )
+            yield f"{self.name}_bucket{format_labels(self.labelnames + ('le',), labels + ('+Inf',))} {count}"
+            yield f"{self.name}_sum{format_labels(self.labelnames, labels)} {total:g}"
+            yield f"{self.name}_count{format_labels(self.labelnames, labels)} {count}"
+
+    def collect_quantiles(self) -> Iterable[str]:
+        name = f"{self.name}_quantile"
+        yield f"# HELP {name} Approximate quantiles of {self.name}"
+        yield f"# TYPE {name} gauge"
+        with self._lock:
+            items = sorted(
+                (labels, [h.quantile(q) for q in self.QUANTILES])
+                for labels, h in self._series.items()
+            )
+        for labels, values in items:
+            for q, value in zip(self.QUANTILES, values):
+                yield f"{name}{format_labels(self.labelnames + ('quantile',), labels + (str(q),))} {value:g}"
+
+
+class Summary(Histogram):
+    """Histogram family exported as a Prometheus summary
+
+    For labels with many values, such as SQL fingerprints: each label set
+    exports p50/p95/p99, sum and count (five lines) instead of one line per
+    bucket. The buckets stay in memory to compute the quantiles.
+    """
+
+    kind = "summary"
+
+    def collect(self) -> Iterable[str]:
+        with self._lock:
+            items = sorted(
+                (labels, [h.quantile(q) for q in self.QUANTILES], h.sum, h.count)
+                for labels, h in self._series.items()
+            )
+        for labels, values, total, count in items:
+            for q, value in zip(self.QUANTILES, values):
+                yield f"{self.name}{format_labels(self.labelnames + ('quantile',), labels + (str(q),))} {value:g}"
+            yield f"{self.name}_sum{format_labels(self.labelnames, labels)} {total:g}"
+            yield f"{self.name}_count{format_labels(self.labelnames, labels)} {count}"
+
+
+class SpaceSaving:
+    """Space-Saving top-k sketch (Metwally et al.)
+
+    Tracks at most ``capacity`` keys. When a new key arrives and the table is
+    full, the key with the smallest count is replaced and the newcomer inherits
+    that count as its over-estimation error, so memory stays bounded no matter
+    how many distinct clients we see while heavy hitters are never lost.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self.capacity = capacity
+        self.total = 0
+        self._counts: Dict[str, List[int]] = {}  # key -> [count, error]
+        self._lock = threading.Lock()
+
+    def offer(self, key: str, amount: int = 1) -> None:
+        with self._lock:
+            self.total += amount
+            entry = self._counts.get(key)
+            if entry is not None:
+                entry[0] += amount
+                return
+            if len(self._counts) < self.capacity:
+                self._counts[key] = [amount, 0]
+                return
+            victim = min(self._counts, key=lambda k: self._counts[k][0])
+            floor = self._counts.pop(victim)[0]
+            self._counts[key] = [floor + amount, floor]
+
+    def top(self, n: Optional[int] = None) -> List[Tuple[str, int, int]]:
+        """Return ``(key, count, error)`` tuples, heaviest first"""
+        with self._lock:
+            items = [(key, c[0], c[1]) for key, c in self._counts.items()]
+        items.sort(key=lambda item: item[1], reverse=True)
+        return items[:n] if n is not None else items
+
+
+class MetricsRegistry:
+    """Holds metrics and collector callbacks and renders them for Prometheus"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Counter] = {}
+        self._collectors: List[Callable[[], Iterable[str]]] = []
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._metrics.get(name) or self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._metrics.get(name) or self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Histogram:
+        if name not in self._metrics:
+            histogram = self.register(Histogram(name, documentation, labelnames))
+            self.register_collector(histogram.collect_quantiles)
+        return self._metrics[name]
+
+    def summary(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Summary:
+        return self._metrics.get(name) or self.register(Summary(name, documentation, labelnames))
+
+    def register_collector(self, collector: Callable[[], Iterable[str]]) -> None:
+        """Register a callable yielding exposition lines at scrape time"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.collect())
+        for collector in self._collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+http_requests_total = registry.counter(
+    "http_requests_total",
+    "HTTP requests by method, route template and status code",
+    ("method", "route", "status"),
+)
+http_requests_in_progress = registry.gauge(
+    "http_requests_in_progress",
+    "HTTP requests currently being served",
+)
+http_request_duration_seconds = registry.histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template and status class",
+    ("method", "route", "status_class"),
+)
+client_sketch = SpaceSaving(capacity=64)
+
+
+def collect_top_clients(limit: int = 20) -> Iterable[str]:
+    yield "# HELP http_client_requests_top Approximate request counts for the heaviest client addresses"
+    yield "# TYPE http_client_requests_top gauge"
+    for ip, count, error in client_sketch.top(limit):
+        yield f'http_client_requests_top{{client="{escape_label(ip)}"}} {count}'
+    yield "# HELP http_client_requests_top_error Upper bound on over-estimation for each top client"
+    yield "# TYPE http_client_requests_top_error gauge"
+    for ip, count, error in client_sketch.top(limit):
+        yield f'http_client_requests_top_error{{client="{escape_label(ip)}"}} {error}'
+
+
+registry.register_collector(collect_top_clients)
+
+
+def get_route_template(scope) -> str:
+    """Return the route template matched for ``scope`` (e.g. ``/donations/{donation_id}``)
+
+    Only valid once the router has run. Unmatched paths collapse into a single
+    label so that scanners cannot blow up label cardinality.
+    """
+    route = scope.get("route")
+    if route is not None:
+        return getattr(route, "path_format", None) or route.path
+    if "endpoint" in scope and scope.get("root_path"):
+        # Mounted sub-application such as the /media static files
+        return scope["root_path"] + "/{path}"
+    return UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware counting and timing requests per route template"""
+
+    def __init__(self, app, registry: MetricsRegistry = registry):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        client = scope.get("client")
+        client_sketch.offer(client[0] if client else "unknown")
+        http_requests_in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_requests_in_progress.dec()
+            method = scope["method"] if scope["method"] in KNOWN_METHODS else "OTHER"
+            route = get_route_template(scope)
+            http_requests_total.inc((method, route, str(status_code)))
+            http_request_duration_seconds.observe(
+                (method, route, f"{status_code // 100}xx"), elapsed
+            )
@@ -0,0 +1,255 @@
+""" Fires scheduled newsletters at their scheduled_at
+
+Every worker runs one NewsletterScheduler (started by the app lifespan).
+Due times live in a min-heap; the scheduler sleeps until the earliest one
+or until a newly scheduled newsletter moves that deadline forward, so an
+idle scheduler costs nothing however many newsletters are queued. At
+startup, and every NEWSLETTER_SCHEDULER_RESYNC_SECONDS after, it reloads
+the SCHEDULED newsletters from the database. That picks up newsletters
+created through other workers and any that were left pending by a restart.
+
+Each worker that reaches a deadline tries to claim the newsletter with one
+conditional UPDATE that sets a lease (lease_owner, lease_expires_at). Only
+the worker whose UPDATE matched sends it. The sender renews the lease while
+it works, so a crashed worker's newsletter becomes claimable again once
+its lease runs out. Sends started from the API take the same lease, so a
+manual send cannot run alongside a scheduled one.
+"""
+import asyncio
+import heapq
+import logging
+import os
+import socket
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID, uuid4
+
+from sqlalchemy import and_, or_, select, update
+
+from api.utils.email_service import NewsletterSender
+from api.utils.settings import settings
+from api.v1.models.models import Newsletter, NewsletterStatus
+
+
+logger = logging.getLogger("api.email")
+
+# Identifies this process in Newsletter.lease_owner
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+
+
+def as_utc_naive(moment: datetime) -> datetime:
+    """Timestamps are stored as naive UTC (datetime.utcnow); normalise aware input"""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def lease_duration() -> timedelta:
+    return timedelta(seconds=settings.NEWSLETTER_LEASE_SECONDS)
+
+
+async def claim_newsletter(session_factory, newsletter_id: UUID, due_only: bool = True) -> bool:
+    """Take the send lease for a newsletter; True if this worker now owns it
+
+    ``due_only`` restricts the claim to SCHEDULED newsletters whose time has
+    come (scheduler); without it any unsent newsletter can be claimed (API).
+    """
+    now = datetime.utcnow()
+    conditions = [
+        Newsletter.id == newsletter_id,
+        Newsletter.status != NewsletterStatus.SENT,
+        or_(Newsletter.lease_expires_at.is_(None), Newsletter.lease_expires_at < now),
+    ]
+    if due_only:
+        conditions += [Newsletter.status == NewsletterStatus.SCHEDULED, Newsletter.scheduled_at <= now]
+    async with session_factory() as session:
+        result = await session.execute(
+            update(Newsletter)
+            .where(and_(*conditions))
+            .values(lease_owner=WORKER_ID, lease_expires_at=now + lease_duration())
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+    return result.rowcount == 1
+
+
+async def renew_lease(session_factory, newsletter_id: UUID) -> bool:
+    async with session_factory() as session:
+        result = await session.execute(
+            update(Newsletter)
+            .where(Newsletter.id == newsletter_id, Newsletter.lease_owner == WORKER_ID)
+            .values(lease_expires_at=datetime.utcnow() + lease_duration())
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+    return result.rowcount == 1
+
+
+async def release_lease(session_factory, newsletter_id: UUID, retry_at: Optional[datetime] = None) -> None:
+    """Give the lease up; with ``retry_at`` keep it blocked until then instead"""
+    async with session_factory() as session:
+        await session.execute(
+            update(Newsletter)
+            .where(Newsletter.id == newsletter_id, Newsletter.lease_owner == WORKER_ID)
+            .values(lease_owner=None, lease_expires_at=retry_at)
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+
+
+async def send_claimed(session_factory, newsletter_id: UUID, sender: Optional[NewsletterSender] = None) -> bool:
+    """Send a newsletter this worker holds the lease for; True once it is SENT
+
+    The lease is renewed every third of its duration. If it is lost (the
+    database was unreachable long enough for another worker to claim it),
+    the send is cancelled.
+    """
+    sender = sender or NewsletterSender()
+    send = asyncio.create_task(sender.send(newsletter_id))
+    sent = False
+    try:
+        while True:
+            done, _ = await asyncio.wait({send}, timeout=settings.NEWSLETTER_LEASE_SECONDS / 3)
+            if done:
+                sent = send.result().complete
+                return sent
+            if not await renew_lease(session_factory, newsletter_id):
+                logger.error("Lost the lease on newsletter %s; stopping this send", newsletter_id)
+                send.cancel()
+                return False
+    except Exception:
+        logger.exception("Sending newsletter %s failed", newsletter_id)
+        return False
+    finally:
+        if not send.done():
+            send.cancel()
+        # Failed sends stay leased for one lease period, which spaces out retries
+        retry_at = None if sent else datetime.utcnow() + lease_duration()
+        try:
+            await release_lease(session_factory, newsletter_id, retry_at)
+        except Exception:
+            logger.exception("Could not release the lease on newsletter %s", newsletter_id)
+
+
+class NewsletterScheduler:
+    def __init__(self, session_factory=None, read_session_factory=None):
+        if session_factory is None:
+            from api.db.database import AsyncSessionLocal, AsyncReadSessionLocal
+            session_factory = AsyncSessionLocal
+            read_session_factory = read_session_factory or AsyncReadSessionLocal
+        self.session_factory = session_factory
+        self.read_session_factory = read_session_factory or session_factory
+        self._heap: List[Tuple[datetime, UUID]] = []
+        self._due: Dict[UUID, datetime] = {}  # current due time; heap entries that disagree are stale
+        self._wakeup = asyncio.Event()
+        self._sending: Dict[UUID, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def schedule(self, newsletter_id: UUID, at: datetime) -> None:
+        at = as_utc_naive(at)
+        if self._due.get(newsletter_id) == at:
+            return
+        self._due[newsletter_id] = at
+        heapq.heappush(self._heap, (at, newsletter_id))
+        if self._heap[0][1] == newsletter_id:
+            self._wakeup.set()  # new earliest deadline
+
+    def cancel(self, newsletter_id: UUID) -> None:
+        # The heap entry is skipped when it surfaces
+        self._due.pop(newsletter_id, None)
+
+    async def load(self) -> int:
+        """(Re)load every pending scheduled newsletter from the database"""
+        after, loaded = None, 0
+        while True:
+            query = (
+                select(Newsletter.id, Newsletter.scheduled_at, Newsletter.lease_expires_at)
+                .where(Newsletter.status == NewsletterStatus.SCHEDULED, Newsletter.scheduled_at.is_not(None))
+                .order_by(Newsletter.id)
+                .limit(1000)
+            )
+            if after is not None:
+                query = query.where(Newsletter.id > after)
+            async with self.read_session_factory() as session:
+                rows = (await session.execute(query)).all()
+            if not rows:
+                return loaded
+            for newsletter_id, scheduled_at, lease_expires_at in rows:
+                if newsletter_id not in self._sending:
+                    # A leased newsletter is somebody's (or waiting for a retry) until the lease runs out
+                    self.schedule(newsletter_id, max(scheduled_at, lease_expires_at or scheduled_at))
+                    loaded += 1
+            after = rows[-1][0]
+
+    def _pop_due(self, now: datetime) -> List[UUID]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            at, newsletter_id = heapq.heappop(self._heap)
+            if self._due.get(newsletter_id) == at:
+                del self._due[newsletter_id]
+                due.append(newsletter_id)
+        return due
+
+    def _next_deadline(self) -> Optional[datetime]:
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)  # drop stale entries
+        return self._heap[0][0] if self._heap else None
+
+    async def _fire(self, newsletter_id: UUID) -> None:
+        try:
+            if not await claim_newsletter(self.session_factory, newsletter_id):
+                return  # another worker has it, or it was sent or rescheduled
+            logger.info("Sending scheduled newsletter %s", newsletter_id)
+            if not await send_claimed(self.session_factory, newsletter_id):
+                self.schedule(newsletter_id, datetime.utcnow() + lease_duration())
+        except Exception:
+            logger.exception("Scheduled send of newsletter %s failed", newsletter_id)
+        finally:
+            self._sending.pop(newsletter_id, None)
+
+    async def run(self) -> None:
+        """Background task started by the app lifespan"""
+        resync_every = timedelta(seconds=settings.NEWSLETTER_SCHEDULER_RESYNC_SECONDS)
+        next_resync = datetime.utcnow()
+        while True:
+            now = datetime.utcnow()
+            if now >= next_resync:
+                try:
+                    await self.load()
+                except Exception:
+                    logger.exception("Could not load scheduled newsletters")
+                next_resync = now + resync_every
+            for newsletter_id in self._pop_due(now):
+                if newsletter_id not in self._sending:
+                    self._sending[newsletter_id] = asyncio.create_task(self._fire(newsletter_id))
+
+            deadline = min(filter(None, (self._next_deadline(), next_resync)))
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), (deadline - datetime.utcnow()).total_seconds())
+            except asyncio.TimeoutError:
+                pass
+
+
+# The scheduler of this worker; routes register new schedules with it
+scheduler = NewsletterScheduler()
+_running: Dict[UUID, asyncio.Task] = {}
+
+
+async def start_newsletter_send(newsletter_id: UUID) -> bool:
+    """Claim a newsletter and send it in the background; False if it is already being sent"""
+    if not await claim_newsletter(scheduler.session_factory, newsletter_id, due_only=False):
+        return False
+    scheduler.cancel(newsletter_id)
+
+    async def run():
+        try:
+            await send_claimed(scheduler.session_factory, newsletter_id)
+        finally:
+            _running.pop(newsletter_id, None)
+
+    # Kept referenced so the task is not garbage collected
+    _running[newsletter_id] = asyncio.create_task(run())
+    return True
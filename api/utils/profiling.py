@@ -0,0 +1,213 @@
+""" On-demand request profiling
+
+A pure ASGI middleware that runs selected requests under a sampling profiler
+and writes the result in folded-stack format, which flamegraph.pl, speedscope
+and inferno load directly.
+
+A request is profiled when either
+  * a superadmin sends ``X-Profile: 1`` (or ``?__profile=1``); the profile is
+    written to PROFILE_DIR and its file name returned in ``X-Profile-File``.
+    ``X-Profile: inline`` returns the folded stacks as the response body;
+  * PROFILE_SAMPLE_RATE is N > 0 and the request is the Nth since the last
+    sampled one; those profiles go to PROFILE_DIR only.
+
+The middleware is only installed when PROFILING_ENABLED is set, so nothing runs
+otherwise.
+
+Samples of the event loop thread are kept only while the profiled request's
+own task is running there, so concurrent async requests stay out of its
+profile. Other threads cannot be attributed to a request and are all
+sampled: the thread pool (sync endpoints, run_in_threadpool) and the
+database driver's threads may include work for overlapping requests.
+"""
+import asyncio
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qs
+
+from starlette.concurrency import run_in_threadpool
+
+from api.utils.settings import settings
+
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_QUERY_PARAM = "__profile"
+
+# Leaf frames of threads that are parked rather than doing work
+IDLE_FUNCTIONS = {"wait", "select", "poll"}
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Samples the stacks of every other thread at a fixed interval
+
+    With ``task``, samples of the thread running its event loop are skipped
+    while any other task runs there.
+    """
+
+    def __init__(self, interval: float = 0.001, task: Optional[asyncio.Task] = None):
+        self.interval = interval
+        self.task = task
+        self._loop = task.get_loop() if task is not None else None
+        self._loop_ident = threading.get_ident() if task is not None else None
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own_ident = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident or frame.f_code.co_name in IDLE_FUNCTIONS:
+                    continue
+                if ident == self._loop_ident and asyncio.current_task(self._loop) is not self.task:
+                    continue  # another request's task (or the loop between tasks)
+                if ident not in names:
+                    names.update((t.ident, t.name) for t in threading.enumerate())
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        """Render samples as ``frame;frame;frame count`` lines"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def is_superadmin_request(scope) -> bool:
+    """Check the bearer token of ``scope`` without touching the database"""
+    from api.v1.routes.auth import verify_token, UserRole
+
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer" or not token:
+                return False
+            try:
+                payload = verify_token(token, "access")
+            except Exception:
+                return False
+            return payload.get("role") == UserRole.SUPERADMIN.value
+    return False
+
+
+def requested_profile_mode(scope) -> Optional[str]:
+    """Return ``"store"``, ``"inline"`` or None depending on the request flags"""
+    value = None
+    for name, header_value in scope["headers"]:
+        if name == PROFILE_HEADER:
+            value = header_value.decode("latin-1").strip().lower()
+            break
+    if value is None and PROFILE_QUERY_PARAM.encode() in scope.get("query_string", b""):
+        values = parse_qs(scope["query_string"].decode("latin-1")).get(PROFILE_QUERY_PARAM)
+        value = values[0].lower() if values else None
+    if value in ("1", "true", "yes", "store"):
+        return "store"
+    if value == "inline":
+        return "inline"
+    return None
+
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware running selected requests under StackSampler"""
+
+    def __init__(
+        self,
+        app,
+        profile_dir: str = settings.PROFILE_DIR,
+        sample_rate: int = settings.PROFILE_SAMPLE_RATE,
+        interval: float = settings.PROFILE_INTERVAL_MS / 1000,
+    ):
+        self.app = app
+        self.profile_dir = Path(profile_dir)
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self._requests = itertools.count(1)
+        self._profiles = itertools.count(1)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        mode = requested_profile_mode(scope)
+        if mode is not None and not is_superadmin_request(scope):
+            mode = None
+        if mode is None and self.sample_rate > 0 and next(self._requests) % self.sample_rate == 0:
+            mode = "sampled"
+        if mode is None:
+            await self.app(scope, receive, send)
+            return
+
+        # Created here, so the loop thread is the current thread
+        sampler = StackSampler(self.interval, asyncio.current_task())
+        filename = self._filename(scope)
+
+        async def send_wrapper(message):
+            if mode == "inline":
+                return
+            if mode == "store" and message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-file", filename.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            folded = sampler.folded()
+            if mode != "inline":
+                await run_in_threadpool(self._write, filename, folded)
+
+        if mode == "inline":
+            body = folded.encode()
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/plain; charset=utf-8"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"content-disposition", f'attachment; filename="{filename}"'.encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+
+    def _filename(self, scope) -> str:
+        path = scope["path"].strip("/").replace("/", "_") or "root"
+        # The sequence number tells apart profiles written in the same second
+        return (
+            f"{time.strftime('%Y%m%dT%H%M%S')}_{os.getpid()}_{next(self._profiles)}"
+            f"_{scope['method']}_{path[:80]}.folded"
+        )
+
+    def _write(self, filename: str, folded: str) -> None:
+        try:
+            self.profile_dir.mkdir(parents=True, exist_ok=True)
+            (self.profile_dir / filename).write_text(folded)
+        except OSError as e:
+            logger.warning("Could not write profile %s: %s", filename, e)
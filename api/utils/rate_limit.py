@@ -0,0 +1,176 @@
+""" Token-bucket rate limiting for the public write endpoints
+
+RateLimitMiddleware is a pure ASGI middleware that looks the request up in a
+table of per-route policies by method and path (no routing needed). If the
+client's bucket is empty it answers 429 straight away, so throttled requests
+never reach a dependency or the database.
+
+Two bucket stores are available:
+  * MemoryBucketStore - per process; idle buckets are evicted once they would
+    have refilled anyway, so memory tracks active clients only.
+  * SharedBucketStore - a fixed slot table in shared memory, inherited by the
+    workers forked from serve.py, so limits hold across the whole pool.
+"""
+import hashlib
+import json
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from api.utils.metrics import registry
+from api.utils.settings import settings
+from api.utils.shared_memory import SharedArray
+
+
+class RateLimitPolicy(NamedTuple):
+    name: str
+    rate: float  # tokens added per second
+    burst: int   # bucket capacity
+
+    @property
+    def refill_seconds(self) -> float:
+        return self.burst / self.rate
+
+
+def per_minute(name: str, count: int, burst: int) -> RateLimitPolicy:
+    return RateLimitPolicy(name, count / 60.0, burst)
+
+
+# (method, path without trailing slash) -> policy
+DEFAULT_POLICIES: Dict[Tuple[str, str], RateLimitPolicy] = {
+    ("POST", "/api/v1/subscribers"): per_minute("subscribe", 10, 5),
+    ("POST", "/api/v1/donations/donations"): per_minute("create_donation", 10, 5),
+    ("POST", "/api/v1/volunteers"): per_minute("create_volunteer", 5, 3),
+    ("POST", "/api/v1/donations/upload-receipt"): per_minute("upload_receipt", 6, 3),
+}
+
+rate_limited_total = registry.counter(
+    "http_rate_limited_total",
+    "Requests rejected with 429 by policy",
+    ("policy",),
+)
+
+
+def _take(tokens: float, last: float, now: float, policy: RateLimitPolicy) -> Tuple[bool, float, float]:
+    """Refill a bucket up to ``now`` and try to take one token
+
+    Returns ``(allowed, tokens_left, retry_after_seconds)``.
+    """
+    tokens = min(policy.burst, tokens + (now - last) * policy.rate)
+    if tokens >= 1.0:
+        return True, tokens - 1.0, 0.0
+    return False, tokens, (1.0 - tokens) / policy.rate
+
+
+class MemoryBucketStore:
+    """In-process buckets in LRU order, evicting those idle long enough to be full"""
+
+    def __init__(self, max_idle: float, max_keys: int = 100_000):
+        self.max_idle = max_idle
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()  # key -> [tokens, last]
+
+    def take(self, key: str, policy: RateLimitPolicy, now: float) -> Tuple[bool, float]:
+        self._evict(now)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(policy.burst), now]
+        else:
+            self._buckets.move_to_end(key)
+        allowed, bucket[0], retry_after = _take(bucket[0], bucket[1], now, policy)
+        bucket[1] = now
+        return allowed, retry_after
+
+    def _evict(self, now: float) -> None:
+        buckets = self._buckets
+        while buckets:
+            key, (tokens, last) = next(iter(buckets.items()))
+            if now - last < self.max_idle and len(buckets) < self.max_keys:
+                break
+            del buckets[key]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class SharedBucketStore:
+    """Buckets in a fixed-size shared-memory hash table
+
+    Each key hashes to one slot holding (key hash, tokens, last update). A
+    different key landing on a slot takes it over with a full bucket, which
+    errs on the side of letting traffic through; with tens of thousands of
+    slots collisions between active clients are rare.
+    """
+
+    def __init__(self, slots: int = 65536):
+        self.slots = slots
+        self._keys = SharedArray("Q", slots)
+        self._state = SharedArray("d", slots * 2)
+
+    def take(self, key: str, policy: RateLimitPolicy, now: float) -> Tuple[bool, float]:
+        digest = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little")
+        slot = digest % self.slots
+        with self._keys.lock:
+            if self._keys[slot] != digest:
+                self._keys[slot] = digest
+                tokens, last = float(policy.burst), now
+            else:
+                tokens, last = self._state[2 * slot], self._state[2 * slot + 1]
+            allowed, tokens, retry_after = _take(tokens, last, now, policy)
+            self._state[2 * slot] = tokens
+            self._state[2 * slot + 1] = now
+        return allowed, retry_after
+
+
+def build_store(policies: Dict[Tuple[str, str], RateLimitPolicy] = DEFAULT_POLICIES, backend: Optional[str] = None):
+    """Create the bucket store configured by RATE_LIMIT_BACKEND
+
+    Call at import time of the app module so that a prefork master creates the
+    shared table before forking.
+    """
+    backend = backend or settings.RATE_LIMIT_BACKEND
+    if backend == "shared":
+        return SharedBucketStore()
+    if backend == "memory":
+        return MemoryBucketStore(max_idle=max(p.refill_seconds for p in policies.values()))
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND {backend!r}; expected 'memory' or 'shared'")
+
+
+class RateLimitMiddleware:
+    """Pure ASGI token-bucket limiter keyed by client address and policy"""
+
+    def __init__(self, app, store, policies: Dict[Tuple[str, str], RateLimitPolicy] = DEFAULT_POLICIES):
+        self.app = app
+        self.store = store
+        self.policies = policies
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        policy = self.policies.get((scope["method"], scope["path"].rstrip("/")))
+        if policy is None:
+            await self.app(scope, receive, send)
+            return
+
+        client = scope.get("client")
+        key = f"{policy.name}:{client[0] if client else 'unknown'}"
+        allowed, retry_after = self.store.take(key, policy, time.monotonic())
+        if allowed:
+            await self.app(scope, receive, send)
+            return
+
+        rate_limited_total.inc((policy.name,))
+        body = json.dumps({"detail": "Too many requests, please try again later"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(math.ceil(retry_after)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,231 @@
+""" Per-domain pacing for newsletter sends
+
+Mailbox providers rate-limit senders per receiving domain and answer
+bursts with 4xx deferrals. DomainThrottle keeps one token bucket per
+recipient domain and adapts it AIMD-style:
+- every accepted message adds SEND_RATE_INCREASE messages/second to the
+  rate, up to SEND_DOMAIN_MAX_RATE;
+- a 4xx for a recipient halves the rate, down to SEND_DOMAIN_MIN_RATE,
+  and pauses the domain for a second. This happens at most once per
+  second, because the rest of a pipelined burst is usually deferred too.
+
+DomainDispatcher holds the recipients of a send in one queue per domain
+and deals them out round-robin, taking only from domains whose bucket
+has a token. A throttled provider therefore only slows its own
+recipients while the other domains keep flowing.
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, List, Optional
+
+from api.utils.settings import settings
+
+
+# Replies that mean "this domain wants us to slow down" (per recipient),
+# as opposed to 421, which is about the connection
+DOMAIN_DEFERRAL_CODES = {450, 451, 452}
+DEFERRAL_COOLDOWN = 1.0
+
+
+def domain_of(email: str) -> str:
+    return email.rpartition("@")[2].lower()
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float, min_rate: float, max_rate: float, increase: float):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.last_decrease = -math.inf
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, now: float) -> bool:
+        if now < self.paused_until:
+            return False
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is available"""
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def on_success(self) -> None:
+        self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_deferral(self, now: float) -> None:
+        if now - self.last_decrease < DEFERRAL_COOLDOWN:
+            return
+        self.last_decrease = now
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = 0.0
+        self.updated = now
+        self.paused_until = now + DEFERRAL_COOLDOWN
+
+
+class _UnlimitedBucket:
+    def try_take(self, now: float) -> bool:
+        return True
+
+    def wait_time(self, now: float) -> float:
+        return 0.0
+
+    def on_success(self) -> None:
+        pass
+
+    def on_deferral(self, now: float) -> None:
+        pass
+
+
+_UNLIMITED = _UnlimitedBucket()
+
+
+class DomainThrottle:
+    def __init__(
+        self,
+        rate: Optional[float] = None,
+        burst: Optional[float] = None,
+        min_rate: Optional[float] = None,
+        max_rate: Optional[float] = None,
+        increase: Optional[float] = None,
+    ):
+        self.rate = rate if rate is not None else settings.SEND_DOMAIN_RATE
+        self.burst = burst if burst is not None else settings.SEND_DOMAIN_BURST
+        self.min_rate = min_rate if min_rate is not None else settings.SEND_DOMAIN_MIN_RATE
+        self.max_rate = max_rate if max_rate is not None else settings.SEND_DOMAIN_MAX_RATE
+        self.increase = increase if increase is not None else settings.SEND_RATE_INCREASE
+        self.enabled = True
+        self.buckets: Dict[str, TokenBucket] = {}
+
+    @classmethod
+    def unlimited(cls) -> "DomainThrottle":
+        """No pacing at all (benchmarks, relays that queue for us)"""
+        throttle = cls()
+        throttle.enabled = False
+        return throttle
+
+    def bucket(self, domain: str) -> TokenBucket:
+        if not self.enabled:
+            return _UNLIMITED
+        bucket = self.buckets.get(domain)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst, self.min_rate, self.max_rate, self.increase)
+            self.buckets[domain] = bucket
+        return bucket
+
+    def feedback(self, domain: str, code: int) -> None:
+        if 200 <= code < 400:
+            self.bucket(domain).on_success()
+        elif code in DOMAIN_DEFERRAL_CODES:
+            self.bucket(domain).on_deferral(time.monotonic())
+
+
+class DomainDispatcher:
+    """Per-domain queues dealt out round-robin as token buckets allow
+
+    The producer puts envelopes (waiting while ``limit`` are buffered),
+    workers requeue deferred ones and report finished ones, and
+    ``chunks()`` yields mixed-domain chunks of up to ``depth`` envelopes
+    until the producer is done and nothing is unfinished.
+    """
+
+    def __init__(self, throttle: DomainThrottle, depth: int, limit: int):
+        self.throttle = throttle
+        self.depth = depth
+        self.limit = limit
+        self.queues: Dict[str, Deque] = {}
+        self.ring: Deque[str] = deque()  # domains with queued envelopes, next one first
+        self.size = 0  # envelopes waiting in the queues
+        self.unfinished = 0  # envelopes put and not yet reported done
+        self.producer_done = False
+        self._changed = asyncio.Event()
+        self._space = asyncio.Event()
+
+    def _append(self, envelope) -> None:
+        domain = domain_of(envelope.recipient)
+        queue = self.queues.get(domain)
+        if queue is None:
+            queue = self.queues[domain] = deque()
+        if not queue:
+            self.ring.append(domain)
+        queue.append(envelope)
+        self.size += 1
+        self._changed.set()
+
+    async def put(self, envelope) -> None:
+        while self.size >= self.limit:
+            self._space.clear()
+            await self._space.wait()
+        self.unfinished += 1
+        self._append(envelope)
+
+    def finish(self) -> None:
+        self.producer_done = True
+        self._changed.set()
+
+    def requeue(self, envelope) -> None:
+        # Back of its domain's queue: the domain is slowed down anyway
+        self._append(envelope)
+
+    def done(self, count: int = 1) -> None:
+        self.unfinished -= count
+        self._changed.set()
+
+    def _take(self) -> List:
+        chunk = []
+        now = time.monotonic()
+        progressed = True
+        while progressed and len(chunk) < self.depth and self.ring:
+            progressed = False
+            for _ in range(len(self.ring)):
+                if len(chunk) >= self.depth or not self.ring:
+                    break
+                domain = self.ring[0]
+                self.ring.rotate(-1)  # it is now last
+                if not self.throttle.bucket(domain).try_take(now):
+                    continue
+                queue = self.queues[domain]
+                chunk.append(queue.popleft())
+                progressed = True
+                if not queue:
+                    self.ring.pop()
+                    del self.queues[domain]
+        if chunk:
+            self.size -= len(chunk)
+            self._space.set()
+        return chunk
+
+    def _wait_time(self) -> Optional[float]:
+        if not self.ring:
+            return None
+        now = time.monotonic()
+        return min(self.throttle.bucket(domain).wait_time(now) for domain in self.ring)
+
+    async def chunks(self) -> AsyncIterator[List]:
+        while True:
+            chunk = self._take()
+            if chunk:
+                yield chunk
+                continue
+            if self.producer_done and self.unfinished <= 0:
+                return
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), self._wait_time())
+            except asyncio.TimeoutError:
+                pass
@@ -32,12 +32,101 @@ class Settings(BaseSettings):
     DB_TYPE: str = config("DB_TYPE")
     DB_PASSWORD: str = config("DB_PASSWORD")
 
+    # Connection pool (ignored for the test database)
+    DB_POOL_SIZE: int = config("DB_POOL_SIZE", default=5, cast=int)
+    DB_MAX_OVERFLOW: int = config("DB_MAX_OVERFLOW", default=10, cast=int)
+    DB_POOL_TIMEOUT: int = config("DB_POOL_TIMEOUT", default=30, cast=int)
+    DB_POOL_RECYCLE: int = config("DB_POOL_RECYCLE", default=1800, cast=int)
+    DB_POOL_PRE_PING: bool = config("DB_POOL_PRE_PING", default=True, cast=bool)
+    # Per-connection statement timeout on PostgreSQL, 0 disables it
+    DB_STATEMENT_TIMEOUT_MS: int = config("DB_STATEMENT_TIMEOUT_MS", default=30000, cast=int)
+
+    # SQLite profile (DB_TYPE=sqlite)
+    SQLITE_PATH: str = config("SQLITE_PATH", default=str(BASE_DIR / "psf.db"))
+    SQLITE_READ_POOL_SIZE: int = config("SQLITE_READ_POOL_SIZE", default=8, cast=int)
+    SQLITE_BUSY_TIMEOUT_MS: int = config("SQLITE_BUSY_TIMEOUT_MS", default=5000, cast=int)
+    SQLITE_MMAP_SIZE: int = config("SQLITE_MMAP_SIZE", default=268435456, cast=int)
+    SQLITE_CACHE_SIZE_KB: int = config("SQLITE_CACHE_SIZE_KB", default=65536, cast=int)
+
+    # Monthly partitioning of donations (PostgreSQL, see api/db/partitions.py);
+    # DONATION_ARCHIVE_AFTER_MONTHS=0 leaves archiving to the CLI
+    DONATION_PARTITIONING: bool = config("DONATION_PARTITIONING", default=False, cast=bool)
+    DONATION_PARTITION_MONTHS_AHEAD: int = config("DONATION_PARTITION_MONTHS_AHEAD", default=3, cast=int)
+    DONATION_ARCHIVE_AFTER_MONTHS: int = config("DONATION_ARCHIVE_AFTER_MONTHS", default=0, cast=int)
+    DONATION_ARCHIVE_DIR: str = config("DONATION_ARCHIVE_DIR", default="./archive")
+
+    # Serving (see serve.py); WEB_CONCURRENCY=0 means one worker per CPU
+    WEB_CONCURRENCY: int = config("WEB_CONCURRENCY", default=0, cast=int)
+    MAX_REQUESTS: int = config("MAX_REQUESTS", default=10000, cast=int)
+    MAX_REQUESTS_JITTER: int = config("MAX_REQUESTS_JITTER", default=1000, cast=int)
+    GRACEFUL_TIMEOUT: int = config("GRACEFUL_TIMEOUT", default=30, cast=int)
+
+    # Rate limiting (see api/utils/rate_limit.py); backend is "memory" or "shared"
+    RATE_LIMIT_ENABLED: bool = config("RATE_LIMIT_ENABLED", default=True, cast=bool)
+    RATE_LIMIT_BACKEND: str = config("RATE_LIMIT_BACKEND", default="memory")
+
+    # HTTP caching and compression
+    CONDITIONAL_GET_ENABLED: bool = config("CONDITIONAL_GET_ENABLED", default=True, cast=bool)
+    COMPRESSION_MINIMUM_SIZE: int = config("COMPRESSION_MINIMUM_SIZE", default=1024, cast=int)
+
+    # Observability
+    SLOW_QUERY_THRESHOLD_MS: int = config("SLOW_QUERY_THRESHOLD_MS", default=200, cast=int)
+    # Bearer token for Prometheus scrapes of /metrics; admins can always read it
+    METRICS_TOKEN: str = config("METRICS_TOKEN", default="")
+    # Redacted traffic log for benchmarks/replay.py; empty disables capture
+    TRAFFIC_CAPTURE_FILE: str = config("TRAFFIC_CAPTURE_FILE", default="")
+
+    # Profiling (see api/utils/profiling.py)
+    PROFILING_ENABLED: bool = config("PROFILING_ENABLED", default=False, cast=bool)
+    PROFILE_SAMPLE_RATE: int = config("PROFILE_SAMPLE_RATE", default=0, cast=int)
+    PROFILE_INTERVAL_MS: float = config("PROFILE_INTERVAL_MS", default=1.0, cast=float)
+    PROFILE_DIR: str = config("PROFILE_DIR", default="./profiles")
+
     # Email
     SMTP_HOST: str = config("SMTP_HOST")
     SMTP_PORT: int = config("SMTP_PORT", cast=int)
     SMTP_USER: str = config("SMTP_USER")
     SMTP_PASSWORD: str = config("SMTP_PASSWORD")
     FROM_EMAIL: str = config("FROM_EMAIL")
+    # "starttls", "tls" (implicit, usually port 465) or "none" (local stand-in)
+    SMTP_SECURITY: str = config("SMTP_SECURITY", default="starttls")
+    SMTP_TIMEOUT: float = config("SMTP_TIMEOUT", default=30, cast=float)
+
+    # Newsletter delivery (see api/utils/email_service.py)
+    SMTP_POOL_SIZE: int = config("SMTP_POOL_SIZE", default=4, cast=int)
+    SMTP_PIPELINE_DEPTH: int = config("SMTP_PIPELINE_DEPTH", default=20, cast=int)
+    SMTP_MAX_MESSAGES_PER_CONNECTION: int = config("SMTP_MAX_MESSAGES_PER_CONNECTION", default=500, cast=int)
+    NEWSLETTER_BATCH_SIZE: int = config("NEWSLETTER_BATCH_SIZE", default=1000, cast=int)
+    # Runs that may retry a deferred recipient before it is given up on
+    NEWSLETTER_MAX_ATTEMPTS: int = config("NEWSLETTER_MAX_ATTEMPTS", default=5, cast=int)
+    # 4xx deferrals retried within a run before the recipient is left for the next one
+    NEWSLETTER_INLINE_RETRIES: int = config("NEWSLETTER_INLINE_RETRIES", default=3, cast=int)
+    # Per-domain pacing (see api/utils/send_throttle.py); rates in messages/second
+    SEND_THROTTLE_ENABLED: bool = config("SEND_THROTTLE_ENABLED", default=True, cast=bool)
+    SEND_DOMAIN_RATE: float = config("SEND_DOMAIN_RATE", default=20.0, cast=float)
+    SEND_DOMAIN_BURST: float = config("SEND_DOMAIN_BURST", default=40.0, cast=float)
+    SEND_DOMAIN_MIN_RATE: float = config("SEND_DOMAIN_MIN_RATE", default=0.5, cast=float)
+    SEND_DOMAIN_MAX_RATE: float = config("SEND_DOMAIN_MAX_RATE", default=500.0, cast=float)
+    SEND_RATE_INCREASE: float = config("SEND_RATE_INCREASE", default=0.5, cast=float)
+    # Compiled templates kept in memory (see api/utils/email_templates.py)
+    EMAIL_TEMPLATE_CACHE_SIZE: int = config("EMAIL_TEMPLATE_CACHE_SIZE", default=128, cast=int)
+    # Scheduled sends (see api/utils/newsletter_scheduler.py)
+    NEWSLETTER_SCHEDULER_ENABLED: bool = config("NEWSLETTER_SCHEDULER_ENABLED", default=True, cast=bool)
+    NEWSLETTER_SCHEDULER_RESYNC_SECONDS: int = config("NEWSLETTER_SCHEDULER_RESYNC_SECONDS", default=600, cast=int)
+    NEWSLETTER_LEASE_SECONDS: int = config("NEWSLETTER_LEASE_SECONDS", default=300, cast=int)
+    # Bounces and complaints (see api/utils/suppression.py). With a token set,
+    # providers may post to /subscribers/bounces?token=... without admin login
+    BOUNCE_WEBHOOK_TOKEN: str = config("BOUNCE_WEBHOOK_TOKEN", default="")
+    SUPPRESSION_REFRESH_SECONDS: int = config("SUPPRESSION_REFRESH_SECONDS", default=30, cast=int)
+    # Lines per upsert in bulk imports (see api/utils/subscriber_import.py)
+    SUBSCRIBER_IMPORT_BATCH_SIZE: int = config("SUBSCRIBER_IMPORT_BATCH_SIZE", default=1000, cast=int)
+    # Rows per keyset page in exports (see api/utils/subscriber_export.py)
+    SUBSCRIBER_EXPORT_BATCH_SIZE: int = config("SUBSCRIBER_EXPORT_BATCH_SIZE", default=1000, cast=int)
+
+    # Stats counters (see api/utils/entity_counters.py)
+    ENTITY_COUNTER_SHARDS: int = config("ENTITY_COUNTER_SHARDS", default=8, cast=int)
+    # 0 turns the periodic recount off
+    ENTITY_COUNTER_RECONCILE_SECONDS: int = config("ENTITY_COUNTER_RECONCILE_SECONDS", default=3600, cast=int)
 
     # CORS
     ALLOWED_ORIGINS: str = config("ALLOWED_ORIGINS")
@@ -49,6 +138,8 @@ class Settings(BaseSettings):
     CLOUDINARY_CLOUD_NAME: str = config("CLOUDINARY_CLOUD_NAME")
     CLOUDINARY_API_KEY: str = config("CLOUDINARY_API_KEY")
     CLOUDINARY_API_SECRET: str = config("CLOUDINARY_API_SECRET")
+    # "cloudinary", or "local" to keep receipts under ./media (development, benchmarks)
+    RECEIPT_STORAGE: str = config("RECEIPT_STORAGE", default="cloudinary")
 
     # Optional Tool Flag
     @property
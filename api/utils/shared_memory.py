@@ -0,0 +1,30 @@
+""" Numeric arrays in anonymous shared memory
+
+Created in the prefork master (see serve.py) before workers are forked, they
+give every worker the same view of small bits of hot state without a network
+round trip. Under a spawn-based server each process simply gets its own copy.
+"""
+import mmap
+import multiprocessing
+import struct
+
+
+class SharedArray:
+    """Fixed-size array of ``typecode`` items backed by a MAP_SHARED mapping"""
+
+    def __init__(self, typecode: str, length: int):
+        self.typecode = typecode
+        self.length = length
+        self._mmap = mmap.mmap(-1, struct.calcsize(typecode) * length)
+        self.values = memoryview(self._mmap).cast(typecode)
+        # A semaphore-backed lock, so it keeps working across fork()
+        self.lock = multiprocessing.Lock()
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, index):
+        return self.values[index]
+
+    def __setitem__(self, index, value) -> None:
+        self.values[index] = value
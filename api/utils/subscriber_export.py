@@ -0,0 +1,112 @@
+""" Streaming subscriber export for partners and incremental syncs
+
+Rows are read in keyset pages of SUBSCRIBER_EXPORT_BATCH_SIZE, each page
+in its own short read transaction, and encoded as they are read. Memory
+stays constant, and no transaction stays open for the length of a slow
+download. Pages never skip or repeat a row, unlike OFFSET paging.
+
+  * full export: ordered by id (time-ordered UUIDv7, so roughly by
+    signup), optionally only active rows and a subscribed_at range;
+  * delta export (``since``): rows whose updated_at is at or after
+    ``since`` and before the sync watermark, ordered by (updated_at, id).
+
+The watermark is the export's start time minus SYNC_LAG, so that writes
+still committing when the export started are not missed. The watermark is
+sent in the X-Sync-Watermark header. A syncing client stores it and passes
+it as ``since`` next time; rows changed near the boundary may come twice,
+never zero times. Deleted subscribers are not reported; unsubscribes are,
+as rows with is_active false.
+"""
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Optional
+from uuid import UUID
+
+from sqlalchemy import and_, or_, select
+
+from api.utils.newsletter_scheduler import as_utc_naive
+from api.utils.settings import settings
+from api.v1.models.models import Subscriber
+
+
+EXPORT_COLUMNS = ("id", "email", "is_active", "subscribed_at", "unsubscribed_at", "updated_at")
+EXPORT_MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+# How long after its updated_at a write may still be uncommitted
+SYNC_LAG = timedelta(seconds=5)
+
+
+def sync_watermark() -> datetime:
+    return datetime.utcnow() - SYNC_LAG
+
+
+def _export_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    return value
+
+
+def encode_rows(rows, format: str) -> str:
+    if format == "ndjson":
+        return "".join(
+            json.dumps({name: _export_value(row[name]) for name in EXPORT_COLUMNS}) + "\n"
+            for row in rows
+        )
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(_export_value(row[name]) for name in EXPORT_COLUMNS)
+    return buffer.getvalue()
+
+
+async def stream_subscribers(
+    session_factory,
+    format: str,
+    active_only: bool,
+    subscribed_from: Optional[datetime] = None,
+    subscribed_to: Optional[datetime] = None,
+    since: Optional[datetime] = None,
+    watermark: Optional[datetime] = None,
+    batch_size: Optional[int] = None,
+) -> AsyncIterator[str]:
+    """Encoded pages of subscribers; ``since`` switches to the delta order"""
+    batch_size = batch_size or settings.SUBSCRIBER_EXPORT_BATCH_SIZE
+    if format == "csv":
+        yield ",".join(EXPORT_COLUMNS) + "\r\n"
+
+    query = select(*(Subscriber.__table__.c[name] for name in EXPORT_COLUMNS))
+    if active_only:
+        query = query.where(Subscriber.is_active == True)
+    if subscribed_from:
+        query = query.where(Subscriber.subscribed_at >= as_utc_naive(subscribed_from))
+    if subscribed_to:
+        query = query.where(Subscriber.subscribed_at < as_utc_naive(subscribed_to))
+    if since is not None:
+        query = query.where(
+            Subscriber.updated_at >= as_utc_naive(since), Subscriber.updated_at < (watermark or sync_watermark())
+        ).order_by(Subscriber.updated_at, Subscriber.id)
+    else:
+        query = query.order_by(Subscriber.id)
+
+    last = None
+    while True:
+        page = query
+        if last is not None:
+            if since is not None:
+                page = page.where(or_(
+                    Subscriber.updated_at > last["updated_at"],
+                    and_(Subscriber.updated_at == last["updated_at"], Subscriber.id > last["id"]),
+                ))
+            else:
+                page = page.where(Subscriber.id > last["id"])
+        async with session_factory() as session:
+            rows = (await session.execute(page.limit(batch_size))).mappings().all()
+        if not rows:
+            return
+        yield encode_rows(rows, format)
+        if len(rows) < batch_size:
+            return
+        last = rows[-1]
@@ -0,0 +1,270 @@
+""" Streaming bulk import of newsletter subscribers
+
+The request body (CSV or NDJSON, one record per line) is read as it
+arrives and handled in batches of SUBSCRIBER_IMPORT_BATCH_SIZE lines:
+
+  * parse and validate: email addresses are normalized the way EmailStr
+    does for POST /subscribers/. This happens in the threadpool, one batch
+    at a time;
+  * de-duplicate: addresses already seen earlier in the file are counted
+    and skipped, using an in-memory set;
+  * upsert: one INSERT ... ON CONFLICT (email) DO UPDATE per batch, in its
+    own transaction. The update only applies to inactive rows. It
+    reactivates them the same way subscribing again does.
+
+The statement supplies the ids of new rows and returns the id of every row
+it wrote. That tells the cases apart without reading first:
+  * a returned id that we supplied is an insert;
+  * any other returned id is a reactivation;
+  * an address with no returned row was already active.
+POST /subscribers/ uses the same statement for a single address.
+
+CSV files may start with a header. The column named "email" (or the first
+one containing "email", ignoring dashes) is used; without a header, the first column is
+used. NDJSON lines are objects with an "email" key or bare JSON strings.
+"""
+import codecs
+import csv
+import json
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import lru_cache
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from email_validator import EmailNotValidError, validate_email
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.utils.entity_counters import adjust
+from api.utils.settings import settings
+from api.utils.uuid7 import uuid7
+from api.v1.models.models import Subscriber
+
+
+FORMATS = ("csv", "ndjson")
+# Invalid rows echoed back in the report; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+
+class ImportFormatError(ValueError):
+    """The file cannot be imported at all (as opposed to a bad row)"""
+
+
+@dataclass
+class ImportReport:
+    rows: int = 0
+    inserted: int = 0
+    reactivated: int = 0
+    already_active: int = 0
+    duplicates: int = 0
+    invalid: int = 0
+    errors: List[Dict[str, object]] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    def add_error(self, line: int, value: str, reason: str) -> None:
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "value": value[:255], "reason": reason})
+
+
+def format_for(content_type: Optional[str]) -> str:
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type in ("application/x-ndjson", "application/jsonl", "application/json"):
+        return "ndjson"
+    return "csv"
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Decode a byte stream into lines without holding more than one chunk"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending = ""
+    async for chunk in chunks:
+        lines = (pending + decoder.decode(chunk)).split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending.rstrip("\r"):
+        yield pending.rstrip("\r")
+
+
+# An ASCII dot-atom local part, which email_validator accepts and leaves unchanged
+_PLAIN_LOCAL_PART = re.compile(r"[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+(?:\.[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+)*")
+
+
+@lru_cache(maxsize=4096)
+def _normalize_domain(domain: str) -> str:
+    return validate_email(f"a@{domain}", check_deliverability=False).domain
+
+
+def normalize_email(value: str) -> str:
+    """The address as POST /subscribers/ would store it; raises EmailNotValidError
+
+    Most of email_validator's time goes into the (IDNA) domain checks, and
+    an import has few distinct domains, so those are cached. Local parts
+    other than plain ASCII take the full path.
+    """
+    value = value.strip()
+    local, at, domain = value.rpartition("@")
+    if at and len(local) <= 64 and _PLAIN_LOCAL_PART.fullmatch(local):
+        normalized = f"{local}@{_normalize_domain(domain)}"
+        if len(normalized) <= 254:
+            return normalized
+    return validate_email(value, check_deliverability=False).normalized
+
+
+def email_column(header: List[str]) -> Optional[int]:
+    names = [name.strip().lower().replace("-", "").replace("_", "") for name in header]
+    if "email" in names:
+        return names.index("email")
+    for index, name in enumerate(names):
+        if "email" in name:
+            return index
+    return None
+
+
+class _Parser:
+    """Turns batches of raw lines into (line number, normalized email) pairs"""
+
+    def __init__(self, format: str):
+        self.format = format
+        self.column: Optional[int] = None  # CSV: unknown until the first line
+
+    def _extract(self, line: str) -> str:
+        if self.format == "ndjson":
+            record = json.loads(line)
+            if isinstance(record, dict):
+                record = record.get("email")
+            if not isinstance(record, str):
+                raise ValueError("no email field")
+            return record
+        row = next(csv.reader([line]))
+        if self.column >= len(row):
+            raise ValueError("missing email column")
+        return row[self.column]
+
+    def _header(self, line: str) -> bool:
+        """Pick the CSV email column; True if the line was a header"""
+        row = next(csv.reader([line]))
+        if row and "@" in row[0]:
+            self.column = 0
+            return False
+        column = email_column(row)
+        if column is None:
+            raise ImportFormatError("CSV header has no email column")
+        self.column = column
+        return True
+
+    def parse(self, lines: List[Tuple[int, str]], report: ImportReport) -> List[Tuple[int, str]]:
+        parsed = []
+        for number, line in lines:
+            if not line.strip():
+                continue
+            if self.format == "csv" and self.column is None and self._header(line):
+                continue
+            report.rows += 1
+            try:
+                value = self._extract(line)
+            except ValueError as error:  # includes json.JSONDecodeError
+                report.add_error(number, line, str(error))
+                continue
+            try:
+                parsed.append((number, normalize_email(value)))
+            except EmailNotValidError as error:
+                report.add_error(number, value, str(error))
+        return parsed
+
+
+@lru_cache(maxsize=None)
+def upsert_statement(dialect: str):
+    """INSERT ... ON CONFLICT (email) DO UPDATE that reactivates inactive rows, RETURNING id
+
+    Executed with a list of rows, the single-row statement compiles once
+    (and is cached), and SQLAlchemy batches the rows into multi-row VALUES
+    with RETURNING ("insertmanyvalues").
+    """
+    table = Subscriber.__table__
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    statement = insert(table)
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.email],
+        set_={
+            "is_active": True,
+            "subscribed_at": statement.excluded.subscribed_at,
+            "unsubscribed_at": None,
+            # ON CONFLICT DO UPDATE does not apply Column.onupdate
+            "updated_at": statement.excluded.updated_at,
+        },
+        where=table.c.is_active.isnot(True),
+    ).returning(table.c.id)
+
+
+async def upsert_subscribers(session: AsyncSession, emails: List[str]) -> Tuple[int, int, int]:
+    """Subscribe distinct, normalized ``emails`` in one statement; the caller commits
+
+    Returns (inserted, reactivated, already_active).
+    """
+    now = datetime.utcnow()
+    rows = [
+        {"id": uuid7(), "email": email, "is_active": True, "subscribed_at": now, "updated_at": now}
+        for email in emails
+    ]
+    supplied = {row["id"] for row in rows}
+    written = (await session.execute(upsert_statement(session.bind.dialect.name), rows)).scalars().all()
+    inserted = sum(1 for subscriber_id in written if subscriber_id in supplied)
+    await adjust(session, "subscribers", total=inserted, active=len(written))
+    return inserted, len(written) - inserted, len(emails) - len(written)
+
+
+async def _upsert(session: AsyncSession, emails: List[str], report: ImportReport) -> None:
+    inserted, reactivated, already_active = await upsert_subscribers(session, emails)
+    await session.commit()
+    report.inserted += inserted
+    report.reactivated += reactivated
+    report.already_active += already_active
+
+
+async def import_subscribers(
+    session: AsyncSession,
+    chunks: AsyncIterator[bytes],
+    format: str,
+    batch_size: Optional[int] = None,
+) -> ImportReport:
+    """Import a CSV/NDJSON byte stream, committing one batch at a time
+
+    Batches already committed stay imported if a later one fails.
+    """
+    batch_size = batch_size or settings.SUBSCRIBER_IMPORT_BATCH_SIZE
+    started = time.perf_counter()
+    report = ImportReport()
+    parser = _Parser(format)
+    seen: Set[str] = set()
+
+    async def flush(lines: List[Tuple[int, str]]) -> None:
+        parsed = await run_in_threadpool(parser.parse, lines, report)
+        fresh = []
+        for _, email in parsed:
+            if email in seen:
+                report.duplicates += 1
+                continue
+            seen.add(email)
+            fresh.append(email)
+        if fresh:
+            await _upsert(session, fresh, report)
+
+    lines: List[Tuple[int, str]] = []
+    number = 0
+    async for line in iter_lines(chunks):
+        number += 1
+        lines.append((number, line))
+        if len(lines) >= batch_size:
+            await flush(lines)
+            lines = []
+    if lines:
+        await flush(lines)
+
+    report.elapsed = round(time.perf_counter() - started, 3)
+    return report
@@ -0,0 +1,134 @@
+""" Suppressed addresses: stored, applied to subscribers and checked in memory
+
+Permanent bounces and complaints (parsed by api/utils/bounces.py) are
+ingested a batch at a time. Each batch runs in one transaction, which:
+  * adds the addresses to email_suppressions (lowercased; an address
+    already there keeps its first reason);
+  * deactivates the matching active subscribers, as an unsubscribe
+    would, and adjusts the stats counters.
+
+The newsletter sender checks every recipient against ``suppression_list``,
+an in-memory set of the suppressed addresses. The check is a hash lookup,
+and the send never queries the database for it. A Bloom filter in front
+would not make that cheaper in Python; it would only save memory, and the
+list is small next to the subscriber table. Each process loads the table
+once. It then reads only rows newer than the last load (less a small
+overlap for late commits), at most every SUPPRESSION_REFRESH_SECONDS and
+at the start of every send. That is how addresses ingested by other
+workers arrive.
+"""
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Iterable, List, Optional, Set
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from api.utils.bounces import BounceEvent
+from api.utils.entity_counters import adjust
+from api.utils.settings import settings
+from api.v1.models.models import EmailSuppression, Subscriber, SuppressionReason
+
+
+INGEST_BATCH_SIZE = 1000
+# Re-read rows this much older than the newest one loaded, in case an
+# earlier created_at committed late
+REFRESH_OVERLAP = timedelta(seconds=5)
+
+
+class SuppressionList:
+    def __init__(self):
+        self._emails: Set[str] = set()
+        self._loaded_until: Optional[datetime] = None
+        self._refreshed = 0.0
+
+    def __contains__(self, address: str) -> bool:
+        return address.lower() in self._emails
+
+    def __len__(self) -> int:
+        return len(self._emails)
+
+    def add(self, addresses: Iterable[str]) -> None:
+        self._emails.update(address.lower() for address in addresses)
+
+    async def refresh(self, session_factory, force: bool = False) -> None:
+        """Load suppressions added since the last refresh (all of them the first time)"""
+        if not force and time.monotonic() - self._refreshed < settings.SUPPRESSION_REFRESH_SECONDS:
+            return
+        self._refreshed = time.monotonic()
+        query = select(EmailSuppression.email, EmailSuppression.created_at)
+        if self._loaded_until is not None:
+            query = query.where(EmailSuppression.created_at >= self._loaded_until - REFRESH_OVERLAP)
+        async with session_factory() as session:
+            result = await session.stream(query.execution_options(yield_per=10_000))
+            async for rows in result.partitions():
+                self._emails.update(email for email, _ in rows)
+                newest = max(created_at for _, created_at in rows)
+                if self._loaded_until is None or newest > self._loaded_until:
+                    self._loaded_until = newest
+
+
+suppression_list = SuppressionList()
+
+
+@dataclass
+class IngestReport:
+    events: int = 0
+    bounces: int = 0
+    complaints: int = 0
+    transient: int = 0
+    suppressed: int = 0  # distinct addresses
+    deactivated: int = 0
+
+
+@lru_cache(maxsize=None)
+def _suppress_statement(dialect: str):
+    dialect_insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    return dialect_insert(EmailSuppression.__table__).on_conflict_do_nothing(index_elements=["email"])
+
+
+async def ingest(session, events: List[BounceEvent], batch_size: int = INGEST_BATCH_SIZE) -> IngestReport:
+    """Suppress and deactivate the addresses of ``events``, committing per batch"""
+    report = IngestReport(events=len(events))
+    suppress = {}
+    for event in events:
+        if not event.suppresses:
+            report.transient += 1
+            continue
+        if event.kind == "complaint":
+            report.complaints += 1
+        else:
+            report.bounces += 1
+        key = event.email.lower()
+        # A complaint outranks a bounce for the same address
+        if key not in suppress or event.kind == "complaint":
+            suppress[key] = event
+    report.suppressed = len(suppress)
+
+    addresses = list(suppress)
+    for start in range(0, len(addresses), batch_size):
+        batch = addresses[start:start + batch_size]
+        now = datetime.utcnow()
+        await session.execute(_suppress_statement(session.bind.dialect.name), [
+            {
+                "email": address,
+                "reason": SuppressionReason.COMPLAINT if suppress[address].kind == "complaint" else SuppressionReason.BOUNCE,
+                "detail": suppress[address].detail or None,
+                "created_at": now,
+            }
+            for address in batch
+        ])
+        # Stored addresses keep the case they were subscribed with
+        result = await session.execute(
+            update(Subscriber)
+            .where(func.lower(Subscriber.email).in_(batch), Subscriber.is_active == True)
+            .values(is_active=False, unsubscribed_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        await adjust(session, "subscribers", active=-result.rowcount)
+        await session.commit()
+        report.deactivated += result.rowcount
+        suppression_list.add(batch)
+    return report
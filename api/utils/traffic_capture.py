@@ -0,0 +1,175 @@
+""" Opt-in, redacted capture of live traffic for benchmarks/replay.py
+
+With TRAFFIC_CAPTURE_FILE set, every HTTP request appends one compact JSON
+line to that file:
+
+    {"t": 1760000000.123, "m": "POST", "r": "/api/v1/subscribers/",
+     "p": {}, "q": {}, "b": {"email": "email"}, "c": "json", "a": 0,
+     "s": 200, "d": 12.4, "n": 58}
+
+t is the wall-clock start, m/r the method and route template, p/q the path
+and query parameters, b and c the body shape and kind, a whether an
+Authorization header was sent, s the status, d the duration in ms and n the
+response size.
+
+Nothing identifying is kept. Strings become shapes such as "uuid", "email"
+or "str:12". JSON numbers and booleans are kept, as are numeric and short
+token query values like ``limit=50`` or ``format=csv``, because they change
+what the server does. Only JSON bodies and
+multipart field names, file types and sizes are inspected. Header values,
+cookies and client addresses are never written. Lines are appended with
+one write(2) each to a file opened O_APPEND, so the workers of serve.py can
+share one file.
+"""
+import json
+import os
+import re
+import time
+from typing import Optional
+from urllib.parse import parse_qsl
+
+from api.utils.metrics import get_route_template
+
+
+MAX_BODY_BYTES = 64 * 1024
+_UUID = re.compile(r"^[0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{12}$")
+_NUMBER = re.compile(r"^-?\d+(\.\d+)?$")
+_TOKEN = re.compile(r"^[a-z_]{1,16}$")  # enum-like values: csv, ndjson, true, pending
+_PART_HEADERS = re.compile(rb'name="([^"]*)"(?:; filename="([^"]*)")?', re.I)
+
+
+def string_shape(value: str, keep_literals: bool = False) -> str:
+    """Redact a string to a shape that still lets a replay build a similar value
+
+    ``keep_literals`` keeps numbers and short lowercase tokens verbatim; it is
+    only used for query parameters (limit=50, format=csv), never for bodies,
+    where digit strings are phone numbers and references.
+    """
+    if _UUID.match(value):
+        return "uuid"
+    if "@" in value:
+        return "email"
+    if keep_literals and (_NUMBER.match(value) or _TOKEN.match(value)):
+        return value
+    return f"str:{len(value)}"
+
+
+def json_shape(value):
+    if isinstance(value, dict):
+        return {key: json_shape(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [json_shape(value[0])] * len(value) if value else []
+    if isinstance(value, str):
+        return string_shape(value)
+    return value  # numbers, booleans, null
+
+
+def multipart_shape(body: bytes, content_type: str, total_size: int):
+    boundary = content_type.partition("boundary=")[2].strip('"').encode()
+    shape = {}
+    if not boundary:
+        return shape
+    for part in body.split(b"--" + boundary)[1:]:
+        head, _, value = part.partition(b"\r\n\r\n")
+        match = _PART_HEADERS.search(head)
+        if not match:
+            continue
+        name = match.group(1).decode("latin-1")
+        if match.group(2) is not None:
+            part_type = re.search(rb"content-type:\s*([^\r\n]+)", head, re.I)
+            # a truncated body only gives a lower bound; fall back to the request size
+            size = len(value) - 2 if value.endswith(b"\r\n") else total_size
+            shape[name] = {"file": part_type.group(1).decode("latin-1") if part_type else "", "size": size}
+        else:
+            shape[name] = string_shape(value.rstrip(b"\r\n").decode("utf-8", "replace"))
+    return shape
+
+
+def body_shape(body: bytes, content_type: str, total_size: int):
+    """Return (kind, shape) for a request body"""
+    if not total_size:
+        return None, None
+    if content_type.startswith("application/json"):
+        try:
+            return "json", json_shape(json.loads(body))
+        except ValueError:
+            return "json", None
+    if content_type.startswith("multipart/form-data"):
+        return "multipart", multipart_shape(body, content_type, total_size)
+    return "raw", {"type": content_type, "size": total_size}
+
+
+class TrafficCaptureMiddleware:
+    """Pure ASGI middleware appending a redacted record of each request"""
+
+    def __init__(self, app, path: str, max_body: int = MAX_BODY_BYTES):
+        self.app = app
+        self.path = path
+        self.max_body = max_body
+        self._fd: Optional[int] = None
+        self._pid: Optional[int] = None
+
+    def _write(self, record: dict) -> None:
+        if self._fd is None or self._pid != os.getpid():
+            # Open lazily in each (forked) worker
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            self._pid = os.getpid()
+        os.write(self._fd, (json.dumps(record, separators=(",", ":")) + "\n").encode())
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        chunks = []
+        captured = 0
+        received = 0
+        status_code = 500
+        response_size = 0
+
+        async def receive_wrapper():
+            nonlocal captured, received
+            message = await receive()
+            if message["type"] == "http.request":
+                chunk = message.get("body", b"")
+                received += len(chunk)
+                if captured < self.max_body:
+                    chunks.append(chunk[: self.max_body - captured])
+                    captured += len(chunks[-1])
+            return message
+
+        async def send_wrapper(message):
+            nonlocal status_code, response_size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
+            await send(message)
+
+        started = time.time()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            headers = dict(scope["headers"])
+            content_type = headers.get(b"content-type", b"").decode("latin-1").lower()
+            kind, shape = body_shape(b"".join(chunks), content_type, received)
+            query = parse_qsl(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True)
+            record = {
+                "t": round(started, 4),
+                "m": scope["method"],
+                "r": get_route_template(scope),
+                "p": {key: string_shape(str(value)) for key, value in scope.get("path_params", {}).items()},
+                "q": {key: string_shape(value, keep_literals=True) for key, value in query},
+                "b": shape,
+                "c": kind,
+                "a": int(b"authorization" in headers),
+                "s": status_code,
+                "d": round(duration * 1000, 2),
+                "n": response_size,
+            }
+            try:
+                self._write(record)
+            except OSError:
+                pass  # capture is best effort and must never fail a request
@@ -1 +1 @@
-from api.v1.models.models import UserRole, DonationStatus, NewsletterStatus, Donation, Admin,  Subscriber, Newsletter, EmailTemplate, Volunteer, Subscriber, Donor
+from api.v1.models.models import UserRole, DonationStatus, NewsletterStatus, DeliveryStatus, SuppressionReason, Donation, Admin,  Subscriber, Newsletter, NewsletterDelivery, EmailSuppression, EmailTemplate, Volunteer, Subscriber, Donor, EntityCounter
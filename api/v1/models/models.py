@@ -1,14 +1,25 @@
 # models.py
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text, ForeignKey, Enum as SQLEnum
+from sqlalchemy import Column, BigInteger, Integer, String, Float, DateTime, Boolean, Text, ForeignKey, Index, Enum as SQLEnum, func
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.ext.compiler import compiles
 from datetime import datetime
 from enum import Enum
-import uuid
+
+from api.utils.uuid7 import uuid7
 
 Base = declarative_base()
 
+
+@compiles(UUID, "sqlite")
+def compile_uuid_sqlite(type_, compiler, **kw):
+    # A column declared "UUID" gets NUMERIC affinity in SQLite, which turns
+    # hex ids made only of digits and one "e" into floats; declare text instead.
+    # Tables created before this are rebuilt by migration a6c2e9f4b1d7.
+    return "CHAR(32)"
+
+
 class UserRole(str, Enum):
     SUPERADMIN = "superadmin"
     ADMIN = "admin"
@@ -23,10 +34,20 @@ class NewsletterStatus(str, Enum):
     SENT = "sent"
     SCHEDULED = "scheduled"
 
+class DeliveryStatus(str, Enum):
+    QUEUED = "queued"
+    SENT = "sent"
+    DEFERRED = "deferred"
+    BOUNCED = "bounced"
+
+class SuppressionReason(str, Enum):
+    BOUNCE = "bounce"
+    COMPLAINT = "complaint"
+
 class Admin(Base):
     __tablename__ = "admins"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     email = Column(String, unique=True, index=True, nullable=False)
     full_name = Column(String, nullable=False)
     hashed_password = Column(String, nullable=False)
@@ -38,7 +59,7 @@ class Admin(Base):
 # class Initiative(Base):
 #     __tablename__ = "initiatives"
 
-#     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
+#     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
 #     title = Column(String, nullable=False)
 #     description = Column(Text)
 #     little_description = Column(String)
@@ -56,7 +77,7 @@ class Admin(Base):
 class Donation(Base):
     __tablename__ = "donations"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     title = Column(String, nullable=False)
     donor_name = Column(String, nullable=False)
     donor_email = Column(String, nullable=False)
@@ -74,16 +95,25 @@ class Donation(Base):
 class Subscriber(Base):
     __tablename__ = "subscribers"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     email = Column(String, unique=True, index=True, nullable=False)
     is_active = Column(Boolean, default=True)
     subscribed_at = Column(DateTime, default=datetime.utcnow)
     unsubscribed_at = Column(DateTime)
+    # Last change, for delta exports (see api/utils/subscriber_export.py);
+    # ON CONFLICT upserts set it explicitly
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_subscribers_updated_at_id", "updated_at", "id"),
+        # Bounce reports may spell an address in another case
+        Index("ix_subscribers_email_lower", func.lower(email)),
+    )
 
 class Newsletter(Base):
     __tablename__ = "newsletters"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     subject = Column(String, nullable=False)
     content = Column(Text, nullable=False)
     html_content = Column(Text)
@@ -92,14 +122,52 @@ class Newsletter(Base):
     sent_at = Column(DateTime)
     created_by = Column(UUID(as_uuid=True), ForeignKey("admins.id"))
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Send lease (see api/utils/newsletter_scheduler.py)
+    lease_owner = Column(String)
+    lease_expires_at = Column(DateTime)
+    # Delivery progress, maintained with the ledger (see api/utils/delivery_ledger.py)
+    queued_count = Column(Integer, nullable=False, default=0, server_default="0")
+    sent_count = Column(Integer, nullable=False, default=0, server_default="0")
+    deferred_count = Column(Integer, nullable=False, default=0, server_default="0")
+    bounced_count = Column(Integer, nullable=False, default=0, server_default="0")
+    # Last subscriber id added to the ledger; a resumed send continues after it
+    checkpoint_subscriber_id = Column(UUID(as_uuid=True))
 
     # Relationship
     creator = relationship("Admin")
 
+    __table_args__ = (
+        Index("ix_newsletters_status_scheduled_at", "status", "scheduled_at"),
+    )
+
+class NewsletterDelivery(Base):
+    __tablename__ = "newsletter_deliveries"
+
+    newsletter_id = Column(UUID(as_uuid=True), ForeignKey("newsletters.id", ondelete="CASCADE"), primary_key=True)
+    subscriber_id = Column(UUID(as_uuid=True), primary_key=True)
+    email = Column(String, nullable=False)
+    status = Column(SQLEnum(DeliveryStatus), nullable=False, default=DeliveryStatus.QUEUED)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_reply = Column(String)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_newsletter_deliveries_newsletter_status", "newsletter_id", "status"),
+    )
+
+class EmailSuppression(Base):
+    """Addresses never to mail again (see api/utils/suppression.py)"""
+    __tablename__ = "email_suppressions"
+
+    email = Column(String, primary_key=True)  # lowercased
+    reason = Column(SQLEnum(SuppressionReason), nullable=False)
+    detail = Column(String)  # DSN status or provider diagnostic
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
 class EmailTemplate(Base):
     __tablename__ = "email_templates"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     name = Column(String, unique=True, nullable=False)
     subject = Column(String, nullable=False)
     html_content = Column(Text, nullable=False)
@@ -112,7 +180,7 @@ class EmailTemplate(Base):
 class Volunteer(Base):
     __tablename__ = "volunteers"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     full_name = Column(String, nullable=False)
     email = Column(String, unique=True, index=True, nullable=False)
     phone = Column(String, nullable=True)
@@ -123,9 +191,20 @@ class Volunteer(Base):
 class Donor(Base):
     __tablename__ = "donors"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     full_name = Column(String, nullable=False)
     email = Column(String, unique=True, index=True, nullable=False)
     phone = Column(String, nullable=True)
     is_active = Column(Boolean, default=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class EntityCounter(Base):
+    """Row counts kept with every write (see api/utils/entity_counters.py)"""
+    __tablename__ = "entity_counters"
+
+    name = Column(String, primary_key=True)  # table name
+    shard = Column(Integer, primary_key=True)
+    total = Column(BigInteger, nullable=False, default=0)
+    active = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
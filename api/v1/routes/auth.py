@@ -4,14 +4,17 @@ import uuid
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import HTTPException, status, Depends, APIRouter, Response, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel, EmailStr
 import os
 
 from api.v1.models.models import Admin, UserRole
 from api.db.database import get_db
 from api.utils.success_response import success_response
+from api.utils.uuid7 import uuid7
 
 # Pydantic models
 class LoginRequest(BaseModel):
@@ -155,9 +158,9 @@ def create_token_response(user: Admin, include_refresh: bool = True) -> dict:
     return response_data
 
 # Dependencies
-def get_current_user(
+async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> Admin:
     """Get current authenticated user"""
     if not credentials:
@@ -172,7 +175,7 @@ def get_current_user(
     email = payload.get("sub")
     
     # Get user from database
-    user = db.query(Admin).filter(Admin.email == email).first()
+    user = await db.scalar(select(Admin).where(Admin.email == email))
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -187,7 +190,7 @@ def get_current_user(
     
     return user
 
-def get_current_superadmin(current_user: Admin = Depends(get_current_user)) -> Admin:
+async def get_current_superadmin(current_user: Admin = Depends(get_current_user)) -> Admin:
     """Ensure current user is superadmin"""
     if current_user.role != UserRole.SUPERADMIN:
         raise HTTPException(
@@ -196,7 +199,7 @@ def get_current_superadmin(current_user: Admin = Depends(get_current_user)) -> A
         )
     return current_user
 
-def get_current_admin_or_superadmin(current_user: Admin = Depends(get_current_user)) -> Admin:
+async def get_current_admin_or_superadmin(current_user: Admin = Depends(get_current_user)) -> Admin:
     """Ensure current user is admin or superadmin"""
     if current_user.role not in [UserRole.ADMIN, UserRole.SUPERADMIN]:
         raise HTTPException(
@@ -205,14 +208,31 @@ def get_current_admin_or_superadmin(current_user: Admin = Depends(get_current_us
         )
     return current_user
 
+async def check_new_admin(db: AsyncSession, email: str, superadmin: bool = False) -> None:
+    """Reject an admin that already exists (or a second superadmin)"""
+    if superadmin and await db.scalar(select(Admin.id).where(Admin.role == UserRole.SUPERADMIN)):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Superadmin already exists. Use /register endpoint instead."
+        )
+    if await db.scalar(select(Admin.id).where(Admin.email == email)):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email already registered"
+        )
+
 # Authentication Routes - Simplified (No Refresh Token)
 @router.post("/login", response_model=dict)
-async def login(login_data: LoginRequest, db: Session = Depends(get_db)):
+async def login(login_data: LoginRequest, db: AsyncSession = Depends(get_db)):
     """Login endpoint - returns only access token"""
     # Find user
-    user = db.query(Admin).filter(Admin.email == login_data.email).first()
+    user = await db.scalar(select(Admin).where(Admin.email == login_data.email))
+    # End the read transaction so the connection (on SQLite, the single
+    # writer connection) isn't held while bcrypt runs
+    await db.commit()
     
-    if not user or not verify_password(login_data.password, user.hashed_password):
+    # bcrypt is deliberately slow; keep it off the event loop
+    if not user or not await run_in_threadpool(verify_password, login_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password"
@@ -226,7 +246,7 @@ async def login(login_data: LoginRequest, db: Session = Depends(get_db)):
     
     # Update last login
     user.last_login = datetime.utcnow()
-    db.commit()
+    await db.commit()
     
     # Create token response (access token only)
     token_data = create_token_response(user, include_refresh=False)
@@ -240,22 +260,20 @@ async def login(login_data: LoginRequest, db: Session = Depends(get_db)):
 @router.post("/register", response_model=dict)
 async def register(
     register_data: RegisterRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: Admin = Depends(get_current_superadmin)
 ):
     """Register new admin - returns tokens for the new user"""
     # Check if user already exists
-    existing_user = db.query(Admin).filter(Admin.email == register_data.email).first()
-    if existing_user:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email already registered"
-        )
+    await check_new_admin(db, register_data.email)
+    # Don't hold the connection (on SQLite, the writer) while bcrypt runs
+    await db.commit()
+    hashed_password = await run_in_threadpool(get_password_hash, register_data.password)
     
-    # Create new admin
-    hashed_password = get_password_hash(register_data.password)
+    # Check again in the write transaction, then create the new admin
+    await check_new_admin(db, register_data.email)
     new_user = Admin(
-        id=uuid.uuid4(),
+        id=uuid7(),
         email=register_data.email,
         hashed_password=hashed_password,
         full_name=f"{register_data.first_name} {register_data.last_name}",
@@ -265,8 +283,8 @@ async def register(
     )
     
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     
     # Create token response for the new user (access token only)
     token_data = create_token_response(new_user, include_refresh=False)
@@ -320,29 +338,19 @@ async def verify_user_token(current_user: Admin = Depends(get_current_user)):
 async def create_superadmin(
     register_data: RegisterRequest,
     response: Response,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Create the first superadmin - returns tokens"""
-    # Check if any superadmin already exists
-    existing_superadmin = db.query(Admin).filter(Admin.role == UserRole.SUPERADMIN).first()
-    if existing_superadmin:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Superadmin already exists. Use /register endpoint instead."
-        )
-    
-    # Check if user already exists
-    existing_user = db.query(Admin).filter(Admin.email == register_data.email).first()
-    if existing_user:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email already registered"
-        )
-    
-    # Create the superadmin
-    hashed_password = get_password_hash(register_data.password)
+    # Check if any superadmin or this user already exists
+    await check_new_admin(db, register_data.email, superadmin=True)
+    # Don't hold the connection (on SQLite, the writer) while bcrypt runs
+    await db.commit()
+    hashed_password = await run_in_threadpool(get_password_hash, register_data.password)
+    
+    # Check again in the write transaction, then create the superadmin
+    await check_new_admin(db, register_data.email, superadmin=True)
     new_superadmin = Admin(
-        id=uuid.uuid4(),
+        id=uuid7(),
         email=register_data.email,
         hashed_password=hashed_password,
         full_name=f"{register_data.first_name} {register_data.last_name}",
@@ -352,8 +360,8 @@ async def create_superadmin(
     )
     
     db.add(new_superadmin)
-    db.commit()
-    db.refresh(new_superadmin)
+    await db.commit()
+    await db.refresh(new_superadmin)
     
     # Create token response
     token_data = create_token_response(new_superadmin, include_refresh=True)
@@ -378,11 +386,11 @@ async def create_superadmin(
 # Admin Management Routes (All return tokens in response)
 @router.get("/admins", response_model=dict)
 async def get_all_admins(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: Admin = Depends(get_current_superadmin)
 ):
     """Get all admin users with fresh token"""
-    admins = db.query(Admin).all()
+    admins = (await db.scalars(select(Admin))).all()
     admin_list = [{
         "id": str(admin.id),
         "email": admin.email,
@@ -407,7 +415,7 @@ async def get_all_admins(
 @router.patch("/admins/{admin_id}/toggle-status", response_model=dict)
 async def toggle_admin_status(
     admin_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: Admin = Depends(get_current_superadmin)
 ):
     """Toggle admin active status with fresh token"""
@@ -419,7 +427,7 @@ async def toggle_admin_status(
             detail="Invalid admin ID format"
         )
     
-    admin = db.query(Admin).filter(Admin.id == admin_uuid).first()
+    admin = await db.get(Admin, admin_uuid)
     if not admin:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -433,7 +441,7 @@ async def toggle_admin_status(
         )
     
     admin.is_active = not admin.is_active
-    db.commit()
+    await db.commit()
     
     # Include fresh token in response
     token_data = create_token_response(current_user, include_refresh=False)
@@ -454,7 +462,7 @@ async def toggle_admin_status(
 @router.delete("/admins/{admin_id}", response_model=dict)
 async def delete_admin(
     admin_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: Admin = Depends(get_current_superadmin)
 ):
     """Delete admin user with fresh token"""
@@ -466,7 +474,7 @@ async def delete_admin(
             detail="Invalid admin ID format"
         )
     
-    admin = db.query(Admin).filter(Admin.id == admin_uuid).first()
+    admin = await db.get(Admin, admin_uuid)
     if not admin:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -479,8 +487,8 @@ async def delete_admin(
             detail="Cannot delete your own account"
         )
     
-    db.delete(admin)
-    db.commit()
+    await db.delete(admin)
+    await db.commit()
     
     # Include fresh token in response
     token_data = create_token_response(current_user, include_refresh=False)
@@ -1,8 +1,8 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
-from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File, Form
-from fastapi.responses import JSONResponse, FileResponse
-from sqlalchemy.orm import Session
+from sqlalchemy import desc, func, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File, Form, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
 from typing import Optional, List
 from uuid import UUID
 import uuid
@@ -16,7 +16,8 @@ import uuid
 import shutil
 from pathlib import Path
 
-from api.db.database import get_db
+from api.db.database import get_db, AsyncReadSessionLocal
+from api.db.partitions import EXPORT_COLUMNS, detached_partitions, detached_table, iter_archived
 from api.v1.schemas.donation import (
     DonationCreate,
     DonationUpdate,
@@ -27,62 +28,79 @@ from api.v1.schemas.donation import (
 
 # Import settings to use proper configuration
 from api.utils.settings import settings
-
-import cloudinary
-import cloudinary.uploader
-from cloudinary.utils import cloudinary_url
-
-# Configure Cloudinary using settings
-cloudinary.config(
-    cloud_name=settings.CLOUDINARY_CLOUD_NAME,
-    api_key=settings.CLOUDINARY_API_KEY,
-    api_secret=settings.CLOUDINARY_API_SECRET
-)
+from api.utils.change_tracker import check_not_modified
+from api.utils.uuid7 import uuid7
+from api.v1.routes.auth import get_current_admin_or_superadmin
+
+from functools import lru_cache
+from datetime import datetime
+from enum import Enum
+import csv
+import io
+import itertools
+import json
 
 router = APIRouter()
 
-# Ensure upload directory exists
+# Local media directory; created once at application startup (see main.py)
 UPLOAD_DIR = Path("./media")
-UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
-print(f"Upload directory exists: {UPLOAD_DIR.exists()}")
-print(f"Files in directory: {list(UPLOAD_DIR.glob('*')) if UPLOAD_DIR.exists() else 'Directory not found'}")
 
-# Debug: Print Cloudinary configuration (remove in production)
-print(f"Cloudinary Config - Cloud Name: {settings.CLOUDINARY_CLOUD_NAME}")
-print(f"Cloudinary Config - API Key: {settings.CLOUDINARY_API_KEY[:8]}..." if settings.CLOUDINARY_API_KEY else "API Key: None")
-print(f"Cloudinary Config - API Secret: {'Set' if settings.CLOUDINARY_API_SECRET else 'Not Set'}")
+@lru_cache(maxsize=None)
+def get_cloudinary_uploader():
+    """Import and configure Cloudinary on first upload instead of at import time"""
+    import cloudinary
+    import cloudinary.uploader
 
-def get_donation(db: Session, donation_id: UUID) -> Optional[Donation]:
+    cloudinary.config(
+        cloud_name=settings.CLOUDINARY_CLOUD_NAME,
+        api_key=settings.CLOUDINARY_API_KEY,
+        api_secret=settings.CLOUDINARY_API_SECRET
+    )
+    return cloudinary.uploader
+
+def store_receipt_locally(file, public_id: str, filename: Optional[str]) -> dict:
+    """Stand-in for the Cloudinary upload (RECEIPT_STORAGE=local), same result keys"""
+    destination = UPLOAD_DIR / f"{public_id}{Path(filename or '').suffix.lower()}"
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    with open(destination, "wb") as out:
+        shutil.copyfileobj(file, out)
+    return {
+        "secure_url": f"{settings.APP_URL.rstrip('/')}/media/{destination.relative_to(UPLOAD_DIR).as_posix()}",
+        "public_id": public_id,
+    }
+
+async def get_donation(db: AsyncSession, donation_id: UUID) -> Optional[Donation]:
     """Get a single donation by ID"""
-    return db.query(Donation).filter(Donation.id == donation_id).first()
+    return await db.get(Donation, donation_id)
 
-def get_donations(
-    db: Session,
+async def get_donations(
+    db: AsyncSession,
     skip: int = 0,
     limit: int = 100,
     title: Optional[str] = None
 ) -> List[Donation]:
     """Get multiple donations with optional filtering by title"""
-    query = db.query(Donation)
+    query = select(Donation)
 
     if title:
-        query = query.filter(Donation.title == title)
+        query = query.where(Donation.title == title)
 
-    return query.order_by(desc(Donation.created_at)).offset(skip).limit(limit).all()
+    result = await db.scalars(query.order_by(desc(Donation.created_at)).offset(skip).limit(limit))
+    return result.all()
 
-def count_donations(db: Session, title: Optional[str] = None) -> int:
+async def count_donations(db: AsyncSession, title: Optional[str] = None) -> int:
     """Count total donations"""
-    query = db.query(Donation)
+    query = select(func.count()).select_from(Donation)
 
     if title:
-        query = query.filter(Donation.title == title)
+        query = query.where(Donation.title == title)
 
-    return query.count()
+    return await db.scalar(query)
 
-def create_donation(db: Session, donation: DonationCreate) -> Donation:
+async def create_donation(db: AsyncSession, donation: DonationCreate) -> Donation:
     """Create a new donation"""
     db_donation = Donation(
-        id=uuid.uuid4(),
+        id=uuid7(),
         title=donation.title,
         donor_name=donation.donor_name,
         donor_email=donation.donor_email,
@@ -94,15 +112,15 @@ def create_donation(db: Session, donation: DonationCreate) -> Donation:
     )
 
     db.add(db_donation)
-    db.commit()
-    db.refresh(db_donation)
+    await db.commit()
+    await db.refresh(db_donation)
 
     return db_donation
 
-def create_donation_from_frontend(db: Session, donation: FrontendDonationCreate) -> Donation:
+async def create_donation_from_frontend(db: AsyncSession, donation: FrontendDonationCreate) -> Donation:
     """Create donation from frontend data"""
     db_donation = Donation(
-        id=uuid.uuid4(),
+        id=uuid7(),
         title=donation.title,
         donor_name=donation.donor_name,
         donor_email=donation.donor_email,
@@ -114,14 +132,14 @@ def create_donation_from_frontend(db: Session, donation: FrontendDonationCreate)
     )
 
     db.add(db_donation)
-    db.commit()
-    db.refresh(db_donation)
+    await db.commit()
+    await db.refresh(db_donation)
 
     return db_donation
 
-def update_donation(db: Session, donation_id: UUID, donation_update: DonationUpdate) -> Optional[Donation]:
+async def update_donation(db: AsyncSession, donation_id: UUID, donation_update: DonationUpdate) -> Optional[Donation]:
     """Update a donation"""
-    db_donation = get_donation(db, donation_id)
+    db_donation = await get_donation(db, donation_id)
     if not db_donation:
         return None
 
@@ -130,45 +148,55 @@ def update_donation(db: Session, donation_id: UUID, donation_update: DonationUpd
     for field, value in update_data.items():
         setattr(db_donation, field, value)
 
-    db.commit()
-    db.refresh(db_donation)
+    await db.commit()
+    await db.refresh(db_donation)
     return db_donation
 
-def delete_donation(db: Session, donation_id: UUID) -> bool:
+async def delete_donation(db: AsyncSession, donation_id: UUID) -> bool:
     """Delete a donation"""
-    db_donation = get_donation(db, donation_id)
+    db_donation = await get_donation(db, donation_id)
     if not db_donation:
         return False
 
-    db.delete(db_donation)
-    db.commit()
+    await db.delete(db_donation)
+    await db.commit()
     return True
 
-def get_donations_by_email(db: Session, email: str) -> List[Donation]:
+async def get_donations_by_email(db: AsyncSession, email: str) -> List[Donation]:
     """Get all donations by donor email"""
-    return db.query(Donation).filter(Donation.donor_email == email).order_by(desc(Donation.created_at)).all()
+    result = await db.scalars(
+        select(Donation).where(Donation.donor_email == email).order_by(desc(Donation.created_at))
+    )
+    return result.all()
 
-def get_total_donated_amount(db: Session, title: Optional[str] = None) -> float:
+async def get_total_donated_amount(db: AsyncSession, title: Optional[str] = None) -> float:
     """Get total amount donated"""
-    query = db.query(Donation).filter(Donation.status == DonationStatus.COMPLETED)
+    query = select(func.coalesce(func.sum(Donation.amount), 0.0)).where(
+        Donation.status == DonationStatus.COMPLETED
+    )
 
     if title:
-        query = query.filter(Donation.title == title)
+        query = query.where(Donation.title == title)
 
-    donations = query.all()
-    return sum(donation.amount for donation in donations)
+    return await db.scalar(query)
 
 @router.get("/", response_model=DonationListResponse)
 async def get_donations_endpoint(
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
     skip: int = Query(0, ge=0, description="Number of donations to skip"),
     limit: int = Query(100, ge=1, le=1000, description="Number of donations to return"),
     title: Optional[str] = Query(None, description="Filter by donation title")
 ):
     """Get all donations with pagination and optional filtering"""
+    not_modified = check_not_modified(request, response, "donations")
+    if not_modified:
+        return not_modified
+
     try:
-        donations = get_donations(db, skip=skip, limit=limit, title=title)
-        total = count_donations(db, title=title)
+        donations = await get_donations(db, skip=skip, limit=limit, title=title)
+        total = await count_donations(db, title=title)
 
         return DonationListResponse(
             donations=donations,
@@ -179,10 +207,93 @@ async def get_donations_endpoint(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving donations: {str(e)}")
 
+EXPORT_BATCH_SIZE = 1000
+EXPORT_MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+def _export_value(value):
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    return value
+
+def _encode_export_rows(rows, format: str) -> str:
+    if format == "ndjson":
+        return "".join(
+            json.dumps({name: _export_value(row[name]) for name in EXPORT_COLUMNS}) + "\n"
+            for row in rows
+        )
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(_export_value(row[name]) for name in EXPORT_COLUMNS)
+    return buffer.getvalue()
+
+async def stream_donations_export(
+    format: str,
+    start: Optional[datetime],
+    end: Optional[datetime],
+    include_archived: bool
+):
+    """Archived months (oldest) first, then live and detached rows, both in created_at order"""
+    if format == "csv":
+        yield ",".join(EXPORT_COLUMNS) + "\r\n"
+
+    if include_archived:
+        archived = iter_archived(start, end)
+        while True:
+            # Reading gzip files blocks; pull each batch in the threadpool
+            batch = await run_in_threadpool(list, itertools.islice(archived, EXPORT_BATCH_SIZE))
+            if not batch:
+                break
+            yield _encode_export_rows(batch, format)
+
+    def rows_of(table):
+        query = select(*(table.c[name] for name in EXPORT_COLUMNS))
+        if start:
+            query = query.where(table.c.created_at >= start)
+        if end:
+            query = query.where(table.c.created_at < end)
+        return query
+
+    # The request's session is closed once the endpoint returns, before the
+    # body is streamed, so the export reads through its own session
+    async with AsyncReadSessionLocal() as session:
+        tables = [Donation.__table__]
+        if include_archived and session.bind.dialect.name == "postgresql":
+            # Months detached with `python -m api.db.partitions detach`
+            detached = await session.run_sync(lambda sync: detached_partitions(sync.connection()))
+            tables += [detached_table(name) for _, name in detached]
+        if len(tables) == 1:
+            query = rows_of(Donation.__table__).order_by(Donation.created_at, Donation.id)
+        else:
+            query = union_all(*(rows_of(table) for table in tables))
+            query = query.order_by(query.selected_columns.created_at, query.selected_columns.id)
+        result = await session.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        async for batch in result.mappings().partitions():
+            yield _encode_export_rows(batch, format)
+
+@router.get("/export")
+async def export_donations_endpoint(
+    format: str = Query("csv", pattern="^(csv|ndjson)$", description="csv or ndjson"),
+    start: Optional[datetime] = Query(None, description="Only donations created at or after this time"),
+    end: Optional[datetime] = Query(None, description="Only donations created before this time"),
+    include_archived: bool = Query(True, description="Include archived and detached months"),
+    current_user = Depends(get_current_admin_or_superadmin)
+):
+    """Stream donations as CSV or NDJSON, including archived and detached partitions"""
+    return StreamingResponse(
+        stream_donations_export(format, start, end, include_archived),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="donations.{format}"'}
+    )
+
 @router.post("/donations", response_model=DonationResponse)
 async def create_donation_endpoint(
     donation: FrontendDonationCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Create a new donation (Frontend compatible)"""
     try:
@@ -191,7 +302,7 @@ async def create_donation_endpoint(
             raise HTTPException(status_code=400, detail="Donation amount must be greater than 0")
 
         # Create donation
-        db_donation = create_donation_from_frontend(db, donation)
+        db_donation = await create_donation_from_frontend(db, donation)
 
         return DonationResponse(
             id=db_donation.id,
@@ -215,13 +326,13 @@ async def create_donation_endpoint(
 async def upload_receipt(
     receipt: UploadFile = File(...),
     donation_id: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Upload payment receipt for a donation using Cloudinary"""
 
     try:
         # Debug: Check if Cloudinary credentials are available
-        if not all([settings.CLOUDINARY_CLOUD_NAME, settings.CLOUDINARY_API_KEY, settings.CLOUDINARY_API_SECRET]):
+        if settings.RECEIPT_STORAGE == "cloudinary" and not all([settings.CLOUDINARY_CLOUD_NAME, settings.CLOUDINARY_API_KEY, settings.CLOUDINARY_API_SECRET]):
             print("Missing Cloudinary credentials:")
             print(f"Cloud Name: {'Set' if settings.CLOUDINARY_CLOUD_NAME else 'Missing'}")
             print(f"API Key: {'Set' if settings.CLOUDINARY_API_KEY else 'Missing'}")
@@ -247,7 +358,7 @@ async def upload_receipt(
         # Get donation to retrieve title
         try:
             donation_uuid = UUID(donation_id)
-            db_donation = get_donation(db, donation_uuid)
+            db_donation = await get_donation(db, donation_uuid)
             if not db_donation:
                 raise HTTPException(status_code=404, detail="Donation not found")
 
@@ -255,6 +366,10 @@ async def upload_receipt(
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid donation ID format")
 
+        # End the read transaction so the connection (on SQLite, the single
+        # writer connection) isn't held for the length of the upload
+        await db.commit()
+
         # Generate unique public_id for Cloudinary
         unique_id = str(uuid.uuid4())
         public_id = f"receipts/{donation_title}_{unique_id}"
@@ -269,23 +384,30 @@ async def upload_receipt(
             print(f"Resource type: {resource_type}")
             print(f"Public ID: {public_id}")
             
-            # Upload to Cloudinary with proper parameters
-            upload_result = cloudinary.uploader.upload(
-                receipt.file,
-                public_id=public_id,
-                folder="donation_receipts",
-                resource_type=resource_type,
-                overwrite=True,
-                # Add file format handling for images
-                **({"quality": "auto", "fetch_format": "auto"} if resource_type == "image" else {})
-            )
+            if settings.RECEIPT_STORAGE == "local":
+                upload_result = await run_in_threadpool(
+                    store_receipt_locally, receipt.file, public_id, receipt.filename
+                )
+            else:
+                # Upload to Cloudinary with proper parameters
+                # The Cloudinary SDK is blocking; run it off the event loop
+                upload_result = await run_in_threadpool(
+                    get_cloudinary_uploader().upload,
+                    receipt.file,
+                    public_id=public_id,
+                    folder="donation_receipts",
+                    resource_type=resource_type,
+                    overwrite=True,
+                    # Add file format handling for images
+                    **({"quality": "auto", "fetch_format": "auto"} if resource_type == "image" else {})
+                )
 
             # Get the secure URL
             receipt_url = upload_result['secure_url']
 
             # Update database with Cloudinary URL
             db_donation.payment_reference = receipt_url
-            db.commit()
+            await db.commit()
 
             return JSONResponse(
                 status_code=200,
@@ -299,7 +421,7 @@ async def upload_receipt(
             )
 
         except Exception as upload_error:
-            db.rollback()
+            await db.rollback()
             print(f"Cloudinary upload error: {upload_error}")
             raise HTTPException(
                 status_code=500,
@@ -334,10 +456,10 @@ async def serve_uploaded_file_with_mime(filename: str):
     )
 
 @router.get("/{donation_id}", response_model=DonationResponse)
-async def get_donation_endpoint(donation_id: UUID, db: Session = Depends(get_db)):
+async def get_donation_endpoint(donation_id: UUID, db: AsyncSession = Depends(get_db)):
     """Get a specific donation"""
     try:
-        db_donation = get_donation(db, donation_id)
+        db_donation = await get_donation(db, donation_id)
         if not db_donation:
             raise HTTPException(status_code=404, detail="Donation not found")
 
@@ -363,11 +485,11 @@ async def get_donation_endpoint(donation_id: UUID, db: Session = Depends(get_db)
 async def update_donation_endpoint(
     donation_id: UUID,
     donation_update: DonationUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Update a donation"""
     try:
-        db_donation = update_donation(db, donation_id, donation_update)
+        db_donation = await update_donation(db, donation_id, donation_update)
         if not db_donation:
             raise HTTPException(status_code=404, detail="Donation not found")
 
@@ -390,10 +512,10 @@ async def update_donation_endpoint(
         raise HTTPException(status_code=500, detail=f"Error updating donation: {str(e)}")
 
 @router.delete("/{donation_id}")
-async def delete_donation_endpoint(donation_id: UUID, db: Session = Depends(get_db)):
+async def delete_donation_endpoint(donation_id: UUID, db: AsyncSession = Depends(get_db)):
     """Delete a donation"""
     try:
-        success = delete_donation(db, donation_id)
+        success = await delete_donation(db, donation_id)
         if not success:
             raise HTTPException(status_code=404, detail="Donation not found")
 
@@ -409,11 +531,11 @@ async def delete_donation_endpoint(donation_id: UUID, db: Session = Depends(get_
 @router.get("/email/{email}")
 async def get_donations_by_email_endpoint(
     email: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get all donations by donor email"""
     try:
-        donations = get_donations_by_email(db, email)
+        donations = await get_donations_by_email(db, email)
         return {
             "donations": donations,
             "total": len(donations)
@@ -423,13 +545,19 @@ async def get_donations_by_email_endpoint(
 
 @router.get("/stats/total")
 async def get_donation_stats(
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
     title: Optional[str] = Query(None, description="Filter by donation title")
 ):
     """Get donation statistics"""
+    not_modified = check_not_modified(request, response, "donations")
+    if not_modified:
+        return not_modified
+
     try:
-        total_amount = get_total_donated_amount(db, title)
-        total_count = count_donations(db, title)
+        total_amount = await get_total_donated_amount(db, title)
+        total_count = await count_donations(db, title)
 
         return {
             "total_amount": total_amount,
@@ -442,12 +570,12 @@ async def get_donation_stats(
 @router.post("/{donation_id}/verify")
 async def verify_donation(
     donation_id: UUID,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Verify a donation (mark as completed)"""
     try:
         donation_update = DonationUpdate(status="completed")
-        db_donation = update_donation(db, donation_id, donation_update)
+        db_donation = await update_donation(db, donation_id, donation_update)
 
         if not db_donation:
             raise HTTPException(status_code=404, detail="Donation not found")
@@ -468,12 +596,12 @@ async def verify_donation(
 @router.post("/{donation_id}/reject")
 async def reject_donation(
     donation_id: UUID,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Reject a donation (mark as failed)"""
     try:
         donation_update = DonationUpdate(status="failed")
-        db_donation = update_donation(db, donation_id, donation_update)
+        db_donation = await update_donation(db, donation_id, donation_update)
 
         if not db_donation:
             raise HTTPException(status_code=404, detail="Donation not found")
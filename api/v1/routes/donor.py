@@ -1,24 +1,24 @@
 
 # api/v1/routes/volunteer.py
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from api.db.database import get_db
+from api.utils.change_tracker import check_not_modified
+from api.utils.entity_counters import exact_counts, read_counts
 
 from pydantic import BaseModel, EmailStr
 from typing import Optional
 from datetime import datetime
 from uuid import UUID
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
 from typing import List
 from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
 from typing import List
 from uuid import UUID
-from sqlalchemy.orm import Session
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from api.v1.models import Donor
 from typing import List, Optional
 from uuid import UUID
@@ -43,10 +43,14 @@ class DonorResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class DonorStatsResponse(BaseModel):
+    total_donors: int
+    active_donors: int
+
 
 class DonorCRUD:
     @staticmethod
-    def create_donor(db: Session, donor: DonorCreate) -> Donor:
+    async def create_donor(db: AsyncSession, donor: DonorCreate) -> Donor:
         try:
             db_donor = Donor(
                 full_name=donor.full_name,
@@ -54,55 +58,79 @@ class DonorCRUD:
                 phone=donor.phone
             )
             db.add(db_donor)
-            db.commit()
-            db.refresh(db_donor)
+            await db.commit()
+            await db.refresh(db_donor)
             return db_donor
         except IntegrityError:
-            db.rollback()
+            await db.rollback()
             raise HTTPException(status_code=400, detail="Email already registered")
 
     @staticmethod
-    def get_donor(db: Session, donor_id: UUID) -> Optional[Donor]:
-        return db.query(Donor).filter(Donor.id == donor_id).first()
+    async def get_donor(db: AsyncSession, donor_id: UUID) -> Optional[Donor]:
+        return await db.get(Donor, donor_id)
 
     @staticmethod
-    def get_donors(db: Session, skip: int = 0, limit: int = 100) -> List[Donor]:
-        return db.query(Donor).offset(skip).limit(limit).all()
+    async def get_donors(db: AsyncSession, skip: int = 0, limit: int = 100) -> List[Donor]:
+        result = await db.scalars(select(Donor).offset(skip).limit(limit))
+        return result.all()
 
     @staticmethod
-    def delete_donor(db: Session, donor_id: UUID) -> bool:
-        donor = db.query(Donor).filter(Donor.id == donor_id).first()
+    async def delete_donor(db: AsyncSession, donor_id: UUID) -> bool:
+        donor = await db.get(Donor, donor_id)
         if donor:
-            db.delete(donor)
-            db.commit()
+            await db.delete(donor)
+            await db.commit()
             return True
         return False
 
+    @staticmethod
+    async def get_donor_stats(db: AsyncSession, exact: bool = False) -> dict:
+        counts = exact_counts if exact else read_counts
+        total_donors, active_donors = await counts(db, "donors")
+        return {
+            "total_donors": total_donors,
+            "active_donors": active_donors
+        }
+
 @router.post("/", response_model=DonorResponse, status_code=status.HTTP_201_CREATED)
 async def create_donor(
     donor: DonorCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Create a new donor"""
-    return DonorCRUD.create_donor(db=db, donor=donor)
+    return await DonorCRUD.create_donor(db=db, donor=donor)
 
 @router.get("/", response_model=List[DonorResponse])
 async def get_all_donors(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get all donors"""
-    donors = DonorCRUD.get_donors(db=db, skip=skip, limit=limit)
+    donors = await DonorCRUD.get_donors(db=db, skip=skip, limit=limit)
     return donors
 
+@router.get("/stats/total", response_model=DonorStatsResponse)
+async def get_donor_stats(
+    request: Request,
+    response: Response,
+    exact: bool = Query(False, description="Count the table instead of reading the maintained counters"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get donor statistics"""
+    not_modified = check_not_modified(request, response, "donors")
+    if not_modified:
+        return not_modified
+
+    return await DonorCRUD.get_donor_stats(db=db, exact=exact)
+
 @router.get("/{donor_id}", response_model=DonorResponse)
 async def get_donor(
     donor_id: UUID,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get a specific donor by ID"""
-    donor = DonorCRUD.get_donor(db=db, donor_id=donor_id)
+    donor = await DonorCRUD.get_donor(db=db, donor_id=donor_id)
     if donor is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -113,10 +141,10 @@ async def get_donor(
 @router.delete("/{donor_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_donor(
     donor_id: UUID,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Delete a donor by ID"""
-    deleted = DonorCRUD.delete_donor(db=db, donor_id=donor_id)
+    deleted = await DonorCRUD.delete_donor(db=db, donor_id=donor_id)
     if not deleted:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
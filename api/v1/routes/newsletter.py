@@ -0,0 +1,167 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import desc, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from typing import List, Optional
+from uuid import UUID
+
+from api.db.database import get_db
+from api.utils.newsletter_scheduler import as_utc_naive, scheduler, start_newsletter_send
+from api.utils.success_response import success_response
+from api.utils.uuid7 import uuid7
+from api.v1.models import Admin, DeliveryStatus, Newsletter, NewsletterDelivery, NewsletterStatus
+from api.v1.routes.auth import get_current_admin_or_superadmin
+from api.v1.schemas.newsletter import (
+    NewsletterCreate,
+    NewsletterDeliveryResponse,
+    NewsletterProgress,
+    NewsletterResponse,
+)
+
+router = APIRouter()
+
+
+class NewsletterCRUD:
+    @staticmethod
+    async def create_newsletter(db: AsyncSession, newsletter: NewsletterCreate, creator: Admin) -> Newsletter:
+        scheduled_at = as_utc_naive(newsletter.scheduled_at) if newsletter.scheduled_at else None
+        db_newsletter = Newsletter(
+            id=uuid7(),
+            subject=newsletter.subject,
+            content=newsletter.content,
+            html_content=newsletter.html_content,
+            scheduled_at=scheduled_at,
+            status=NewsletterStatus.SCHEDULED if scheduled_at else NewsletterStatus.DRAFT,
+            created_by=creator.id,
+        )
+        db.add(db_newsletter)
+        await db.commit()
+        await db.refresh(db_newsletter)
+        if scheduled_at:
+            scheduler.schedule(db_newsletter.id, scheduled_at)
+        return db_newsletter
+
+    @staticmethod
+    async def get_newsletter(db: AsyncSession, newsletter_id: UUID) -> Optional[Newsletter]:
+        return await db.get(Newsletter, newsletter_id)
+
+    @staticmethod
+    async def get_newsletters(db: AsyncSession, skip: int = 0, limit: int = 100) -> List[Newsletter]:
+        result = await db.scalars(
+            select(Newsletter).order_by(desc(Newsletter.created_at)).offset(skip).limit(limit)
+        )
+        return result.all()
+
+    @staticmethod
+    def get_progress(newsletter: Newsletter) -> dict:
+        """Aggregate progress from the counters kept with the delivery ledger"""
+        recipients = newsletter.queued_count + newsletter.sent_count + newsletter.deferred_count + newsletter.bounced_count
+        finished = newsletter.sent_count + newsletter.bounced_count
+        lease = newsletter.lease_expires_at
+        return {
+            "id": newsletter.id,
+            "status": newsletter.status,
+            "recipients": recipients,
+            "queued": newsletter.queued_count,
+            "sent": newsletter.sent_count,
+            "deferred": newsletter.deferred_count,
+            "bounced": newsletter.bounced_count,
+            "percent_complete": round(finished / recipients * 100, 2) if recipients else 0.0,
+            "sending": newsletter.lease_owner is not None and lease is not None and lease > datetime.utcnow(),
+        }
+
+    @staticmethod
+    async def get_deliveries(
+        db: AsyncSession,
+        newsletter_id: UUID,
+        delivery_status: Optional[DeliveryStatus],
+        after: Optional[UUID],
+        limit: int,
+    ) -> List[NewsletterDelivery]:
+        query = select(NewsletterDelivery).where(NewsletterDelivery.newsletter_id == newsletter_id)
+        if delivery_status is not None:
+            query = query.where(NewsletterDelivery.status == delivery_status)
+        if after is not None:
+            query = query.where(NewsletterDelivery.subscriber_id > after)
+        result = await db.scalars(query.order_by(NewsletterDelivery.subscriber_id).limit(limit))
+        return result.all()
+
+
+@router.post("/", response_model=NewsletterResponse, status_code=status.HTTP_201_CREATED)
+async def create_newsletter(
+    newsletter: NewsletterCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: Admin = Depends(get_current_admin_or_superadmin)
+):
+    """Create a draft newsletter, or a scheduled one when scheduled_at is given"""
+    return await NewsletterCRUD.create_newsletter(db=db, newsletter=newsletter, creator=current_user)
+
+@router.get("/", response_model=List[NewsletterResponse])
+async def get_all_newsletters(
+    skip: int = 0,
+    limit: int = 100,
+    db: AsyncSession = Depends(get_db),
+    current_user: Admin = Depends(get_current_admin_or_superadmin)
+):
+    """Get all newsletters, newest first"""
+    return await NewsletterCRUD.get_newsletters(db=db, skip=skip, limit=limit)
+
+@router.get("/{newsletter_id}", response_model=NewsletterResponse)
+async def get_newsletter(
+    newsletter_id: UUID,
+    db: AsyncSession = Depends(get_db),
+    current_user: Admin = Depends(get_current_admin_or_superadmin)
+):
+    """Get a specific newsletter by ID"""
+    newsletter = await NewsletterCRUD.get_newsletter(db=db, newsletter_id=newsletter_id)
+    if newsletter is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Newsletter not found")
+    return newsletter
+
+@router.get("/{newsletter_id}/progress", response_model=NewsletterProgress)
+async def get_newsletter_progress(
+    newsletter_id: UUID,
+    db: AsyncSession = Depends(get_db),
+    current_user: Admin = Depends(get_current_admin_or_superadmin)
+):
+    """Delivery progress of a newsletter, without scanning the ledger"""
+    newsletter = await NewsletterCRUD.get_newsletter(db=db, newsletter_id=newsletter_id)
+    if newsletter is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Newsletter not found")
+    return NewsletterCRUD.get_progress(newsletter)
+
+@router.get("/{newsletter_id}/deliveries", response_model=List[NewsletterDeliveryResponse])
+async def get_newsletter_deliveries(
+    newsletter_id: UUID,
+    delivery_status: Optional[DeliveryStatus] = Query(None, alias="status"),
+    after: Optional[UUID] = Query(None, description="Last subscriber_id of the previous page"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+    current_user: Admin = Depends(get_current_admin_or_superadmin)
+):
+    """Per-recipient delivery status, paginated by subscriber_id"""
+    return await NewsletterCRUD.get_deliveries(
+        db=db, newsletter_id=newsletter_id, delivery_status=delivery_status, after=after, limit=limit
+    )
+
+@router.post("/{newsletter_id}/send", status_code=status.HTTP_202_ACCEPTED)
+async def send_newsletter(
+    newsletter_id: UUID,
+    db: AsyncSession = Depends(get_db),
+    current_user: Admin = Depends(get_current_admin_or_superadmin)
+):
+    """Start delivering a newsletter to all active subscribers in the background"""
+    newsletter = await NewsletterCRUD.get_newsletter(db=db, newsletter_id=newsletter_id)
+    if newsletter is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Newsletter not found")
+    if newsletter.status == NewsletterStatus.SENT:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Newsletter has already been sent")
+    # Release the connection before claiming (SQLite has a single writer connection)
+    await db.commit()
+    if not await start_newsletter_send(newsletter.id):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Newsletter is already being sent")
+    return success_response(
+        status_code=status.HTTP_202_ACCEPTED,
+        message="Newsletter delivery started",
+        data={"id": str(newsletter.id)},
+    )
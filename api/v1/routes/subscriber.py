@@ -1,12 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy.exc import IntegrityError
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel, EmailStr
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from datetime import datetime
+import hmac
 import uuid
 from api.v1.models import Subscriber
-from api.db.database import get_db
+from api.db.database import get_db, AsyncReadSessionLocal
+from api.utils.change_tracker import check_not_modified
+from api.utils.bounces import parse_dsn, parse_json
+from api.utils.entity_counters import exact_counts, read_counts
+from api.utils.settings import settings
+from api.utils.subscriber_export import EXPORT_MEDIA_TYPES, stream_subscribers, sync_watermark
+from api.utils.subscriber_import import ImportFormatError, format_for, import_subscribers, upsert_subscribers
+from api.utils.suppression import ingest
+from api.v1.routes.auth import get_current_admin_or_superadmin, get_current_user, security
 
 router = APIRouter()
 
@@ -27,81 +37,176 @@ class SubscriberResponse(BaseModel):
 class SubscriberUpdate(BaseModel):
     is_active: Optional[bool] = None
 
+class SubscriberImportReport(BaseModel):
+    rows: int
+    inserted: int
+    reactivated: int
+    already_active: int
+    duplicates: int
+    invalid: int
+    errors: List[Dict[str, Any]]
+    elapsed: float
+
+    class Config:
+        from_attributes = True
+
+class BounceIngestReport(BaseModel):
+    events: int
+    bounces: int
+    complaints: int
+    transient: int
+    suppressed: int
+    deactivated: int
+
+    class Config:
+        from_attributes = True
+
+async def get_bounce_reporter(
+    request: Request,
+    token: Optional[str] = Query(None, description="BOUNCE_WEBHOOK_TOKEN, for mail providers' webhooks"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Accept the webhook token when one is configured, else require an admin"""
+    if token and settings.BOUNCE_WEBHOOK_TOKEN and hmac.compare_digest(token, settings.BOUNCE_WEBHOOK_TOKEN):
+        return None
+    current_user = await get_current_user(await security(request), db)
+    return await get_current_admin_or_superadmin(current_user)
+
 # Public endpoint for subscription
 @router.post("/", response_model=dict)
-async def subscribe(subscriber: SubscriberCreate, db: Session = Depends(get_db)):
+async def subscribe(subscriber: SubscriberCreate, db: AsyncSession = Depends(get_db)):
     """
     Subscribe a new email to the newsletter
     """
     try:
-        # Check if email already exists
-        existing_subscriber = db.query(Subscriber).filter(
-            Subscriber.email == subscriber.email
-        ).first()
-        
-        if existing_subscriber:
-            if existing_subscriber.is_active:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="This email is already subscribed"
-                )
-            else:
-                # Reactivate existing subscriber
-                existing_subscriber.is_active = True
-                existing_subscriber.subscribed_at = datetime.utcnow()
-                existing_subscriber.unsubscribed_at = None
-                db.commit()
-                return {"message": "Successfully resubscribed to newsletter"}
-        
-        # Create new subscriber
-        db_subscriber = Subscriber(
-            email=subscriber.email,
-            is_active=True,
-            subscribed_at=datetime.utcnow()
-        )
-        db.add(db_subscriber)
-        db.commit()
-        
-        return {"message": "Successfully subscribed to newsletter"}
-        
-    except IntegrityError:
-        db.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="This email is already subscribed"
-        )
+        # One INSERT ... ON CONFLICT DO UPDATE: inserts, reactivates an
+        # unsubscribed row, or leaves an active one alone, without racing
+        inserted, reactivated, _ = await upsert_subscribers(db, [subscriber.email])
+        await db.commit()
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to subscribe"
         )
 
+    if inserted:
+        return {"message": "Successfully subscribed to newsletter"}
+    if reactivated:
+        return {"message": "Successfully resubscribed to newsletter"}
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="This email is already subscribed"
+    )
+
+@router.post("/import", response_model=SubscriberImportReport)
+async def import_subscribers_endpoint(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(csv|ndjson)$", description="csv or ndjson; defaults from Content-Type"),
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_current_admin_or_superadmin)
+):
+    """
+    Bulk import subscribers from a CSV or NDJSON request body (admin only)
+
+    Send the file as the raw body, e.g.
+    curl --data-binary @emails.csv -H "Content-Type: text/csv" .../subscribers/import
+    New addresses are added, unsubscribed ones reactivated.
+    """
+    # Release the connection taken by authentication; each batch commits on its own
+    await db.commit()
+    try:
+        return await import_subscribers(db, request.stream(), format or format_for(request.headers.get("content-type")))
+    except ImportFormatError as e:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+@router.post("/bounces", response_model=BounceIngestReport)
+async def ingest_bounces(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    reporter = Depends(get_bounce_reporter)
+):
+    """
+    Ingest bounce and complaint reports (webhook token or admin)
+
+    The body is a DSN/ARF message or mbox, or JSON: SES (also via SNS),
+    SendGrid or the generic shape described in api/utils/bounces.py.
+    Permanent bounces and complaints suppress the address and deactivate
+    the subscriber.
+    """
+    # Release the connection taken by authentication; each batch commits on its own
+    await db.commit()
+    body = await request.body()
+    if "json" in request.headers.get("content-type", "") or body.lstrip()[:1] in (b"[", b"{"):
+        try:
+            events = parse_json(body)
+        except (ValueError, KeyError, TypeError) as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid bounce JSON: {e}")
+    else:
+        events = parse_dsn(body)
+    return await ingest(db, events)
+
+@router.get("/export")
+async def export_subscribers(
+    format: str = Query("csv", pattern="^(csv|ndjson)$", description="csv or ndjson"),
+    active_only: Optional[bool] = Query(None, description="Only active subscribers; default true, false with since"),
+    subscribed_from: Optional[datetime] = Query(None, description="Only subscribed at or after this time"),
+    subscribed_to: Optional[datetime] = Query(None, description="Only subscribed before this time"),
+    since: Optional[datetime] = Query(None, description="Only rows changed at or after this time (the previous X-Sync-Watermark)"),
+    current_user = Depends(get_current_admin_or_superadmin)
+):
+    """
+    Stream subscribers as CSV or NDJSON in keyset order (admin only)
+
+    The X-Sync-Watermark header is the ``since`` for the next incremental sync.
+    """
+    watermark = sync_watermark()
+    if active_only is None:
+        # A delta sync needs the unsubscribes too
+        active_only = since is None
+    return StreamingResponse(
+        stream_subscribers(
+            AsyncReadSessionLocal, format, active_only, subscribed_from, subscribed_to, since, watermark
+        ),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="subscribers.{format}"',
+            "X-Sync-Watermark": watermark.isoformat(),
+        }
+    )
+
 # Admin endpoints (add authentication/authorization as needed)
 @router.get("/", response_model=List[SubscriberResponse])
 async def get_all_subscribers(
+    request: Request,
+    response: Response,
     skip: int = 0, 
     limit: int = 100, 
     active_only: bool = True,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get all subscribers (admin only)
     """
-    query = db.query(Subscriber)
+    not_modified = check_not_modified(request, response, "subscribers")
+    if not_modified:
+        return not_modified
+
+    query = select(Subscriber)
     
     if active_only:
-        query = query.filter(Subscriber.is_active == True)
+        query = query.where(Subscriber.is_active == True)
     
-    subscribers = query.offset(skip).limit(limit).all()
+    subscribers = (await db.scalars(query.offset(skip).limit(limit))).all()
     return subscribers
 
 @router.get("/{subscriber_id}", response_model=SubscriberResponse)
-async def get_subscriber(subscriber_id: uuid.UUID, db: Session = Depends(get_db)):
+async def get_subscriber(subscriber_id: uuid.UUID, db: AsyncSession = Depends(get_db)):
     """
     Get a specific subscriber by ID (admin only)
     """
-    subscriber = db.query(Subscriber).filter(Subscriber.id == subscriber_id).first()
+    subscriber = await db.get(Subscriber, subscriber_id)
     if not subscriber:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -113,12 +218,12 @@ async def get_subscriber(subscriber_id: uuid.UUID, db: Session = Depends(get_db)
 async def update_subscriber(
     subscriber_id: uuid.UUID, 
     subscriber_update: SubscriberUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Update subscriber status (admin only)
     """
-    subscriber = db.query(Subscriber).filter(Subscriber.id == subscriber_id).first()
+    subscriber = await db.get(Subscriber, subscriber_id)
     if not subscriber:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -132,34 +237,34 @@ async def update_subscriber(
         else:
             subscriber.unsubscribed_at = None
     
-    db.commit()
-    db.refresh(subscriber)
+    await db.commit()
+    await db.refresh(subscriber)
     return subscriber
 
 @router.delete("/{subscriber_id}")
-async def delete_subscriber(subscriber_id: uuid.UUID, db: Session = Depends(get_db)):
+async def delete_subscriber(subscriber_id: uuid.UUID, db: AsyncSession = Depends(get_db)):
     """
     Delete a subscriber (admin only)
     """
-    subscriber = db.query(Subscriber).filter(Subscriber.id == subscriber_id).first()
+    subscriber = await db.get(Subscriber, subscriber_id)
     if not subscriber:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Subscriber not found"
         )
     
-    db.delete(subscriber)
-    db.commit()
+    await db.delete(subscriber)
+    await db.commit()
     return {"message": "Subscriber deleted successfully"}
 
 @router.post("/unsubscribe")
-async def unsubscribe(subscriber: SubscriberCreate, db: Session = Depends(get_db)):
+async def unsubscribe(subscriber: SubscriberCreate, db: AsyncSession = Depends(get_db)):
     """
     Unsubscribe an email from the newsletter
     """
-    db_subscriber = db.query(Subscriber).filter(
-        Subscriber.email == subscriber.email
-    ).first()
+    db_subscriber = await db.scalar(
+        select(Subscriber).where(Subscriber.email == subscriber.email)
+    )
     
     if not db_subscriber:
         raise HTTPException(
@@ -175,18 +280,27 @@ async def unsubscribe(subscriber: SubscriberCreate, db: Session = Depends(get_db
     
     db_subscriber.is_active = False
     db_subscriber.unsubscribed_at = datetime.utcnow()
-    db.commit()
+    await db.commit()
     
     return {"message": "Successfully unsubscribed from newsletter"}
 
 # Statistics endpoint
 @router.get("/stats/summary")
-async def get_subscriber_stats(db: Session = Depends(get_db)):
+async def get_subscriber_stats(
+    request: Request,
+    response: Response,
+    exact: bool = Query(False, description="Count the table instead of reading the maintained counters"),
+    db: AsyncSession = Depends(get_db)
+):
     """
     Get subscriber statistics (admin only)
     """
-    total_subscribers = db.query(Subscriber).count()
-    active_subscribers = db.query(Subscriber).filter(Subscriber.is_active == True).count()
+    not_modified = check_not_modified(request, response, "subscribers")
+    if not_modified:
+        return not_modified
+
+    counts = exact_counts if exact else read_counts
+    total_subscribers, active_subscribers = await counts(db, "subscribers")
     inactive_subscribers = total_subscribers - active_subscribers
     
     return {
@@ -1,22 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from api.db.database import get_db
+from api.utils.change_tracker import check_not_modified
+from api.utils.entity_counters import exact_counts, read_counts
 
 from pydantic import BaseModel, EmailStr
 from typing import Optional
 from datetime import datetime
 from uuid import UUID
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
 from typing import List
 from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
 from typing import List
 from uuid import UUID
-from sqlalchemy.orm import Session
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from api.v1.models import Volunteer
 from typing import List, Optional
 from uuid import UUID
@@ -51,7 +51,7 @@ class VolunteerStatsResponse(BaseModel):
 
 class VolunteerCRUD:
     @staticmethod
-    def create_volunteer(db: Session, volunteer: VolunteerCreate) -> Volunteer:
+    async def create_volunteer(db: AsyncSession, volunteer: VolunteerCreate) -> Volunteer:
         try:
             db_volunteer = Volunteer(
                 full_name=volunteer.full_name,
@@ -59,35 +59,36 @@ class VolunteerCRUD:
                 phone=volunteer.phone
             )
             db.add(db_volunteer)
-            db.commit()
-            db.refresh(db_volunteer)
+            await db.commit()
+            await db.refresh(db_volunteer)
             return db_volunteer
         except IntegrityError:
-            db.rollback()
+            await db.rollback()
             raise HTTPException(status_code=400, detail="Email already registered")
 
     @staticmethod
-    def get_volunteer(db: Session, volunteer_id: UUID) -> Optional[Volunteer]:
-        return db.query(Volunteer).filter(Volunteer.id == volunteer_id).first()
+    async def get_volunteer(db: AsyncSession, volunteer_id: UUID) -> Optional[Volunteer]:
+        return await db.get(Volunteer, volunteer_id)
 
     @staticmethod
-    def get_volunteers(db: Session, skip: int = 0, limit: int = 100) -> List[Volunteer]:
-        return db.query(Volunteer).offset(skip).limit(limit).all()
+    async def get_volunteers(db: AsyncSession, skip: int = 0, limit: int = 100) -> List[Volunteer]:
+        result = await db.scalars(select(Volunteer).offset(skip).limit(limit))
+        return result.all()
 
     @staticmethod
-    def delete_volunteer(db: Session, volunteer_id: UUID) -> bool:
-        volunteer = db.query(Volunteer).filter(Volunteer.id == volunteer_id).first()
+    async def delete_volunteer(db: AsyncSession, volunteer_id: UUID) -> bool:
+        volunteer = await db.get(Volunteer, volunteer_id)
         if volunteer:
-            db.delete(volunteer)
-            db.commit()
+            await db.delete(volunteer)
+            await db.commit()
             return True
         return False
 
     # Add this new method for stats
     @staticmethod
-    def get_volunteer_stats(db: Session) -> dict:
-        total_volunteers = db.query(Volunteer).count()
-        active_volunteers = db.query(Volunteer).filter(Volunteer.is_active == True).count()
+    async def get_volunteer_stats(db: AsyncSession, exact: bool = False) -> dict:
+        counts = exact_counts if exact else read_counts
+        total_volunteers, active_volunteers = await counts(db, "volunteers")
         return {
             "total_volunteers": total_volunteers,
             "active_volunteers": active_volunteers
@@ -98,35 +99,44 @@ class VolunteerCRUD:
 @router.post("/", response_model=VolunteerResponse, status_code=status.HTTP_201_CREATED)
 async def create_volunteer(
     volunteer: VolunteerCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Create a new volunteer"""
-    return VolunteerCRUD.create_volunteer(db=db, volunteer=volunteer)
+    return await VolunteerCRUD.create_volunteer(db=db, volunteer=volunteer)
 
 @router.get("/", response_model=List[VolunteerResponse])
 async def get_all_volunteers(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get all volunteers"""
-    volunteers = VolunteerCRUD.get_volunteers(db=db, skip=skip, limit=limit)
+    volunteers = await VolunteerCRUD.get_volunteers(db=db, skip=skip, limit=limit)
     return volunteers
 
 # Add this new stats endpoint
 @router.get("/stats/total", response_model=VolunteerStatsResponse)
-async def get_volunteer_stats(db: Session = Depends(get_db)):
+async def get_volunteer_stats(
+    request: Request,
+    response: Response,
+    exact: bool = Query(False, description="Count the table instead of reading the maintained counters"),
+    db: AsyncSession = Depends(get_db)
+):
     """Get volunteer statistics"""
-    stats = VolunteerCRUD.get_volunteer_stats(db=db)
+    not_modified = check_not_modified(request, response, "volunteers")
+    if not_modified:
+        return not_modified
+
+    stats = await VolunteerCRUD.get_volunteer_stats(db=db, exact=exact)
     return stats
 
 @router.get("/{volunteer_id}", response_model=VolunteerResponse)
 async def get_volunteer(
     volunteer_id: UUID,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get a specific volunteer by ID"""
-    volunteer = VolunteerCRUD.get_volunteer(db=db, volunteer_id=volunteer_id)
+    volunteer = await VolunteerCRUD.get_volunteer(db=db, volunteer_id=volunteer_id)
     if volunteer is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -137,10 +147,10 @@ async def get_volunteer(
 @router.delete("/{volunteer_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_volunteer(
     volunteer_id: UUID,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Delete a volunteer by ID"""
-    deleted = VolunteerCRUD.delete_volunteer(db=db, volunteer_id=volunteer_id)
+    deleted = await VolunteerCRUD.delete_volunteer(db=db, volunteer_id=volunteer_id)
     if not deleted:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
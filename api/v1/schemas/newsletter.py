@@ -1,7 +1,8 @@
 from pydantic import BaseModel, EmailStr
 from typing import Optional, List
 from datetime import datetime
-from api.v1.models.models import UserRole, DonationStatus, NewsletterStatus
+from uuid import UUID
+from api.v1.models.models import UserRole, DonationStatus, NewsletterStatus, DeliveryStatus
 
         
 class NewsletterCreate(BaseModel):
@@ -11,7 +12,7 @@ class NewsletterCreate(BaseModel):
     scheduled_at: Optional[datetime] = None
 
 class NewsletterResponse(BaseModel):
-    id: int
+    id: UUID
     subject: str
     content: str
     html_content: Optional[str] = None
@@ -22,3 +23,25 @@ class NewsletterResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+class NewsletterProgress(BaseModel):
+    id: UUID
+    status: NewsletterStatus
+    recipients: int
+    queued: int
+    sent: int
+    deferred: int
+    bounced: int
+    percent_complete: float
+    sending: bool
+
+class NewsletterDeliveryResponse(BaseModel):
+    subscriber_id: UUID
+    email: str
+    status: DeliveryStatus
+    attempts: int
+    last_reply: Optional[str] = None
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
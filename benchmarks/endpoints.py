@@ -0,0 +1,373 @@
+""" Endpoint benchmark suite with regression baselines
+
+    python -m benchmarks.endpoints                          # SQLite, both transports
+    python -m benchmarks.endpoints --transport socket --only login,donations_list
+    DB_TYPE=postgresql DB_HOST=... python -m benchmarks.endpoints --db postgres --reseed
+    python -m benchmarks.endpoints --update                 # record new baselines
+
+Each scenario runs as a closed loop of --concurrency clients for --duration
+seconds, after a short warm-up, and records throughput and p50/p99 latency.
+Two transports are available:
+
+  * inprocess - calls the ASGI app directly, with no network or HTTP parsing,
+    so it measures the app and the database alone;
+  * socket - runs serve.py with one worker and talks HTTP/1.1 keep-alive to it
+    over 127.0.0.1.
+
+SQLite runs use a fresh temporary database seeded by benchmarks.seed. Postgres
+runs use the database in the environment, and --reseed truncates and seeds
+it. Rate limiting and conditional GETs are off, and receipts are stored
+locally (RECEIPT_STORAGE=local) in a temporary directory.
+
+Results are compared with benchmarks/baselines/endpoints.json, keyed by
+"<db>/<transport>/<scenario>". A scenario regresses when p50 or p99 exceeds
+its baseline, or throughput falls below it, by more than --threshold; any
+regression or 5xx makes the run exit non-zero. Baselines are machine
+specific: record them (--update) on the machine that runs the comparison.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from benchmarks.http_client import HTTPConnection, json_body
+from benchmarks.load import summarize
+
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+BASELINE_FILE = Path(__file__).resolve().parent / "baselines" / "endpoints.json"
+ADMIN_EMAIL = "admin0@psf.example.org"  # superadmin created by benchmarks.seed
+ADMIN_PASSWORD = "password"
+RECEIPT_BYTES = b"\x89PNG\r\n\x1a\n" + os.urandom(16 * 1024)
+MULTIPART_BOUNDARY = "----psf-benchmark-boundary"
+
+Request = Tuple[str, str, Optional[bytes], Dict[str, str]]
+
+
+class Scenario(NamedTuple):
+    name: str
+    build: Callable[["Context", int], Request]
+
+
+class Context(NamedTuple):
+    token: str
+    donation_ids: List[str]
+    run_id: str
+
+    @property
+    def auth(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.token}"}
+
+
+def multipart(fields: Dict[str, str], filename: str, content_type: str, content: bytes) -> Tuple[bytes, Dict[str, str]]:
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f'--{MULTIPART_BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        )
+    parts.append(
+        f'--{MULTIPART_BOUNDARY}\r\nContent-Disposition: form-data; name="receipt"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n".encode() + content + b"\r\n"
+    )
+    parts.append(f"--{MULTIPART_BOUNDARY}--\r\n".encode())
+    return b"".join(parts), {"Content-Type": f"multipart/form-data; boundary={MULTIPART_BOUNDARY}"}
+
+
+def login(context: Context, sequence: int) -> Request:
+    body, headers = json_body({"email": ADMIN_EMAIL, "password": ADMIN_PASSWORD})
+    return "POST", "/api/v1/auth/login", body, headers
+
+
+def subscribe(context: Context, sequence: int) -> Request:
+    body, headers = json_body({"email": f"bench.{context.run_id}.{sequence}@example.com"})
+    return "POST", "/api/v1/subscribers/", body, headers
+
+
+def upload_receipt(context: Context, sequence: int) -> Request:
+    donation_id = context.donation_ids[sequence % len(context.donation_ids)]
+    body, headers = multipart({"donation_id": donation_id}, "receipt.png", "image/png", RECEIPT_BYTES)
+    return "POST", "/api/v1/donations/upload-receipt", body, headers
+
+
+def get(path: str, authenticated: bool = False) -> Callable[[Context, int], Request]:
+    def build(context: Context, sequence: int) -> Request:
+        return "GET", path, None, context.auth if authenticated else {}
+    return build
+
+
+SCENARIOS = (
+    Scenario("login", login),
+    Scenario("donations_list", get("/api/v1/donations/?limit=50")),
+    Scenario("donations_stats", get("/api/v1/donations/stats/total")),
+    Scenario("subscribers_list", get("/api/v1/subscribers/?limit=50")),
+    Scenario("subscribers_stats", get("/api/v1/subscribers/stats/summary")),
+    Scenario("subscribe", subscribe),
+    Scenario("upload_receipt", upload_receipt),
+    Scenario("admin_me", get("/api/v1/auth/me", authenticated=True)),
+    Scenario("admin_list", get("/api/v1/auth/admins", authenticated=True)),
+)
+
+
+class InProcessClient:
+    """Drives an ASGI app directly; same interface as HTTPConnection"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def request(self, method: str, path: str, body: Optional[bytes] = None,
+                      headers: Optional[Dict[str, str]] = None):
+        path, _, query = path.partition("?")
+        raw_headers = [(b"host", b"benchmark")]
+        raw_headers += [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+        if body is not None:
+            raw_headers.append((b"content-length", str(len(body)).encode()))
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "root_path": "",
+            "headers": raw_headers,
+            "client": ("127.0.0.1", 50000),
+            "server": ("benchmark", 80),
+        }
+        pending = [{"type": "http.request", "body": body or b"", "more_body": False}]
+        response = {"status": 500, "headers": {}, "body": []}
+
+        async def receive():
+            if pending:
+                return pending.pop()
+            await asyncio.Event().wait()  # nothing more to read; wait to be cancelled
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = {k.decode(): v.decode() for k, v in message.get("headers", [])}
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+
+        await self.app(scope, receive, send)
+        return response["status"], response["headers"], b"".join(response["body"])
+
+    async def close(self) -> None:
+        pass
+
+
+async def run_scenario(make_client, scenario: Scenario, context: Context, concurrency: int,
+                       duration: float, warmup: float) -> Dict[str, float]:
+    sequence = itertools.count()
+    latencies: List[float] = []
+    errors = 0
+
+    async def client(deadline: float, record: bool):
+        nonlocal errors
+        connection = make_client()
+        while time.perf_counter() < deadline:
+            method, path, body, headers = scenario.build(context, next(sequence))
+            start = time.perf_counter()
+            try:
+                status, _, _ = await connection.request(method, path, body, headers)
+            except (OSError, asyncio.IncompleteReadError):
+                status = 599
+            if not record:
+                continue
+            if status >= 500:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - start)
+        await connection.close()
+
+    if warmup:
+        deadline = time.perf_counter() + warmup
+        await asyncio.gather(*(client(deadline, False) for _ in range(concurrency)))
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(client(deadline, True) for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+async def prepare_context(client) -> Context:
+    body, headers = json_body({"email": ADMIN_EMAIL, "password": ADMIN_PASSWORD})
+    status, _, payload = await client.request("POST", "/api/v1/auth/login", body, headers)
+    if status != 200:
+        raise RuntimeError(f"benchmark login failed ({status}): {payload[:200]!r}; is the database seeded?")
+    token = json.loads(payload)["data"]["access_token"]
+    status, _, payload = await client.request("GET", "/api/v1/donations/?limit=100")
+    donation_ids = [donation["id"] for donation in json.loads(payload)["donations"]]
+    return Context(token, donation_ids, os.urandom(4).hex())
+
+
+def benchmark_environment(args, workdir: str) -> Dict[str, str]:
+    env = {
+        "RATE_LIMIT_ENABLED": "false",
+        "CONDITIONAL_GET_ENABLED": "false",
+        "RECEIPT_STORAGE": "local",
+        "APP_URL": os.environ.get("APP_URL", "http://127.0.0.1"),
+    }
+    if args.db == "sqlite":
+        env.update(DB_TYPE="sqlite", SQLITE_PATH=os.path.join(workdir, "benchmark.db"))
+    else:
+        env.update(DB_TYPE="postgresql")
+    return env
+
+
+def seed(env: Dict[str, str], donations: int) -> None:
+    subprocess.run(
+        [sys.executable, "-m", "benchmarks.seed", "--donations", str(donations), "--truncate"],
+        cwd=PROJECT_ROOT, env={**os.environ, **env}, check=True, stdout=subprocess.DEVNULL,
+    )
+
+
+async def run_inprocess(args, scenarios) -> Dict[str, Dict[str, float]]:
+    import main
+
+    main.run_startup_tasks()
+    app = main.app
+    context = await prepare_context(InProcessClient(app))
+    results = {}
+    for scenario in scenarios:
+        results[scenario.name] = await run_scenario(
+            lambda: InProcessClient(app), scenario, context, args.concurrency, args.duration, args.warmup
+        )
+        print_row("inprocess", scenario.name, results[scenario.name])
+
+    # aiosqlite connections own threads that would keep the interpreter alive
+    from api.db import database
+    await database.async_engine.dispose()
+    await database.async_read_engine.dispose()
+    return results
+
+
+async def wait_until_ready(port: int, server: subprocess.Popen, timeout: float = 60.0) -> None:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline and server.poll() is None:
+        connection = HTTPConnection("127.0.0.1", port)
+        try:
+            status, _, _ = await connection.request("GET", "/health")
+            if status == 200:
+                return
+        except OSError:
+            pass
+        finally:
+            await connection.close()
+        await asyncio.sleep(0.2)
+    raise RuntimeError("server did not become ready")
+
+
+def run_socket(args, scenarios, env: Dict[str, str], workdir: str) -> Dict[str, Dict[str, float]]:
+    server = subprocess.Popen(
+        [sys.executable, str(PROJECT_ROOT / "serve.py"), "--host", "127.0.0.1", "--port", str(args.port),
+         "--workers", "1", "--no-access-log", "--log-level", "warning"],
+        cwd=workdir, env={**os.environ, **env}, stdout=subprocess.DEVNULL,
+    )
+    try:
+        async def run():
+            await wait_until_ready(args.port, server)
+            context = await prepare_context(HTTPConnection("127.0.0.1", args.port))
+            results = {}
+            for scenario in scenarios:
+                results[scenario.name] = await run_scenario(
+                    lambda: HTTPConnection("127.0.0.1", args.port), scenario, context,
+                    args.concurrency, args.duration, args.warmup,
+                )
+                print_row("socket", scenario.name, results[scenario.name])
+            return results
+        return asyncio.run(run())
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+
+
+def print_row(transport: str, name: str, row: Dict[str, float]) -> None:
+    print(f"{transport:<10} {name:<18} {row['requests']:>8} {row['errors']:>5} "
+          f"{row['rps']:>9} {row['p50_ms']:>9} {row['p99_ms']:>9}", flush=True)
+
+
+def compare(results: Dict[str, Dict[str, float]], baselines: Dict[str, Dict[str, float]],
+            threshold: float) -> List[str]:
+    failures = []
+    for key, row in results.items():
+        if row["errors"]:
+            failures.append(f"{key}: {row['errors']} server errors")
+        baseline = baselines.get(key)
+        if baseline is None:
+            continue
+        for metric in ("p50_ms", "p99_ms"):
+            if row[metric] > baseline[metric] * (1 + threshold):
+                failures.append(f"{key}: {metric} {row[metric]} > baseline {baseline[metric]} + {threshold:.0%}")
+        if row["rps"] < baseline["rps"] * (1 - threshold):
+            failures.append(f"{key}: rps {row['rps']} < baseline {baseline['rps']} - {threshold:.0%}")
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", choices=("sqlite", "postgres"), default="sqlite")
+    parser.add_argument("--transport", choices=("inprocess", "socket", "both"), default="both")
+    parser.add_argument("--only", help="comma-separated scenario names")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=1.0, help="seconds per scenario")
+    parser.add_argument("--donations", type=int, default=20_000, help="seed size")
+    parser.add_argument("--reseed", action="store_true", help="truncate and seed the Postgres database")
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--threshold", type=float, default=0.3)
+    parser.add_argument("--update", action="store_true", help="write the results as the new baselines")
+    args = parser.parse_args()
+
+    selected = set(args.only.split(",")) if args.only else None
+    scenarios = [scenario for scenario in SCENARIOS if selected is None or scenario.name in selected]
+    transports = ("inprocess", "socket") if args.transport == "both" else (args.transport,)
+
+    results: Dict[str, Dict[str, float]] = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        env = benchmark_environment(args, workdir)
+        if args.db == "sqlite" or args.reseed:
+            seed(env, args.donations)
+
+        print(f"{'transport':<10} {'scenario':<18} {'reqs':>8} {'err':>5} {'rps':>9} {'p50 ms':>9} {'p99 ms':>9}")
+        if "socket" in transports:
+            for name, row in run_socket(args, scenarios, env, workdir).items():
+                results[f"{args.db}/socket/{name}"] = row
+        if "inprocess" in transports:
+            # Settings are read at import time, so configure before importing the app
+            os.environ.update(env)
+            os.chdir(workdir)
+            sys.path.insert(0, str(PROJECT_ROOT))
+            for name, row in asyncio.run(run_inprocess(args, scenarios)).items():
+                results[f"{args.db}/inprocess/{name}"] = row
+            os.chdir(PROJECT_ROOT)
+
+    baselines = json.loads(BASELINE_FILE.read_text()) if BASELINE_FILE.exists() else {}
+    if args.update:
+        for key, row in results.items():
+            baselines[key] = {metric: row[metric] for metric in ("rps", "p50_ms", "p99_ms")}
+        BASELINE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        BASELINE_FILE.write_text(json.dumps(dict(sorted(baselines.items())), indent=2) + "\n")
+        print(f"baselines updated in {BASELINE_FILE}")
+        return 0
+
+    failures = compare(results, baselines, args.threshold)
+    missing = [key for key in results if key not in baselines]
+    if missing:
+        print(f"no baseline for {len(missing)} scenario(s); run with --update to record them")
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    if not failures:
+        print(f"ok: all scenarios within {args.threshold:.0%} of baseline")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
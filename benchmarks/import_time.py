@@ -0,0 +1,82 @@
+""" Cold-start benchmark: how long does ``import main`` take in a fresh interpreter?
+
+Usage:
+    python -m benchmarks.import_time                 # compare against the baseline
+    python -m benchmarks.import_time --update        # record a new baseline
+
+Exits non-zero when the best of N runs is slower than the committed baseline
+by more than --threshold (a fraction, default 0.25). The slowest modules from
+``-X importtime`` are printed to help find what regressed.
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+
+BASELINE_FILE = Path(__file__).resolve().parent / "baselines" / "import_time.json"
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+
+def measure(module: str) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], cwd=PROJECT_ROOT, check=True)
+    return time.perf_counter() - start
+
+
+def slowest_imports(module: str, limit: int = 15):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(self_us), int(cumulative_us), name.strip()))
+    rows.sort(reverse=True)
+    return rows[:limit]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--update", action="store_true", help="write the result as the new baseline")
+    args = parser.parse_args()
+
+    measure(args.module)  # warm the filesystem and bytecode caches
+    best = min(measure(args.module) for _ in range(args.runs))
+    print(f"import {args.module}: best of {args.runs} = {best * 1000:.0f}ms")
+
+    print("slowest modules (self time):")
+    for self_us, cumulative_us, name in slowest_imports(args.module):
+        print(f"  {self_us / 1000:8.1f}ms  {cumulative_us / 1000:8.1f}ms cumulative  {name}")
+
+    baselines = json.loads(BASELINE_FILE.read_text()) if BASELINE_FILE.exists() else {}
+    if args.update:
+        baselines[args.module] = {"seconds": round(best, 4)}
+        BASELINE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        BASELINE_FILE.write_text(json.dumps(baselines, indent=2) + "\n")
+        print(f"baseline updated in {BASELINE_FILE}")
+        return 0
+
+    baseline = baselines.get(args.module)
+    if baseline is None:
+        print("no baseline recorded; run with --update")
+        return 0
+    limit = baseline["seconds"] * (1 + args.threshold)
+    if best > limit:
+        print(f"REGRESSION: {best * 1000:.0f}ms > {limit * 1000:.0f}ms "
+              f"(baseline {baseline['seconds'] * 1000:.0f}ms + {args.threshold:.0%})")
+        return 1
+    print(f"ok: within {args.threshold:.0%} of baseline {baseline['seconds'] * 1000:.0f}ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
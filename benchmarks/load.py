@@ -0,0 +1,113 @@
+""" Closed-loop HTTP load generator
+
+    python -m benchmarks.load --url http://127.0.0.1:8000 \
+        --request "GET /api/v1/donations/?limit=50" \
+        --request "GET /api/v1/subscribers/stats/summary" \
+        --concurrency 128 --duration 30
+
+Each of --concurrency clients holds a keep-alive connection and issues the
+given requests round-robin for --duration seconds. Prints throughput and
+latency percentiles per request and overall.
+
+To compare the async data layer with the previous synchronous one, start the
+server from each revision against the same seeded database with the same
+worker count, run this with 100+ clients and compare the --json outputs.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List
+from urllib.parse import urlsplit
+
+from benchmarks.http_client import HTTPConnection
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, float]:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+    }
+
+
+async def run_load(host: str, port: int, requests: List[str], concurrency: int, duration: float,
+                   headers: Dict[str, str]):
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    deadline = time.perf_counter() + duration
+
+    async def client(offset: int):
+        connection = HTTPConnection(host, port)
+        cycle = itertools.islice(itertools.cycle(requests), offset, None)
+        for spec in cycle:
+            if time.perf_counter() >= deadline:
+                break
+            method, path = spec.split(" ", 1)
+            start = time.perf_counter()
+            try:
+                status, _, _ = await connection.request(method, path, headers=headers)
+            except (OSError, asyncio.IncompleteReadError):
+                errors[spec] += 1
+                continue
+            if status >= 500:
+                errors[spec] += 1
+            else:
+                latencies[spec].append(time.perf_counter() - start)
+        await connection.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(i % len(requests)) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    report = {spec: summarize(latencies[spec], errors[spec], elapsed) for spec in requests}
+    report["overall"] = summarize(
+        [value for spec in requests for value in latencies[spec]],
+        sum(errors.values()),
+        elapsed,
+    )
+    return report
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--request", action="append", dest="requests",
+                        help='"METHOD /path", may be repeated')
+    parser.add_argument("--concurrency", type=int, default=128)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--header", action="append", default=[], help='"Name: value"')
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    url = urlsplit(args.url)
+    requests = args.requests or ["GET /health"]
+    headers = dict(h.split(":", 1) for h in args.header)
+    headers = {name.strip(): value.strip() for name, value in headers.items()}
+
+    report = asyncio.run(run_load(url.hostname, url.port or 80, requests, args.concurrency, args.duration, headers))
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+    print(f"{'request':<50} {'reqs':>8} {'err':>5} {'rps':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for spec, row in report.items():
+        print(f"{spec[:50]:<50} {row['requests']:>8} {row['errors']:>5} {row['rps']:>9} {row['p50_ms']:>9} {row['p99_ms']:>9}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
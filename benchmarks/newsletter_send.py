@@ -0,0 +1,139 @@
+""" Newsletter delivery throughput against the local SMTP stand-in
+
+    python -m benchmarks.newsletter_send --subscribers 20000 --rtt-ms 20
+
+Seeds a temporary SQLite database with subscribers (benchmarks/seed.py),
+starts benchmarks/smtp_sink.py in-process and sends one newsletter through
+api/utils/email_service.py in four configurations:
+
+  * sequential: one connection, server without PIPELINING, so every
+    command waits for its reply, as with smtplib;
+  * pipelined: one connection, one round trip per message;
+  * pooled: --pool-size pipelined connections in parallel;
+  * paced: pooled, with the adaptive per-domain throttle
+    (api/utils/send_throttle.py). The other modes send unthrottled.
+
+Reports messages per minute for each. --rtt-ms stands in for the network
+distance to the relay, which is what pipelining and pooling hide.
+--domain-limit gmail.com=50 makes the sink defer recipients at that domain
+beyond 50 per second. The deferred column then counts the 451 replies the
+sink gave, and left counts recipients still deferred when the run ended.
+
+    python -m benchmarks.newsletter_send --modes pooled,paced \
+        --domain-limit gmail.com=100 --domain-limit yahoo.com=40
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from benchmarks.seed import DEFAULT_END, Generator, load_sqlite
+from benchmarks.smtp_sink import SMTPSink, parse_domain_limits
+
+
+MODES = ("sequential", "pipelined", "pooled", "paced")
+
+
+def prepare(path: str, subscribers: int, modes):
+    from api.utils.uuid7 import uuid7
+    from api.v1.models.models import Base, Newsletter, NewsletterStatus
+
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    generator = Generator(42, DEFAULT_END, 3.0, 10)
+    # One newsletter per mode: the delivery ledger never mails a recipient twice
+    newsletter_ids = {mode: uuid7() for mode in modes}
+    with engine.begin() as connection:
+        admin = next(generator.admins(1, "-"))
+        load_sqlite(connection, "admins", iter([admin]), 1)
+        seeded = load_sqlite(connection, "subscribers", generator.subscribers(subscribers), 10_000)
+        for mode, newsletter_id in newsletter_ids.items():
+            connection.execute(Newsletter.__table__.insert().values(
+                id=newsletter_id,
+                subject=f"Benchmark newsletter ({mode})",
+                content="Hello,\n\n" + "Thank you for supporting the foundation.\n" * 40,
+                html_content="<p>Hello,</p>" + "<p>Thank you for supporting the foundation.</p>" * 40,
+                status=NewsletterStatus.DRAFT,
+                created_by=admin[0],
+                created_at=datetime.utcnow(),
+            ))
+    engine.dispose()
+    return newsletter_ids, seeded
+
+
+async def run(args, path: str, newsletter_ids: dict) -> dict:
+    from api.utils.email_service import NewsletterSender, SMTPConnection
+    from api.utils.send_throttle import DomainThrottle
+    from api.utils.settings import settings
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+    results = {}
+    for mode, newsletter_id in newsletter_ids.items():
+        sink = SMTPSink(args.latency_ms / 1000, args.rtt_ms / 1000, pipelining=mode != "sequential",
+                        domain_limits=parse_domain_limits(args.domain_limit))
+        server = await sink.start()
+        port = server.sockets[0].getsockname()[1]
+        sender = NewsletterSender(
+            sessions,
+            pool_size=args.pool_size if mode in ("pooled", "paced") else 1,
+            pipeline_depth=args.pipeline_depth,
+            connection_factory=lambda: SMTPConnection(
+                "127.0.0.1", port, security="none", sender=settings.FROM_EMAIL,
+            ),
+            throttle=DomainThrottle() if mode == "paced" else DomainThrottle.unlimited(),
+        )
+        report = await sender.send(newsletter_id)
+        server.close()
+        await server.wait_closed()
+        results[mode] = {
+            "messages": report.delivered,
+            "deferred": sink.stats.deferred,
+            "left": report.remaining,
+            "seconds": round(report.elapsed, 2),
+            "per_minute": round(report.per_minute),
+            "connections": sink.stats.connections,
+        }
+    await engine.dispose()
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscribers", type=int, default=10_000)
+    parser.add_argument("--pool-size", type=int, default=8)
+    parser.add_argument("--pipeline-depth", type=int, default=20)
+    parser.add_argument("--rtt-ms", type=float, default=10.0, help="simulated round trip to the relay")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="simulated per-message server work")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--domain-limit", action="append", metavar="DOMAIN=RATE",
+                        help="sink defers recipients at DOMAIN beyond RATE per second (repeatable)")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="psf-newsletter-")
+    path = os.path.join(directory, "bench.db")
+    start = time.perf_counter()
+    newsletter_ids, seeded = prepare(path, args.subscribers, args.modes.split(","))
+    print(f"seeded {seeded} subscribers in {time.perf_counter() - start:.1f}s")
+    try:
+        results = asyncio.run(run(args, path, newsletter_ids))
+    finally:
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+    print(f"{'mode':<12} {'sent':>8} {'deferred':>9} {'left':>6} {'seconds':>8} {'msg/min':>9} {'conns':>6}")
+    for mode, row in results.items():
+        print(f"{mode:<12} {row['messages']:>8} {row['deferred']:>9} {row['left']:>6} {row['seconds']:>8} "
+              f"{row['per_minute']:>9} {row['connections']:>6}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
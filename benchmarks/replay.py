@@ -0,0 +1,284 @@
+""" Replay captured traffic against a local instance and compare latencies
+
+    TRAFFIC_CAPTURE_FILE=traffic.ndjson python serve.py      # on the source
+    python -m benchmarks.replay traffic.ndjson --url http://127.0.0.1:8000 --speed 4
+
+Reads a capture written by api/utils/traffic_capture.py and re-issues each
+request at its original offset divided by --speed (1 = real time; 0 = as
+fast as --max-in-flight allows). Since the capture is redacted, concrete
+values are filled in against the target:
+
+  * uuid path/body values come from ids listed by the target (donations,
+    subscribers, volunteers, donors, admins), chosen by parameter name;
+  * emails in bodies are fresh per request, so subscribes behave like new
+    subscribers, and login always uses --email/--password;
+  * other strings become filler of the recorded length, and multipart files
+    random bytes of the recorded size;
+  * requests that sent an Authorization header get a token for --email.
+
+Seed the target first (python -m benchmarks.seed) so that lists and ids
+exist. Unmatched routes (404 scans) are skipped. The report compares the
+captured and replayed p50/p99 per route and flags status-class mismatches;
+schedule lag shows when the replayer itself could not keep up.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote, urlencode, urlsplit
+
+from benchmarks.http_client import HTTPConnection, json_body
+from benchmarks.load import percentile
+
+
+UNMATCHED_ROUTE = "<unmatched>"
+MAX_FILE_BYTES = 5 * 1024 * 1024
+# uuid parameter/field name -> pool of ids fetched from the target
+ID_POOLS = {
+    "donation_id": "donations",
+    "subscriber_id": "subscribers",
+    "volunteer_id": "volunteers",
+    "donor_id": "donors",
+    "admin_id": "admins",
+}
+_PLACEHOLDER = re.compile(r"\{([^}:]+)(?::[^}]*)?\}")
+
+
+def load_capture(path: str, limit: Optional[int] = None) -> List[dict]:
+    records = []
+    with open(path) as capture:
+        for line in capture:
+            if line.strip():
+                records.append(json.loads(line))
+    records.sort(key=lambda record: record["t"])
+    return records[:limit] if limit else records
+
+
+class Materializer:
+    """Turns redacted shapes into concrete requests for the target"""
+
+    def __init__(self, pools: Dict[str, List[str]], emails: List[str], email: str, password: str, seed: int):
+        self.pools = pools
+        self.emails = emails or ["replay@example.com"]
+        self.email = email
+        self.password = password
+        self.rng = random.Random(seed)
+        self.run_id = os.urandom(3).hex()
+        self.sequence = 0
+
+    def uuid_for(self, name: str) -> str:
+        pool = self.pools.get(ID_POOLS.get(name, ""), []) or [item for pool in self.pools.values() for item in pool]
+        return self.rng.choice(pool) if pool else "00000000-0000-7000-8000-000000000000"
+
+    def string(self, name: str, shape, fresh_email: bool = False) -> str:
+        if shape == "uuid":
+            return self.uuid_for(name)
+        if shape == "email":
+            if fresh_email:
+                self.sequence += 1
+                return f"replay.{self.run_id}.{self.sequence}@example.com"
+            return self.rng.choice(self.emails)
+        if isinstance(shape, str) and shape.startswith("str:"):
+            return "x" * int(shape[4:])
+        return str(shape)
+
+    def json_value(self, name: str, shape):
+        if isinstance(shape, dict):
+            return {key: self.json_value(key, value) for key, value in shape.items()}
+        if isinstance(shape, list):
+            return [self.json_value(name, value) for value in shape]
+        if isinstance(shape, str):
+            return self.string(name, shape, fresh_email=True)
+        return shape
+
+    def multipart(self, shape: dict) -> Tuple[bytes, Dict[str, str]]:
+        boundary = f"----psf-replay-{self.run_id}"
+        parts = []
+        for name, value in shape.items():
+            if isinstance(value, dict) and "file" in value:
+                content = os.urandom(min(value["size"], MAX_FILE_BYTES))
+                parts.append(
+                    f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{name}"\r\n'
+                    f"Content-Type: {value['file'] or 'application/octet-stream'}\r\n\r\n".encode()
+                    + content + b"\r\n"
+                )
+            else:
+                parts.append(
+                    f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'
+                    f"{self.string(name, value)}\r\n".encode()
+                )
+        parts.append(f"--{boundary}--\r\n".encode())
+        return b"".join(parts), {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+
+    def request(self, record: dict, token: Optional[str]):
+        params = record.get("p") or {}
+        path = _PLACEHOLDER.sub(
+            lambda match: quote(self.string(match.group(1), params.get(match.group(1), "str:8")), safe="@"),
+            record["r"],
+        )
+        query = record.get("q") or {}
+        if query:
+            path += "?" + urlencode({key: self.string(key, value) for key, value in query.items()})
+
+        body, headers = None, {}
+        if record["r"].endswith("/auth/login"):
+            body, headers = json_body({"email": self.email, "password": self.password})
+        elif record.get("c") == "json" and record.get("b") is not None:
+            body, headers = json_body(self.json_value("", record["b"]))
+        elif record.get("c") == "multipart":
+            body, headers = self.multipart(record.get("b") or {})
+        elif record.get("c") == "raw":
+            body = os.urandom(min(record["b"]["size"], MAX_FILE_BYTES))
+            headers = {"Content-Type": record["b"]["type"] or "application/octet-stream"}
+        if record.get("a") and token:
+            headers["Authorization"] = f"Bearer {token}"
+        return record["m"], path, body, headers
+
+
+async def discover(host: str, port: int, email: str, password: str):
+    """Log in and collect ids and emails to substitute into the traffic"""
+    connection = HTTPConnection(host, port)
+    body, headers = json_body({"email": email, "password": password})
+    status, _, payload = await connection.request("POST", "/api/v1/auth/login", body, headers)
+    token = json.loads(payload)["data"]["access_token"] if status == 200 else None
+    auth = {"Authorization": f"Bearer {token}"} if token else {}
+
+    async def fetch(path: str, headers: Dict[str, str] = None):
+        status, _, payload = await connection.request("GET", path, headers=headers or {})
+        return json.loads(payload) if status == 200 else None
+
+    pools: Dict[str, List[str]] = {}
+    emails: List[str] = []
+    donations = await fetch("/api/v1/donations/?limit=500")
+    if donations:
+        pools["donations"] = [item["id"] for item in donations["donations"]]
+        emails += [item["donor_email"] for item in donations["donations"]]
+    for name in ("subscribers", "volunteers", "donors"):
+        items = await fetch(f"/api/v1/{name}/?limit=500")
+        if items:
+            pools[name] = [item["id"] for item in items]
+    admins = await fetch("/api/v1/auth/admins", auth)
+    if admins:
+        pools["admins"] = [item["id"] for item in admins["data"]["admins"]]
+    await connection.close()
+    return token, pools, emails
+
+
+async def replay(records: List[dict], host: str, port: int, speed: float, max_in_flight: int,
+                 materializer: Materializer, token: Optional[str]):
+    idle: List[HTTPConnection] = []
+    in_flight = asyncio.Semaphore(max_in_flight)
+    results: Dict[str, dict] = defaultdict(lambda: {"captured": [], "replayed": [], "errors": 0, "mismatched": 0})
+    lags: List[float] = []
+    t0 = records[0]["t"]
+    start = time.perf_counter()
+
+    async def issue(record: dict):
+        key = f"{record['m']} {record['r']}"
+        method, path, body, headers = materializer.request(record, token)
+        connection = idle.pop() if idle else HTTPConnection(host, port)
+        began = time.perf_counter()
+        try:
+            status, _, _ = await connection.request(method, path, body, headers)
+        except (OSError, asyncio.IncompleteReadError):
+            results[key]["errors"] += 1
+            return
+        finally:
+            in_flight.release()
+        elapsed = time.perf_counter() - began
+        idle.append(connection)
+        row = results[key]
+        row["captured"].append(record["d"] / 1000)
+        row["replayed"].append(elapsed)
+        if status >= 500:
+            row["errors"] += 1
+        if status // 100 != record["s"] // 100:
+            row["mismatched"] += 1
+
+    tasks = []
+    for record in records:
+        if speed > 0:
+            due = start + (record["t"] - t0) / speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await in_flight.acquire()
+        if speed > 0:
+            lags.append(max(0.0, time.perf_counter() - (start + (record["t"] - t0) / speed)))
+        tasks.append(asyncio.create_task(issue(record)))
+    await asyncio.gather(*tasks)
+    for connection in idle:
+        await connection.close()
+    return results, lags, time.perf_counter() - start
+
+
+def report(results: Dict[str, dict]) -> Dict[str, dict]:
+    rows = {}
+    for key, row in sorted(results.items()):
+        captured, replayed = sorted(row["captured"]), sorted(row["replayed"])
+        summary = {"requests": len(replayed), "errors": row["errors"], "status_mismatches": row["mismatched"]}
+        for q, label in ((0.5, "p50"), (0.99, "p99")):
+            before = percentile(captured, q) * 1000
+            after = percentile(replayed, q) * 1000
+            summary[f"captured_{label}_ms"] = round(before, 2)
+            summary[f"replay_{label}_ms"] = round(after, 2)
+            summary[f"delta_{label}_ms"] = round(after - before, 2)
+            summary[f"delta_{label}_pct"] = round((after - before) / before * 100, 1) if before else None
+        rows[key] = summary
+    return rows
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("capture", help="file written with TRAFFIC_CAPTURE_FILE")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--speed", type=float, default=1.0, help="time compression; 0 replays back to back")
+    parser.add_argument("--max-in-flight", type=int, default=256)
+    parser.add_argument("--limit", type=int, help="replay only the first N requests")
+    parser.add_argument("--email", default="admin0@psf.example.org", help="login used for authenticated requests")
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    records = [record for record in load_capture(args.capture, args.limit) if record["r"] != UNMATCHED_ROUTE]
+    if not records:
+        print("nothing to replay")
+        return 1
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+
+    async def run():
+        token, pools, emails = await discover(host, port, args.email, args.password)
+        if token is None and any(record.get("a") for record in records):
+            print(f"warning: could not log in as {args.email}; authenticated requests will fail", file=sys.stderr)
+        materializer = Materializer(pools, emails, args.email, args.password, args.seed)
+        return await replay(records, host, port, args.speed, args.max_in_flight, materializer, token)
+
+    results, lags, elapsed = asyncio.run(run())
+    rows = report(results)
+    lags.sort()
+    if args.json:
+        print(json.dumps({"routes": rows, "elapsed_s": round(elapsed, 2),
+                          "schedule_lag_p99_ms": round(percentile(lags, 0.99) * 1000, 2)}, indent=2))
+        return 0
+
+    print(f"{'route':<48} {'reqs':>6} {'err':>4} {'mism':>4} {'cap p50':>8} {'rep p50':>8} {'d p50%':>7} "
+          f"{'cap p99':>8} {'rep p99':>8} {'d p99%':>7}")
+    for key, row in rows.items():
+        print(f"{key[:48]:<48} {row['requests']:>6} {row['errors']:>4} {row['status_mismatches']:>4} "
+              f"{row['captured_p50_ms']:>8} {row['replay_p50_ms']:>8} {str(row['delta_p50_pct']):>7} "
+              f"{row['captured_p99_ms']:>8} {row['replay_p99_ms']:>8} {str(row['delta_p99_pct']):>7}")
+    print(f"replayed {len(records)} requests in {elapsed:.1f}s at {args.speed}x; "
+          f"schedule lag p99 {percentile(lags, 0.99) * 1000:.1f}ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
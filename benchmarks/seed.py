@@ -0,0 +1,343 @@
+""" Deterministic synthetic data for load testing
+
+    python -m benchmarks.seed --donations 1000000 --truncate
+    DB_TYPE=postgresql python -m benchmarks.seed --donations 50000000
+
+Loads the database configured in the environment (DB_TYPE, SQLITE_PATH, DB_*).
+The same --seed and sizes always produce the same rows, ids included, so
+runs against different revisions or databases see identical data. The
+data is skewed the way production data is:
+
+  * donors follow a power law: a few percent of donors make most donations,
+    and amounts are log-normal;
+  * donations are seasonal (a December peak, smaller campaign peaks) with
+    year-on-year growth, and campaigns only run in their months;
+  * statuses mix completed, pending and failed, with pending concentrated in
+    the most recent week;
+  * email domains are concentrated on a few big providers.
+
+Rows are generated in created_at order with UUIDv7 ids and streamed in
+batches: COPY on PostgreSQL, one prepared executemany per batch on SQLite.
+Sizes not given are derived from --donations.
+"""
+import argparse
+import csv
+import io
+import math
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+from uuid import UUID
+
+from sqlalchemy import text
+
+from api.utils.uuid7 import uuid7_from
+
+
+FIRST_NAMES = (
+    "Adaeze", "Chinedu", "Ngozi", "Emeka", "Funmilayo", "Tunde", "Aisha", "Ibrahim",
+    "Kemi", "Segun", "Zainab", "Musa", "Chiamaka", "Obinna", "Halima", "Yusuf",
+    "Grace", "Daniel", "Mary", "John", "Esther", "Samuel", "Ruth", "David",
+)
+LAST_NAMES = (
+    "Okafor", "Adeyemi", "Bello", "Eze", "Ogunleye", "Abubakar", "Nwosu", "Balogun",
+    "Okonkwo", "Lawal", "Umeh", "Danjuma", "Smith", "Johnson", "Williams", "Brown",
+)
+# (domain, weight): mail volume is concentrated on a few providers
+EMAIL_DOMAINS = (
+    ("gmail.com", 45), ("yahoo.com", 18), ("outlook.com", 9), ("hotmail.com", 7),
+    ("icloud.com", 5), ("ymail.com", 3), ("aol.com", 2), ("proton.me", 2),
+    ("psf-partners.org", 1), ("unilag.edu.ng", 1), ("mtnnigeria.net", 1),
+    ("example.ng", 6),
+)
+# (title, active months or None for all year, weight)
+CAMPAIGNS = (
+    ("General Fund", None, 5),
+    ("Scholarship Fund", None, 3),
+    ("Medical Outreach", None, 2),
+    ("Ramadan Feeding", {3, 4}, 6),
+    ("Back to School", {8, 9}, 6),
+    ("Flood Relief", {9, 10}, 4),
+    ("Christmas Food Drive", {11, 12}, 8),
+)
+# Relative donation volume per calendar month
+MONTH_WEIGHTS = (0.8, 0.7, 0.9, 1.0, 0.9, 0.8, 0.8, 0.9, 1.0, 1.1, 1.4, 2.2)
+YEARLY_GROWTH = 0.3
+MESSAGES = (
+    "Keep up the good work!",
+    "In memory of my mother.",
+    "For the children.",
+    "Happy to help.",
+)
+DEFAULT_END = datetime(2026, 1, 1)
+
+
+def build_domain_table() -> List[str]:
+    table = []
+    for domain, weight in EMAIL_DOMAINS:
+        table.extend([domain] * weight)
+    return table
+
+
+DOMAIN_TABLE = build_domain_table()
+
+
+def person(index: int) -> Tuple[str, str, str]:
+    """Name, unique email and phone for person ``index``, without an RNG"""
+    mixed = (index * 2654435761) & 0xFFFFFFFF
+    first = FIRST_NAMES[mixed % len(FIRST_NAMES)]
+    last = LAST_NAMES[(mixed >> 8) % len(LAST_NAMES)]
+    domain = DOMAIN_TABLE[(mixed >> 16) % len(DOMAIN_TABLE)]
+    email = f"{first.lower()}.{last.lower()}{index}@{domain}"
+    phone = f"080{(mixed * 7) % 100_000_000:08d}"
+    return f"{first} {last}", email, phone
+
+
+def time_ordered(rng: random.Random, count: int, start: datetime, end: datetime,
+                 seasonal: bool) -> Iterator[datetime]:
+    """``count`` increasing timestamps in [start, end), weighted by month if seasonal"""
+    months = []
+    cursor = datetime(start.year, start.month, 1)
+    while cursor < end:
+        following = datetime(cursor.year + cursor.month // 12, cursor.month % 12 + 1, 1)
+        weight = 1.0
+        if seasonal:
+            years = (cursor - start).days / 365.25
+            weight = MONTH_WEIGHTS[cursor.month - 1] * (1 + YEARLY_GROWTH * years)
+        months.append((max(cursor, start), min(following, end), weight))
+        cursor = following
+
+    total_weight = sum(weight for _, _, weight in months)
+    emitted = 0
+    cumulative = 0.0
+    for month_start, month_end, weight in months:
+        cumulative += weight
+        month_count = round(count * cumulative / total_weight) - emitted
+        span = (month_end - month_start).total_seconds()
+        for k in range(month_count):
+            yield month_start + timedelta(seconds=span * (k + rng.random()) / month_count)
+        emitted += month_count
+
+
+def make_id(rng: random.Random, moment: datetime, counter: int) -> UUID:
+    # Naive datetimes are UTC, as the app writes them; timestamp() alone
+    # would read them as local time and tie the ids to the machine's timezone
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return uuid7_from(int(moment.timestamp() * 1000), counter, rng.getrandbits(62))
+
+
+class Generator:
+    def __init__(self, seed: int, end: datetime, years: float, donors: int):
+        self.seed = seed
+        self.end = end
+        self.start = end - timedelta(days=365.25 * years)
+        self.donors = donors
+
+    def rng(self, table: str) -> random.Random:
+        return random.Random(f"{self.seed}:{table}")
+
+    def admins(self, count: int, hashed_password: str) -> Iterator[tuple]:
+        from api.v1.models.models import UserRole
+
+        rng = self.rng("admins")
+        for index, moment in enumerate(time_ordered(rng, count, self.start, self.end, False)):
+            role = UserRole.SUPERADMIN if index == 0 else UserRole.ADMIN
+            yield (
+                make_id(rng, moment, index), f"admin{index}@psf.example.org", f"Admin {index}",
+                hashed_password, role, True, moment, None,
+            )
+
+    def donors_rows(self, count: int) -> Iterator[tuple]:
+        rng = self.rng("donors")
+        for index, moment in enumerate(time_ordered(rng, count, self.start, self.end, True)):
+            name, email, phone = person(index)
+            yield (make_id(rng, moment, index), name, email, phone, rng.random() < 0.95, moment)
+
+    def donations(self, count: int) -> Iterator[tuple]:
+        from api.v1.models.models import DonationStatus
+
+        rng = self.rng("donations")
+        recent = self.end - timedelta(days=7)
+        for index, moment in enumerate(time_ordered(rng, count, self.start, self.end, True)):
+            # Power law: rank ~ u^3 puts most donations on the first few donors
+            donor = int(self.donors * rng.random() ** 3)
+            name, email, phone = person(donor)
+            active = [(title, weight) for title, months, weight in CAMPAIGNS
+                      if months is None or moment.month in months]
+            title = rng.choices([t for t, _ in active], [w for _, w in active])[0]
+            amount = max(500.0, round(rng.lognormvariate(8.5, 1.1), -2))
+            roll = rng.random()
+            if moment >= recent:
+                status = DonationStatus.PENDING if roll < 0.35 else DonationStatus.FAILED if roll < 0.40 else DonationStatus.COMPLETED
+            else:
+                status = DonationStatus.FAILED if roll < 0.07 else DonationStatus.PENDING if roll < 0.10 else DonationStatus.COMPLETED
+            donation_id = make_id(rng, moment, index)
+            reference = f"PSF-{donation_id.hex[-12:].upper()}" if status == DonationStatus.COMPLETED else None
+            message = rng.choice(MESSAGES) if rng.random() < 0.2 else None
+            yield (
+                donation_id, title, name, email, phone, amount, status, reference,
+                rng.random() < 0.12, message, moment,
+            )
+
+    def subscribers(self, count: int) -> Iterator[tuple]:
+        rng = self.rng("subscribers")
+        for index, moment in enumerate(time_ordered(rng, count, self.start, self.end, True)):
+            _, email, _ = person(index)
+            active = rng.random() < 0.85
+            unsubscribed = None
+            if not active:
+                unsubscribed = min(self.end, moment + timedelta(days=rng.expovariate(1 / 120)))
+            yield (make_id(rng, moment, index), email, active, moment, unsubscribed, unsubscribed or moment)
+
+    def volunteers(self, count: int) -> Iterator[tuple]:
+        rng = self.rng("volunteers")
+        for index, moment in enumerate(time_ordered(rng, count, self.start, self.end, False)):
+            name, email, phone = person(index)
+            yield (make_id(rng, moment, index), name, email, phone, rng.random() < 0.9, moment)
+
+
+COLUMNS: Dict[str, Sequence[str]] = {
+    "admins": ("id", "email", "full_name", "hashed_password", "role", "is_active", "created_at", "last_login"),
+    "donors": ("id", "full_name", "email", "phone", "is_active", "created_at"),
+    "donations": (
+        "id", "title", "donor_name", "donor_email", "donor_phone", "amount", "status",
+        "payment_reference", "is_anonymous", "message", "created_at",
+    ),
+    "subscribers": ("id", "email", "is_active", "subscribed_at", "unsubscribed_at", "updated_at"),
+    "volunteers": ("id", "full_name", "email", "phone", "is_active", "created_at"),
+}
+
+
+def copy_value(value):
+    """Text form of a value for COPY ... (FORMAT csv); None becomes NULL"""
+    if isinstance(value, Enum):
+        return value.name  # SQLAlchemy stores enum member names
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    return value
+
+
+def batched(rows: Iterator[tuple], size: int) -> Iterator[List[tuple]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def load_postgres(connection, table: str, rows: Iterator[tuple], batch_size: int) -> int:
+    cursor = connection.connection.driver_connection.cursor()
+    statement = f"COPY {table} ({', '.join(COLUMNS[table])}) FROM STDIN WITH (FORMAT csv)"
+    loaded = 0
+    for batch in batched(rows, batch_size):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in batch:
+            writer.writerow(copy_value(value) for value in row)
+        buffer.seek(0)
+        cursor.copy_expert(statement, buffer)
+        loaded += len(batch)
+    return loaded
+
+
+def load_sqlite(connection, table: str, rows: Iterator[tuple], batch_size: int) -> int:
+    from api.v1.models.models import Base
+
+    columns = COLUMNS[table]
+    sa_table = Base.metadata.tables[table]
+    # Convert values exactly as the ORM would (UUIDs as hex, enums by name, ...)
+    processors = [sa_table.c[name].type.bind_processor(connection.dialect) for name in columns]
+    statement = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    cursor = connection.connection.driver_connection.cursor()
+    loaded = 0
+    for batch in batched(rows, batch_size):
+        cursor.executemany(statement, [
+            tuple(process(value) if process and value is not None else value
+                  for process, value in zip(processors, row))
+            for row in batch
+        ])
+        loaded += len(batch)
+    return loaded
+
+
+def prepare_partitions(connection, generator: Generator) -> None:
+    from api.db import partitions
+
+    if partitions.is_partitioned(connection):
+        partitions.ensure_partitions(
+            connection, partitions.month_start(generator.start), partitions.month_start(generator.end)
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--donations", type=int, default=10_000)
+    parser.add_argument("--donors", type=int, help="default: donations / 6")
+    parser.add_argument("--subscribers", type=int, help="default: donations / 2")
+    parser.add_argument("--volunteers", type=int, help="default: donations / 100")
+    parser.add_argument("--admins", type=int, default=5)
+    parser.add_argument("--admin-password", default="password", help="password of every seeded admin")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--years", type=float, default=3.0, help="history length")
+    parser.add_argument("--end", type=datetime.fromisoformat, default=DEFAULT_END,
+                        help="latest timestamp (fixed so that runs are reproducible)")
+    parser.add_argument("--batch", type=int, default=50_000)
+    parser.add_argument("--truncate", action="store_true", help="empty the tables first")
+    parser.add_argument("--tables", default=",".join(COLUMNS), help="comma-separated subset to load")
+    args = parser.parse_args()
+
+    from main import run_startup_tasks
+    from api.db.database import engine
+    from api.v1.routes.auth import get_password_hash
+
+    run_startup_tasks()
+    donors = args.donors if args.donors is not None else max(10, args.donations // 6)
+    sizes = {
+        "admins": args.admins,
+        "donors": donors,
+        "donations": args.donations,
+        "subscribers": args.subscribers if args.subscribers is not None else args.donations // 2,
+        "volunteers": args.volunteers if args.volunteers is not None else max(10, args.donations // 100),
+    }
+    generator = Generator(args.seed, args.end, args.years, donors)
+    producers: Dict[str, Callable[[int], Iterator[tuple]]] = {
+        "admins": lambda count: generator.admins(count, get_password_hash(args.admin_password)),
+        "donors": generator.donors_rows,
+        "donations": generator.donations,
+        "subscribers": generator.subscribers,
+        "volunteers": generator.volunteers,
+    }
+    postgres = engine.dialect.name == "postgresql"
+    load = load_postgres if postgres else load_sqlite
+
+    with engine.connect() as connection:
+        if not postgres:
+            # Bulk load only: a crash mid-seed just means seeding again
+            connection.connection.driver_connection.execute("PRAGMA synchronous=OFF")
+        with connection.begin():
+            if postgres:
+                prepare_partitions(connection, generator)
+            for table in args.tables.split(","):
+                table = table.strip()
+                if args.truncate:
+                    connection.execute(text(f"TRUNCATE {table}" if postgres else f"DELETE FROM {table}"))
+                start = time.perf_counter()
+                loaded = load(connection, table, producers[table](sizes[table]), args.batch)
+                elapsed = time.perf_counter() - start
+                print(f"{table:<12} {loaded:>11} rows  {elapsed:8.1f}s  {loaded / elapsed if elapsed else math.inf:>10.0f} rows/s")
+        if not postgres:
+            connection.connection.driver_connection.execute("PRAGMA synchronous=NORMAL")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
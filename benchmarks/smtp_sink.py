@@ -0,0 +1,211 @@
+""" Local SMTP stand-in for newsletter delivery benchmarks
+
+    python -m benchmarks.smtp_sink --port 2525 --rtt-ms 20 --latency-ms 2
+    SMTP_HOST=127.0.0.1 SMTP_PORT=2525 SMTP_SECURITY=none ...
+
+Speaks enough ESMTP for api/utils/email_service.py: EHLO (advertising
+PIPELINING and AUTH PLAIN LOGIN), HELO, AUTH, MAIL, RCPT, DATA, RSET, NOOP
+and QUIT. Any credentials are accepted and messages are counted, then
+discarded. --rtt-ms delays every batch of replies like a network round
+trip would, and --latency-ms each accepted message like a server queueing
+it, so that the effect of pipelining and pooling shows up on loopback.
+--domain-limit gmail.com=50 answers RCPTs to gmail.com beyond 50 per
+second with 451 4.7.1, like a provider throttling a bulk sender.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+
+@dataclass
+class SinkStats:
+    connections: int = 0
+    messages: int = 0
+    recipients: int = 0
+    deferred: int = 0
+    bytes: int = 0
+    started: float = field(default_factory=time.perf_counter)
+
+
+class SMTPSink:
+    """Line-oriented SMTP state machine; replies to each read are sent together
+
+    ``rtt`` is added once per batch of replies, modelling the network round
+    trip that a client pays each time it waits for an answer; pipelined
+    commands arrive in one read and so pay it once. ``latency`` is added per
+    accepted message.
+    """
+
+    def __init__(self, latency: float = 0.0, rtt: float = 0.0, max_messages_per_connection: int = 0,
+                 pipelining: bool = True, domain_limits: Optional[Dict[str, float]] = None):
+        self.latency = latency
+        self.rtt = rtt
+        self.max_messages_per_connection = max_messages_per_connection
+        self.pipelining = pipelining
+        # domain -> accepted recipients per second, like a provider's inbound limit
+        self.domain_limits = domain_limits or {}
+        self._allowance: Dict[str, Tuple[float, float]] = {}
+        self.stats = SinkStats()
+
+    def over_limit(self, address: str) -> bool:
+        """Token bucket per limited domain (burst of one second), shared by all connections"""
+        domain = address.strip("<>").rpartition("@")[2].lower()
+        rate = self.domain_limits.get(domain)
+        if rate is None:
+            return False
+        now = time.monotonic()
+        tokens, updated = self._allowance.get(domain, (rate, now))
+        tokens = min(rate, tokens + (now - updated) * rate)
+        if tokens < 1:
+            self._allowance[domain] = (tokens, now)
+            return True
+        self._allowance[domain] = (tokens - 1, now)
+        return False
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self.handle, host, port)
+
+    def ehlo_lines(self):
+        lines = ["localhost"]
+        if self.pipelining:
+            lines.append("PIPELINING")
+        lines += ["8BITMIME", "AUTH PLAIN LOGIN"]
+        return lines
+
+    def command(self, session: dict, verb: str, argument: str) -> str:
+        """Reply to one command; session carries the per-connection state"""
+        if verb == "EHLO":
+            lines = self.ehlo_lines()
+            return "\r\n".join(f"250-{line}" for line in lines[:-1]) + f"\r\n250 {lines[-1]}"
+        if verb == "HELO":
+            return "250 localhost"
+        if verb == "AUTH":
+            if argument.upper().startswith("LOGIN"):
+                session["auth_login"] = 2
+                return "334 VXNlcm5hbWU6"
+            return "235 2.7.0 Authenticated"
+        if verb == "MAIL":
+            if self.max_messages_per_connection and session["messages"] >= self.max_messages_per_connection:
+                session["closing"] = True
+                return "421 4.7.0 Too many messages on this connection"
+            session["sender"], session["recipients"] = argument, []
+            return "250 2.1.0 OK"
+        if verb == "RCPT":
+            if session["sender"] is None:
+                return "503 5.5.1 Need MAIL first"
+            if self.over_limit(argument.partition(":")[2]):
+                self.stats.deferred += 1
+                return "451 4.7.1 Too many messages to this domain, try again later"
+            session["recipients"].append(argument)
+            return "250 2.1.5 OK"
+        if verb == "DATA":
+            if not session["recipients"]:
+                return "503 5.5.1 Need RCPT first"
+            session["data"] = 0
+            return "354 End data with <CR><LF>.<CR><LF>"
+        if verb == "RSET":
+            session["sender"], session["recipients"] = None, []
+            return "250 2.0.0 OK"
+        if verb == "NOOP":
+            return "250 2.0.0 OK"
+        if verb == "QUIT":
+            session["closing"] = True
+            return "221 2.0.0 Bye"
+        return "502 5.5.2 Command not recognized"
+
+    def end_of_data(self, session: dict) -> str:
+        session["messages"] += 1
+        self.stats.messages += 1
+        self.stats.recipients += len(session["recipients"])
+        self.stats.bytes += session["data"]
+        session["sender"], session["recipients"], session["data"] = None, [], None
+        return "250 2.0.0 Queued"
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.stats.connections += 1
+        session = {"sender": None, "recipients": [], "messages": 0, "data": None,
+                   "auth_login": 0, "closing": False}
+        writer.write(b"220 localhost ESMTP sink\r\n")
+        pending = b""
+        try:
+            while not session["closing"]:
+                chunk = await reader.read(65536)
+                if not chunk:
+                    break
+                lines = (pending + chunk).split(b"\r\n")
+                pending = lines.pop()
+                replies, accepted = [], 0
+                for line in lines:
+                    if session["data"] is not None:
+                        if line == b".":
+                            replies.append(self.end_of_data(session))
+                            accepted += 1
+                        else:
+                            session["data"] += len(line) + 2
+                    elif session["auth_login"]:
+                        session["auth_login"] -= 1
+                        replies.append("334 UGFzc3dvcmQ6" if session["auth_login"] else "235 2.7.0 Authenticated")
+                    elif not session["closing"]:
+                        verb, _, argument = line.decode("utf-8", "replace").partition(" ")
+                        replies.append(self.command(session, verb.upper(), argument))
+                if not replies:
+                    continue
+                delay = self.rtt + self.latency * accepted
+                if delay:
+                    await asyncio.sleep(delay)
+                writer.write("".join(f"{reply}\r\n" for reply in replies).encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+def parse_domain_limits(values) -> Dict[str, float]:
+    limits = {}
+    for value in values or ():
+        domain, _, rate = value.partition("=")
+        limits[domain.lower()] = float(rate)
+    return limits
+
+
+async def serve(host: str, port: int, latency: float, rtt: float, max_messages: int,
+                domain_limits: Dict[str, float]) -> None:
+    sink = SMTPSink(latency, rtt, max_messages, domain_limits=domain_limits)
+    server = await sink.start(host, port)
+    print(f"SMTP sink listening on {host}:{port}", file=sys.stderr)
+    async with server:
+        last = 0
+        while True:
+            await asyncio.sleep(5)
+            stats = sink.stats
+            if stats.messages != last:
+                elapsed = time.perf_counter() - stats.started
+                print(f"{stats.messages} messages on {stats.connections} connections, {stats.deferred} deferred "
+                      f"({stats.messages / elapsed * 60:.0f}/min since start)", file=sys.stderr)
+                last = stats.messages
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2525)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="delay before accepting each message")
+    parser.add_argument("--rtt-ms", type=float, default=0.0, help="simulated network round trip per reply batch")
+    parser.add_argument("--max-messages-per-connection", type=int, default=0, help="0 for no limit")
+    parser.add_argument("--domain-limit", action="append", metavar="DOMAIN=RATE",
+                        help="defer RCPTs to DOMAIN beyond RATE per second (repeatable)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.latency_ms / 1000, args.rtt_ms / 1000, args.max_messages_per_connection,
+                          parse_domain_limits(args.domain_limit)))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+""" Mixed read/write load against the SQLite deployment profile
+
+    python -m benchmarks.sqlite_concurrency --workers 2 --concurrency 64 --duration 20
+
+Starts serve.py on a fresh SQLite file (rate limiting off), then runs a
+closed loop in which --write-ratio of the requests create donations or
+subscribers and the rest read the donation list and subscriber stats.
+Reports throughput, latency percentiles and 5xx responses per request kind;
+"database is locked" failures show up as errors. Exits non-zero if any
+request failed.
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List
+
+from benchmarks.http_client import HTTPConnection, json_body
+from benchmarks.load import summarize
+
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+READS = [
+    ("GET", "/api/v1/donations/?limit=50"),
+    ("GET", "/api/v1/subscribers/stats/summary"),
+]
+
+
+def write_request(sequence: int):
+    if sequence % 2:
+        return "POST", "/api/v1/subscribers/", {"email": f"bench{sequence}@example.com"}
+    return "POST", "/api/v1/donations/donations", {
+        "title": "Benchmark",
+        "amount": 1000 + sequence % 500,
+        "donor_name": f"Donor {sequence}",
+        "donor_email": f"donor{sequence}@example.com",
+        "donor_phone": "08000000000",
+    }
+
+
+def start_server(port: int, workers: int, database: str) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        DB_TYPE="sqlite",
+        SQLITE_PATH=database,
+        RATE_LIMIT_ENABLED="false",
+        CONDITIONAL_GET_ENABLED="false",
+    )
+    return subprocess.Popen(
+        [sys.executable, "serve.py", "--port", str(port), "--workers", str(workers),
+         "--no-access-log", "--log-level", "warning"],
+        cwd=PROJECT_ROOT, env=env,
+    )
+
+
+async def wait_until_ready(port: int, timeout: float = 30.0) -> None:
+    deadline = time.perf_counter() + timeout
+    while True:
+        connection = HTTPConnection("127.0.0.1", port)
+        try:
+            status, _, _ = await connection.request("GET", "/health")
+            if status == 200:
+                return
+        except OSError:
+            pass
+        finally:
+            await connection.close()
+        if time.perf_counter() > deadline:
+            raise RuntimeError("server did not become ready")
+        await asyncio.sleep(0.2)
+
+
+async def run_mixed(port: int, concurrency: int, duration: float, write_ratio: float, seed: int):
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    sequence = itertools.count()
+    deadline = time.perf_counter() + duration
+
+    async def client(index: int):
+        rng = random.Random(seed + index)
+        connection = HTTPConnection("127.0.0.1", port)
+        while time.perf_counter() < deadline:
+            if rng.random() < write_ratio:
+                method, path, payload = write_request(next(sequence))
+                body, headers = json_body(payload)
+            else:
+                method, path = rng.choice(READS)
+                body, headers = None, {}
+            kind = f"{method} {path}"
+            start = time.perf_counter()
+            try:
+                status, _, _ = await connection.request(method, path, body, headers)
+            except (OSError, asyncio.IncompleteReadError):
+                errors[kind] += 1
+                continue
+            if status >= 500:
+                errors[kind] += 1
+            else:
+                latencies[kind].append(time.perf_counter() - start)
+        await connection.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    kinds = sorted(set(latencies) | set(errors))
+    report = {kind: summarize(latencies[kind], errors[kind], elapsed) for kind in kinds}
+    report["overall"] = summarize(
+        [value for kind in kinds for value in latencies[kind]], sum(errors.values()), elapsed
+    )
+    return report
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        server = start_server(args.port, args.workers, os.path.join(directory, "bench.db"))
+        try:
+            asyncio.run(wait_until_ready(args.port))
+            report = asyncio.run(run_mixed(args.port, args.concurrency, args.duration, args.write_ratio, args.seed))
+        finally:
+            server.terminate()
+            server.wait(timeout=60)
+
+    print(f"{'request':<50} {'reqs':>8} {'err':>5} {'rps':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for kind, row in report.items():
+        print(f"{kind[:50]:<50} {row['requests']:>8} {row['errors']:>5} {row['rps']:>9} {row['p50_ms']:>9} {row['p99_ms']:>9}")
+    return 1 if report["overall"]["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
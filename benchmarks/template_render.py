@@ -0,0 +1,80 @@
+""" CPU cost of rendering personalized newsletters
+
+    python -m benchmarks.template_render --messages 100000
+
+Builds complete messages (template rendering, plain-text part, MIME) for
+--messages recipients with the default layout in two ways:
+
+  * naive: a full Jinja2 render, HTML-to-text conversion and EmailMessage
+    per recipient (run on --naive-messages, it is slow);
+  * prepared: api/utils/email_templates.py renders once per campaign and
+    MessageBuilder fills in each recipient.
+
+Reports CPU seconds per 10k messages (time.process_time).
+"""
+import argparse
+import sys
+import time
+from email.message import EmailMessage
+from email.policy import SMTP as SMTP_POLICY
+
+from api.utils.email_service import MessageBuilder
+from api.utils.email_templates import default_layout, newsletter_context, recipient_context
+from api.utils.settings import settings
+from benchmarks.seed import person
+
+
+CONTENT = "\n\n".join(
+    f"Update {index}: thanks to your support the foundation reached more families this month."
+    for index in range(12)
+)
+
+
+def naive(compiled, context, emails):
+    for email in emails:
+        rendered = compiled.render({**context, **recipient_context(email)})
+        message = EmailMessage(policy=SMTP_POLICY)
+        message["From"] = settings.FROM_EMAIL
+        message["To"] = email
+        message["Subject"] = rendered.subject
+        message.set_content(rendered.text)
+        message.add_alternative(rendered.html, subtype="html")
+        message.as_bytes()
+
+
+def prepared(compiled, context, emails):
+    builder = MessageBuilder(compiled.prepare(context))
+    for email in emails:
+        builder.build(email)
+
+
+def measure(function, *args) -> float:
+    start = time.process_time()
+    function(*args)
+    return time.process_time() - start
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--naive-messages", type=int, default=5_000)
+    args = parser.parse_args()
+
+    compiled = default_layout()
+    context = newsletter_context("Our monthly update", CONTENT, None)
+    emails = [person(index)[1] for index in range(args.messages)]
+
+    rows = []
+    if args.naive_messages:
+        count = min(args.naive_messages, args.messages)
+        rows.append(("naive", count, measure(naive, compiled, context, emails[:count])))
+    rows.append(("prepared", args.messages, measure(prepared, compiled, context, emails)))
+
+    print(f"{'mode':<10} {'messages':>9} {'cpu s':>8} {'cpu s/10k':>10} {'us/msg':>8}")
+    for mode, count, seconds in rows:
+        print(f"{mode:<10} {count:>9} {seconds:>8.2f} {seconds / count * 10_000:>10.3f} {seconds / count * 1e6:>8.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
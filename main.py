@@ -1,43 +1,102 @@
 # main.py with improved CORS configuration for cookie handling
 
-from fastapi import FastAPI, Request
+from contextlib import asynccontextmanager
+import asyncio
+import hmac
+import logging
+from fastapi import Depends, FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.middleware.sessions import SessionMiddleware 
-from starlette.middleware.base import BaseHTTPMiddleware
-from collections import defaultdict
 import os
 
-from api.db.database import engine
+from api.db import partitions
+from api.db.database import engine, get_db
 from api.v1.models.models import Base
 from api.v1.routes import (
     auth,
     donations,
     volunteer,
+    newsletter,
     donor,
     subscriber
 )
 from api.utils.settings import settings
+from api.utils.metrics import MetricsMiddleware, PROMETHEUS_CONTENT_TYPE, registry
+from api.utils.profiling import ProfilingMiddleware
+from api.utils.rate_limit import RateLimitMiddleware, build_store
+from api.utils.compression import CompressionMiddleware
+from api.utils.traffic_capture import TrafficCaptureMiddleware
+from api.utils.newsletter_scheduler import scheduler as newsletter_scheduler
+from api.utils.entity_counters import clear_reconcile_marker, run_reconciler
 from api.v1.routes import api_version_one
+from api.v1.routes.auth import get_current_admin_or_superadmin, get_current_user, security
+
+MEDIA_DIR = './media'
+
+# Set once startup work has run in this process. A prefork master runs it
+# before forking so workers inherit the flag and skip it.
+_startup_done = False
+
+
+def run_startup_tasks():
+    """One-time setup: local storage directory and schema check"""
+    global _startup_done
+    if _startup_done:
+        return
+    os.makedirs(MEDIA_DIR, exist_ok=True)
+    if partitioning_enabled():
+        partitions.create_partitioned_table(engine)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        # The first worker to start recounts the stats counters, once
+        clear_reconcile_marker(connection)
+    _startup_done = True
+
+
+def partitioning_enabled() -> bool:
+    if not settings.DONATION_PARTITIONING:
+        return False
+    if engine.dialect.name != "postgresql":
+        logging.getLogger(__name__).warning("DONATION_PARTITIONING needs PostgreSQL; ignoring it")
+        return False
+    return True
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    run_startup_tasks()
+    # Every worker runs it; partition DDL is serialized with an advisory lock
+    maintenance = asyncio.create_task(partitions.maintain(engine)) if partitioning_enabled() else None
+    # Every worker runs one too; each send is claimed through a database lease
+    scheduler = asyncio.create_task(newsletter_scheduler.run()) if settings.NEWSLETTER_SCHEDULER_ENABLED else None
+    # Recounts stats counters at startup, then periodically; one worker claims each run
+    reconciler = asyncio.create_task(run_reconciler()) if settings.ENTITY_COUNTER_RECONCILE_SECONDS > 0 else None
+    yield
+    if maintenance:
+        maintenance.cancel()
+    if scheduler:
+        scheduler.cancel()
+    if reconciler:
+        reconciler.cancel()
 
-# Create all tables
-Base.metadata.create_all(bind=engine)
 
 app = FastAPI(
     title="PSF Admin Dashboard API",
     description="Backend API for Paul Smith Foundation Admin Dashboard",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-# Request count middleware
-request_counter = defaultdict(lambda: defaultdict(int))
-class RequestCountMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        endpoint = request.url.path
-        ip_address = request.client.host
-        request_counter[endpoint][ip_address] += 1
-        return await call_next(request)
+# Throttle public write endpoints before any dependency or database work.
+# Added first so it sits inside CORS and 429s still carry CORS headers.
+if settings.RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware, store=build_store())
+
+# Compress large textual responses (brotli if installed, else gzip)
+app.add_middleware(CompressionMiddleware, minimum_size=settings.COMPRESSION_MINIMUM_SIZE)
 
 # Improved CORS middleware configuration for development
 app.add_middleware(
@@ -57,21 +116,30 @@ app.add_middleware(
 )
 
 app.add_middleware(SessionMiddleware, secret_key=settings.SECRET_KEY)
-app.add_middleware(RequestCountMiddleware)
+
+# On-demand profiling (superadmin X-Profile header or 1-in-N sampling)
+if settings.PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
+# Redacted traffic capture for replay (see benchmarks/replay.py)
+if settings.TRAFFIC_CAPTURE_FILE:
+    app.add_middleware(TrafficCaptureMiddleware, path=settings.TRAFFIC_CAPTURE_FILE)
+
+# Request metrics (outermost so it sees every response, including CORS rejections)
+app.add_middleware(MetricsMiddleware)
 
 # Static and template directories
 # email_templates = Jinja2Templates(directory='api/core/dependencies/email/templates')
 # EMAIL_STATIC_DIR = 'api/core/dependencies/email/static'
 # app.mount(f'/{EMAIL_STATIC_DIR}', StaticFiles(directory=EMAIL_STATIC_DIR), name='email-static')
 
-MEDIA_DIR = './media'
-os.makedirs(MEDIA_DIR, exist_ok=True)
-app.mount('/media', StaticFiles(directory=MEDIA_DIR), name='media')
+# The directory is created in run_startup_tasks, not at import time
+app.mount('/media', StaticFiles(directory=MEDIA_DIR, check_dir=False), name='media')
 
 # Include versioned API routers
 api_version_one.include_router(auth.router, prefix="/auth", tags=["Auth"])
 api_version_one.include_router(donations.router, prefix="/donations", tags=["Donations"])
-api_version_one.include_router(volunteer.router, prefix="/newsletters", tags=["Newsletters"])
+api_version_one.include_router(newsletter.router, prefix="/newsletters", tags=["Newsletters"])
 api_version_one.include_router(volunteer.router, prefix="/volunteers", tags=["volunteers"])
 api_version_one.include_router(donor.router, prefix="/donors", tags=["donors"])
 api_version_one.include_router(subscriber.router, prefix="/subscribers", tags=["subscribers"])
@@ -88,6 +156,21 @@ async def root():
 async def health_check():
     return {"status": "healthy", "service": "PSF Admin API"}
 
+async def get_metrics_reader(request: Request, db: AsyncSession = Depends(get_db)):
+    """Accept METRICS_TOKEN as a bearer token when one is configured, else require an admin
+
+    The metrics include client addresses and per-route timings.
+    """
+    credentials = await security(request)
+    if credentials and settings.METRICS_TOKEN and hmac.compare_digest(credentials.credentials, settings.METRICS_TOKEN):
+        return None
+    current_user = await get_current_user(credentials, db)
+    return await get_current_admin_or_superadmin(current_user)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(reader = Depends(get_metrics_reader)):
+    return PlainTextResponse(registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
 # Debug endpoint to check cookies (remove in production)
 @app.get("/debug/cookies")
 async def debug_cookies(request: Request):
@@ -97,7 +180,7 @@ async def debug_cookies(request: Request):
         "client": request.client.host if request.client else None
     }
 
-# Run server
+# Run development server (use serve.py for production)
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -0,0 +1,216 @@
+""" Production entry point: a prefork launcher around uvicorn
+
+    python serve.py --workers 4 --port 8000
+
+The master imports and warms the app once (routes, OpenAPI schema, middleware
+stack, database schema), freezes the GC so the warmed heap stays shared
+copy-on-write, binds the listening socket and forks the workers. Each worker
+serves up to --max-requests requests (plus jitter) before exiting and being
+replaced, which caps slow memory growth. SIGTERM/SIGINT stop the workers
+gracefully: they stop accepting, finish in-flight requests and are killed only
+after --graceful-timeout seconds.
+
+Workers exit with status 0 when recycled and non-zero when they crash or
+fail to start (an exception in the lifespan, an unreachable database).
+Crashed workers are replaced after an exponential back-off. After
+--max-startup-failures failures in a row, each within STABLE_SECONDS of
+its start, the master stops the pool and exits with status 1 instead of
+forking forever.
+
+For local development keep using ``python main.py`` (auto-reload).
+"""
+import argparse
+import gc
+import logging
+import os
+import random
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+from api.utils.settings import settings
+
+
+logger = logging.getLogger("serve")
+
+# uvicorn's exit status when the server did not start (lifespan failure)
+STARTUP_FAILURE = 3
+RESPAWN_BACKOFF = 0.5  # seconds before the first replacement of a crashed worker
+MAX_RESPAWN_BACKOFF = 30.0
+# A worker that crashes after running this long is not a startup failure
+STABLE_SECONDS = 30.0
+
+
+def default_workers() -> int:
+    return settings.WEB_CONCURRENCY or os.cpu_count() or 1
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the API with preforked uvicorn workers")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--max-requests", type=int, default=settings.MAX_REQUESTS,
+                        help="recycle a worker after this many requests (0 disables)")
+    parser.add_argument("--max-requests-jitter", type=int, default=settings.MAX_REQUESTS_JITTER)
+    parser.add_argument("--graceful-timeout", type=int, default=settings.GRACEFUL_TIMEOUT)
+    parser.add_argument("--max-startup-failures", type=int, default=5,
+                        help="give up after this many workers in a row fail soon after starting")
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--no-access-log", action="store_true")
+    return parser.parse_args()
+
+
+def load_app():
+    """Import and warm the application in the master before forking"""
+    gc.disable()  # avoid collections touching (and un-sharing) pages while loading
+
+    import main
+    from api.db.database import engine
+
+    main.run_startup_tasks()
+    main.app.openapi()
+    main.app.middleware_stack = main.app.build_middleware_stack()
+
+    # Connections opened while warming must not be shared with the children
+    engine.dispose()
+
+    gc.collect()
+    gc.freeze()
+    return main.app
+
+
+def bind_socket(host: str, port: int, backlog: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Master:
+    def __init__(self, app, sock: socket.socket, args):
+        self.app = app
+        self.sock = sock
+        self.args = args
+        self.workers = {}  # pid -> start time
+        self.stopping = False
+        self.failures = 0  # consecutive quick worker failures
+
+    def spawn(self) -> None:
+        max_requests = None
+        if self.args.max_requests > 0:
+            max_requests = self.args.max_requests + random.randint(0, self.args.max_requests_jitter)
+
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = time.monotonic()
+            return
+
+        # Worker process; own process group so a terminal Ctrl-C only reaches
+        # the master, which then stops the workers exactly once
+        os.setpgid(0, 0)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGALRM, signal.SIG_DFL)
+        gc.enable()
+        config = uvicorn.Config(
+            self.app,
+            limit_max_requests=max_requests,
+            timeout_graceful_shutdown=self.args.graceful_timeout,
+            log_level=self.args.log_level,
+            access_log=not self.args.no_access_log,
+        )
+        status = 1
+        try:
+            server = uvicorn.Server(config)
+            server.run(sockets=[self.sock])
+            status = 0 if server.started else STARTUP_FAILURE
+        except BaseException:
+            logger.exception("Worker failed")
+        finally:
+            os._exit(status)
+
+    def stop(self, signum, frame) -> None:
+        if self.stopping:
+            return
+        self.stopping = True
+        logger.info("Shutting down %d workers (graceful timeout %ss)", len(self.workers), self.args.graceful_timeout)
+        for pid in list(self.workers):
+            self._signal(pid, signal.SIGTERM)
+        signal.alarm(self.args.graceful_timeout + 1)
+
+    def kill(self, signum, frame) -> None:
+        for pid in list(self.workers):
+            logger.warning("Worker %d did not drain in time, killing it", pid)
+            self._signal(pid, signal.SIGKILL)
+
+    def _signal(self, pid: int, signum: int) -> None:
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            self.workers.pop(pid, None)
+
+    def respawn_delay(self, exit_code: int, lifetime: float) -> float:
+        """Seconds to wait before replacing a worker; raises RuntimeError to give up"""
+        if exit_code == 0:
+            self.failures = 0
+            return 0.0
+        self.failures = self.failures + 1 if lifetime < STABLE_SECONDS else 1
+        if lifetime < STABLE_SECONDS and self.failures >= self.args.max_startup_failures:
+            raise RuntimeError(f"{self.failures} workers in a row failed within {STABLE_SECONDS:g}s of starting")
+        return min(MAX_RESPAWN_BACKOFF, RESPAWN_BACKOFF * 2 ** (self.failures - 1))
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGALRM, self.kill)
+
+        for _ in range(self.args.workers):
+            self.spawn()
+        logger.info("Serving on %s:%d with %d workers", self.args.host, self.args.port, self.args.workers)
+
+        exit_status = 0
+        while self.workers:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            started = self.workers.pop(pid, None)
+            if self.stopping:
+                continue
+            exit_code = os.waitstatus_to_exitcode(status)
+            try:
+                delay = self.respawn_delay(exit_code, time.monotonic() - (started or 0.0))
+            except RuntimeError as error:
+                logger.error("Giving up: %s", error)
+                exit_status = 1
+                self.stop(None, None)
+                continue
+            if exit_code == 0:
+                # Recycled after max requests
+                logger.info("Worker %d exited, starting a replacement", pid)
+            else:
+                logger.warning("Worker %d failed with status %d, replacing it in %.1fs", pid, exit_code, delay)
+                time.sleep(delay)
+            if not self.stopping:
+                self.spawn()
+        self.sock.close()
+        return exit_status
+
+
+def main() -> int:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(process)d] %(message)s")
+    args = parse_args()
+    app = load_app()
+    sock = bind_socket(args.host, args.port, args.backlog)
+    return Master(app, sock, args).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
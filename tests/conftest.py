@@ -0,0 +1,99 @@
+""" Shared fixtures
+
+Settings are read from the environment when api.utils.settings is imported,
+so the environment is filled in here, before any test module imports the
+application. The app's own engines point at a throwaway SQLite file; tests
+that only need tables use the ``sessions`` fixture, a fresh database each.
+Async tests run on asyncio through anyio's pytest plugin.
+"""
+import os
+import tempfile
+
+_TMP = tempfile.mkdtemp(prefix="psf-tests-")
+
+for _name, _value in {
+    "PYTHON_ENV": "test",
+    "SECRET_KEY": "test-secret",
+    "ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+    "JWT_REFRESH_EXPIRY": "7",
+    "APP_URL": "http://testserver",
+    "DEBUG": "False",
+    "ENVIRONMENT": "test",
+    "APP_NAME": "psf-tests",
+    "APP_VERSION": "test",
+    "JWT_SECRET_KEY": "test-jwt-secret",
+    "DATABASE_URL": "sqlite://",
+    "DB_HOST": "localhost",
+    "DB_PORT": "5432",
+    "DB_NAME": "psf",
+    "DB_USER": "psf",
+    "DB_PASSWORD": "psf",
+    "SMTP_HOST": "127.0.0.1",
+    "SMTP_PORT": "2525",
+    "SMTP_USER": "",
+    "SMTP_PASSWORD": "",
+    "FROM_EMAIL": "news@example.org",
+    "ALLOWED_ORIGINS": "*",
+    "MAX_FILE_SIZE": "5000000",
+    "UPLOAD_DIR": os.path.join(_TMP, "media"),
+    "CLOUDINARY_CLOUD_NAME": "test",
+    "CLOUDINARY_API_KEY": "test",
+    "CLOUDINARY_API_SECRET": "test",
+}.items():
+    os.environ.setdefault(_name, _value)
+
+# Never a real database, and no background work competing with the tests
+os.environ.update(
+    DB_TYPE="sqlite",
+    SQLITE_PATH=os.path.join(_TMP, "app.db"),
+    RATE_LIMIT_ENABLED="false",
+    NEWSLETTER_SCHEDULER_ENABLED="false",
+    ENTITY_COUNTER_RECONCILE_SECONDS="0",
+    PROFILE_DIR=os.path.join(_TMP, "profiles"),
+    DONATION_ARCHIVE_DIR=os.path.join(_TMP, "archive"),
+    RECEIPT_STORAGE="local",
+)
+
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def sessions(tmp_path):
+    """Session factory over a fresh SQLite file with every table, one writer connection"""
+    from api.db.database import configure_sqlite
+    from api.v1.models.models import Base
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}", pool_size=1, max_overflow=0)
+    configure_sqlite(engine.sync_engine, writer=True)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    yield async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+    await engine.dispose()
+
+
+@pytest.fixture(scope="session")
+def client():
+    """The application, started once, on the throwaway SQLite file"""
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture(scope="session")
+def admin_headers(client):
+    """Bearer header of a superadmin"""
+    credentials = {"email": "superadmin@example.org", "password": "correct horse battery"}
+    client.post("/api/v1/auth/create-superadmin", json={**credentials, "first_name": "Super", "last_name": "Admin"})
+    response = client.post("/api/v1/auth/login", json=credentials)
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['data']['access_token']}"}
@@ -0,0 +1,49 @@
+import pytest
+
+from api.db.database import async_engine
+from api.v1.routes import auth
+
+
+@pytest.fixture
+def writer_checkouts(monkeypatch):
+    """Writer connections checked out whenever bcrypt runs"""
+    seen = []
+    pool = async_engine.sync_engine.pool
+    verify, hash_ = auth.verify_password, auth.get_password_hash
+
+    def checked_verify(*args):
+        seen.append(pool.checkedout())
+        return verify(*args)
+
+    def checked_hash(*args):
+        seen.append(pool.checkedout())
+        return hash_(*args)
+
+    monkeypatch.setattr(auth, "verify_password", checked_verify)
+    monkeypatch.setattr(auth, "get_password_hash", checked_hash)
+    return seen
+
+
+def test_bcrypt_runs_without_holding_the_writer(client, admin_headers, writer_checkouts):
+    admin = {"email": "editor@example.org", "password": "another long password"}
+    response = client.post("/api/v1/auth/register", headers=admin_headers,
+                           json={**admin, "first_name": "Ed", "last_name": "Itor"})
+    assert response.status_code == 201, response.text
+    assert client.post("/api/v1/auth/login", json=admin).status_code == 200
+    assert client.post("/api/v1/auth/login", json={**admin, "password": "wrong"}).status_code == 401
+    assert writer_checkouts == [0, 0, 0]
+
+
+def test_register_rejects_duplicates(client, admin_headers):
+    admin = {"email": "twice@example.org", "password": "another long password", "first_name": "T", "last_name": "W"}
+    assert client.post("/api/v1/auth/register", headers=admin_headers, json=admin).status_code == 201
+    response = client.post("/api/v1/auth/register", headers=admin_headers, json=admin)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Email already registered"
+
+
+def test_only_one_superadmin(client, admin_headers):
+    response = client.post("/api/v1/auth/create-superadmin", json={
+        "email": "second@example.org", "password": "yet another password", "first_name": "S", "last_name": "S",
+    })
+    assert response.status_code == 403
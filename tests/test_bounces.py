@@ -0,0 +1,126 @@
+import json
+
+from api.utils.bounces import BounceEvent, parse_dsn, parse_json
+
+DSN = b"""\
+From: Mail Delivery System <MAILER-DAEMON@mx.example.net>
+To: news@example.org
+Subject: Undelivered Mail Returned to Sender
+MIME-Version: 1.0
+Content-Type: multipart/report; report-type=delivery-status; boundary="b1"
+
+--b1
+Content-Type: text/plain
+
+Delivery failed.
+
+--b1
+Content-Type: message/delivery-status
+
+Reporting-MTA: dns; mx.example.net
+
+Final-Recipient: rfc822; gone@example.com
+Action: failed
+Status: 5.1.1
+Diagnostic-Code: smtp; 550 5.1.1 User
+    unknown
+
+Final-Recipient: rfc822; full@example.com
+Action: delayed
+Status: 4.2.2
+
+Final-Recipient: rfc822; fine@example.com
+Action: delivered
+Status: 2.0.0
+
+--b1--
+"""
+
+ARF = b"""\
+From: abuse@isp.example
+To: news@example.org
+MIME-Version: 1.0
+Content-Type: multipart/report; report-type=feedback-report; boundary="b2"
+
+--b2
+Content-Type: text/plain
+
+This is a spam report.
+
+--b2
+Content-Type: message/feedback-report
+
+Feedback-Type: abuse
+User-Agent: isp-fbl/1.0
+Version: 1
+
+--b2
+Content-Type: text/rfc822-headers
+
+From: news@example.org
+To: Angry Reader <angry@example.com>
+Subject: Our newsletter
+
+--b2--
+"""
+
+
+def test_dsn_reports_failed_and_delayed_recipients():
+    assert parse_dsn(DSN) == [
+        BounceEvent("gone@example.com", "bounce", True, "5.1.1 smtp; 550 5.1.1 User unknown"),
+        BounceEvent("full@example.com", "bounce", False, "4.2.2"),
+    ]
+
+
+def test_abuse_report_names_the_recipient_from_the_original_headers():
+    assert parse_dsn(ARF) == [BounceEvent("angry@example.com", "complaint", True, "abuse")]
+
+
+def test_mbox_of_reports():
+    mbox = b"From MAILER-DAEMON Mon Oct 19 10:00:00 2026\n" + DSN + b"\nFrom abuse Mon Oct 19 10:01:00 2026\n" + ARF
+    assert [event.email for event in parse_dsn(mbox)] == ["gone@example.com", "full@example.com", "angry@example.com"]
+
+
+def test_generic_json_events():
+    body = json.dumps({"events": [
+        {"type": "bounce", "email": "a@example.com", "status": "5.1.1"},
+        {"type": "bounce", "email": "b@example.com", "status": "4.4.7"},
+        {"type": "bounce", "email": "c@example.com", "status": "4.4.7", "permanent": True},
+        {"type": "complaint", "recipient": "d@example.com"},
+        {"type": "delivery", "email": "e@example.com"},
+    ]}).encode()
+    assert [(event.email, event.kind, event.suppresses) for event in parse_json(body)] == [
+        ("a@example.com", "bounce", True),
+        ("b@example.com", "bounce", False),
+        ("c@example.com", "bounce", True),
+        ("d@example.com", "complaint", True),
+    ]
+
+
+def test_ses_notifications_through_sns():
+    bounce = {
+        "notificationType": "Bounce",
+        "bounce": {"bounceType": "Permanent", "bouncedRecipients": [
+            {"emailAddress": "gone@example.com", "status": "5.1.1", "diagnosticCode": "smtp; 550 unknown"},
+        ]},
+    }
+    complaint = {"notificationType": "Complaint", "complaint": {
+        "complainedRecipients": [{"emailAddress": "angry@example.com"}], "complaintFeedbackType": "abuse",
+    }}
+    body = json.dumps([{"Type": "Notification", "Message": json.dumps(message)} for message in (bounce, complaint)])
+    assert parse_json(body.encode()) == [
+        BounceEvent("gone@example.com", "bounce", True, "5.1.1 smtp; 550 unknown"),
+        BounceEvent("angry@example.com", "complaint", True, "abuse"),
+    ]
+
+
+def test_sendgrid_blocks_are_transient():
+    body = json.dumps([
+        {"event": "bounce", "email": "gone@example.com", "type": "bounce", "status": "5.0.0"},
+        {"event": "bounce", "email": "blocked@example.com", "type": "blocked", "status": "4.0.0"},
+        {"event": "spamreport", "email": "angry@example.com"},
+        {"event": "open", "email": "fine@example.com"},
+    ]).encode()
+    assert [(event.email, event.suppresses) for event in parse_json(body)] == [
+        ("gone@example.com", True), ("blocked@example.com", False), ("angry@example.com", True),
+    ]
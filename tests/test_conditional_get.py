@@ -0,0 +1,93 @@
+import gzip
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from api.utils.compression import CompressionMiddleware, choose_encoding
+
+DONATION = {
+    "title": "Conditional", "donor_name": "Ada", "donor_email": "ada@example.org",
+    "donor_phone": "0800", "amount": 5,
+}
+
+
+def test_unchanged_list_is_answered_with_304(client):
+    first = client.get("/api/v1/donations/")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert etag.startswith('W/"')
+
+    again = client.get("/api/v1/donations/", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.headers["etag"] == etag
+    assert again.content == b""
+
+    # Weak comparison, and the other forms of If-None-Match
+    assert client.get("/api/v1/donations/", headers={"If-None-Match": etag[2:]}).status_code == 304
+    assert client.get("/api/v1/donations/", headers={"If-None-Match": f'"stale", {etag}'}).status_code == 304
+    assert client.get("/api/v1/donations/", headers={"If-None-Match": "*"}).status_code == 304
+
+
+def test_a_write_changes_the_etag(client):
+    etag = client.get("/api/v1/donations/").headers["etag"]
+    assert client.post("/api/v1/donations/donations", json=DONATION).status_code == 200
+
+    response = client.get("/api/v1/donations/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+def test_etag_depends_on_the_query(client):
+    plain = client.get("/api/v1/donations/").headers["etag"]
+    limited = client.get("/api/v1/donations/?limit=1").headers["etag"]
+    assert plain != limited
+    assert client.get("/api/v1/donations/?limit=1", headers={"If-None-Match": plain}).status_code == 200
+
+
+def test_choose_encoding_honours_quality():
+    assert choose_encoding("gzip, deflate") == "gzip"
+    assert choose_encoding("gzip;q=0") is None
+    assert choose_encoding("*") == "gzip"
+    assert choose_encoding("identity") is None
+
+
+def compressing_client():
+    rows = [{"id": index, "email": f"user{index}@example.org"} for index in range(200)]
+
+    async def large(request):
+        return JSONResponse(rows)
+
+    async def small(request):
+        return JSONResponse({"ok": True})
+
+    async def stream(request):
+        return StreamingResponse((f"{index}\n" for index in range(1000)), media_type="application/x-ndjson")
+
+    app = Starlette(routes=[Route("/large", large), Route("/small", small), Route("/stream", stream)])
+    return TestClient(CompressionMiddleware(app, minimum_size=1024)), rows
+
+
+def test_large_text_responses_are_gzipped():
+    client, rows = compressing_client()
+    response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.json() == rows
+    assert int(response.headers["content-length"]) < len(response.content) / 4
+
+
+def test_small_and_unrequested_responses_pass_through():
+    client, _ = compressing_client()
+    assert "content-encoding" not in client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+    assert "content-encoding" not in client.get("/large", headers={"Accept-Encoding": "identity"}).headers
+
+
+def test_streamed_responses_are_compressed_chunk_by_chunk():
+    client, _ = compressing_client()
+    with client.stream("GET", "/stream", headers={"Accept-Encoding": "gzip"}) as response:
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        raw = b"".join(response.iter_raw())
+    assert gzip.decompress(raw).decode() == "".join(f"{index}\n" for index in range(1000))
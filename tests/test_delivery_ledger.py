@@ -0,0 +1,127 @@
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import func, insert, select
+
+from api.utils.delivery_ledger import DeliveryLedger
+from api.utils.email_service import NewsletterSender, SMTPConnection
+from api.utils.send_throttle import DomainThrottle
+from api.v1.models.models import (
+    DeliveryStatus, Newsletter, NewsletterDelivery, NewsletterStatus, Subscriber,
+)
+from benchmarks.smtp_sink import SMTPSink
+
+pytestmark = pytest.mark.anyio
+
+
+class SelectiveSink(SMTPSink):
+    """Answers RCPT for chosen addresses with a temporary or permanent failure"""
+
+    def __init__(self, busy=(), unknown=()):
+        super().__init__()
+        self.busy = set(busy)
+        self.unknown = set(unknown)
+        self.delivered = []
+
+    def command(self, session, verb, argument):
+        if verb == "RCPT":
+            address = argument.partition(":")[2].strip("<>")
+            if address in self.busy:
+                return "454 4.7.0 Temporary failure, try again later"
+            if address in self.unknown:
+                return "550 5.1.1 No such user"
+            self.delivered.append(address)
+        return super().command(session, verb, argument)
+
+
+@pytest.fixture
+async def newsletter(sessions):
+    newsletter_id = uuid4()
+    async with sessions() as session:
+        await session.execute(insert(Subscriber), [{"email": f"reader{i:02d}@example.com"} for i in range(30)])
+        session.add(Newsletter(id=newsletter_id, subject="Hello", content="Hello {{ email }}"))
+        await session.commit()
+    return newsletter_id
+
+
+async def send(sessions, sink, newsletter_id):
+    server = await sink.start()
+    port = server.sockets[0].getsockname()[1]
+    sender = NewsletterSender(
+        sessions, pool_size=2, pipeline_depth=4, batch_size=7,
+        connection_factory=lambda: SMTPConnection("127.0.0.1", port, security="none", sender="news@example.org"),
+        throttle=DomainThrottle.unlimited(),
+    )
+    try:
+        return await sender.send(newsletter_id)
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+async def ledger_counts(sessions, newsletter_id):
+    async with sessions() as session:
+        rows = await session.execute(
+            select(NewsletterDelivery.status, func.count())
+            .where(NewsletterDelivery.newsletter_id == newsletter_id)
+            .group_by(NewsletterDelivery.status)
+        )
+        return dict(rows.all())
+
+
+async def test_deferred_recipients_are_retried_on_the_next_run(sessions, newsletter):
+    busy = {"reader03@example.com", "reader17@example.com"}
+    unknown = {"reader09@example.com"}
+
+    first = await send(sessions, SelectiveSink(busy, unknown), newsletter)
+    assert (first.delivered, first.deferred, first.rejected, first.remaining) == (27, 2, 1, 2)
+    assert await ledger_counts(sessions, newsletter) == {
+        DeliveryStatus.SENT: 27, DeliveryStatus.DEFERRED: 2, DeliveryStatus.BOUNCED: 1,
+    }
+    async with sessions() as session:
+        row = await session.get(Newsletter, newsletter)
+        assert row.status != NewsletterStatus.SENT
+        assert (row.queued_count, row.sent_count, row.deferred_count, row.bounced_count) == (0, 27, 2, 1)
+        last_subscriber = await session.scalar(select(func.max(Subscriber.id)))
+        assert row.checkpoint_subscriber_id == last_subscriber
+
+    sink = SelectiveSink()
+    second = await send(sessions, sink, newsletter)
+    # Only the deferred recipients are mailed again; the bounce is final
+    assert sorted(sink.delivered) == sorted(busy)
+    assert second.complete
+    async with sessions() as session:
+        row = await session.get(Newsletter, newsletter)
+        assert row.status == NewsletterStatus.SENT
+        assert (row.sent_count, row.deferred_count, row.bounced_count) == (29, 0, 1)
+
+
+async def test_send_resumes_after_the_checkpoint(sessions, newsletter):
+    # A run that died right after listing its first page: queued, never sent
+    async with sessions() as session:
+        query = select(Subscriber.id, Subscriber.email).order_by(Subscriber.id).limit(7)
+        first_page = (await session.execute(query)).all()
+    await DeliveryLedger(sessions, newsletter).enqueue(first_page)
+
+    sink = SelectiveSink()
+    report = await send(sessions, sink, newsletter)
+    assert report.complete
+    assert sorted(sink.delivered) == [f"reader{i:02d}@example.com" for i in range(30)]
+    assert await ledger_counts(sessions, newsletter) == {DeliveryStatus.SENT: 30}
+    async with sessions() as session:
+        row = await session.get(Newsletter, newsletter)
+        assert (row.queued_count, row.sent_count) == (0, 30)
+
+
+async def test_attempts_are_capped(sessions, newsletter):
+    sink = SelectiveSink(busy={"reader05@example.com"})
+    ledger = DeliveryLedger(sessions, newsletter)
+    for _ in range(ledger.max_attempts + 1):
+        await send(sessions, sink, newsletter)
+    assert sink.delivered.count("reader05@example.com") == 0
+    async with sessions() as session:
+        attempts = await session.scalar(
+            select(NewsletterDelivery.attempts).where(NewsletterDelivery.email == "reader05@example.com")
+        )
+    assert attempts == ledger.max_attempts
+    assert await ledger.remaining() == 0
@@ -0,0 +1,134 @@
+import asyncio
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import insert
+
+from api.utils.email_service import Envelope, NewsletterSender, SMTPConnection, SMTPPool
+from api.utils.send_throttle import DomainThrottle
+from api.v1.models.models import Newsletter, Subscriber
+from benchmarks.smtp_sink import SMTPSink
+
+pytestmark = pytest.mark.anyio
+
+
+class StallingSink(SMTPSink):
+    """Holds back the reply to the ``stall_at``-th message for ``stall`` seconds
+
+    Without PIPELINING every read carries one command, so the delay applies
+    to exactly one reply.
+    """
+
+    def __init__(self, stall_at: int, stall: float):
+        super().__init__(pipelining=False)
+        self.stall_at = stall_at
+        self.stall = stall
+
+    def command(self, session, verb, argument):
+        self.rtt = 0.0
+        return super().command(session, verb, argument)
+
+    def end_of_data(self, session):
+        self.rtt = self.stall if self.stats.messages + 1 == self.stall_at else 0.0
+        return super().end_of_data(session)
+
+
+async def start(sink):
+    server = await sink.start()
+    port = server.sockets[0].getsockname()[1]
+    return server, lambda: SMTPConnection("127.0.0.1", port, security="none", timeout=0.2, sender="news@example.org")
+
+
+def envelopes(count, prefix="reader"):
+    return [Envelope(f"{prefix}{i}@example.com", b"Subject: hi\r\n\r\nhello\r\n", i) for i in range(count)]
+
+
+async def test_timed_out_connection_is_not_reused():
+    sink = StallingSink(stall_at=2, stall=1.0)
+    server, factory = await start(sink)
+    pool = SMTPPool(1, factory)
+    sender = NewsletterSender(object(), connection_factory=factory)
+    try:
+        results = await sender._send_chunk(pool, envelopes(4))
+        # The retry ran on a new connection and got a reply for every message
+        assert [result.reply.code for result in results] == [250] * 4
+        assert sink.stats.connections == 2
+
+        # The healthy retry connection went back to the pool and keeps working
+        results = await sender._send_chunk(pool, envelopes(3, "later"))
+        assert [result.reply.code for result in results] == [250] * 3
+        assert sink.stats.connections == 2
+    finally:
+        await pool.close()
+        server.close()
+        await server.wait_closed()
+
+
+async def test_connection_is_discarded_when_the_caller_fails():
+    server, factory = await start(SMTPSink())
+    pool = SMTPPool(1, factory)
+    try:
+        with pytest.raises(RuntimeError):
+            async with pool.connection() as connection:
+                raise RuntimeError("caller failed mid-exchange")
+        assert not connection.usable
+        async with pool.connection() as fresh:
+            assert fresh is not connection
+    finally:
+        await pool.close()
+        server.close()
+        await server.wait_closed()
+
+
+class RejectingSink(SMTPSink):
+    def command(self, session, verb, argument):
+        if verb == "RCPT" and "unknown" in argument:
+            return "550 5.1.1 No such user"
+        return super().command(session, verb, argument)
+
+
+async def test_pipelined_batch_reports_each_message():
+    sink = RejectingSink()
+    server, factory = await start(sink)
+    pool = SMTPPool(1, factory)
+    rejected = Envelope("unknown@example.com", b"Subject: hi\r\n\r\n.hidden\r\n", 3)
+    batch = envelopes(3) + [rejected] + envelopes(2, "more")
+    try:
+        async with pool.connection() as connection:
+            assert connection.pipelining
+            results = await connection.send_many(batch)
+        assert [result.reply.code for result in results] == [250, 250, 250, 550, 250, 250]
+        assert [result.envelope.key for result in results] == [0, 1, 2, 3, 0, 1]
+        assert (sink.stats.connections, sink.stats.messages) == (1, 5)
+
+        # The failed transaction was reset; the connection stays in the pool
+        async with pool.connection() as again:
+            assert again is connection
+            assert [result.reply.code for result in await again.send_many(envelopes(2))] == [250, 250]
+    finally:
+        await pool.close()
+        server.close()
+        await server.wait_closed()
+
+
+class FailingConnection(SMTPConnection):
+    async def connect(self):
+        raise RuntimeError("unexpected failure")
+
+
+async def test_failed_send_leaves_no_tasks_behind(sessions):
+    newsletter_id = uuid4()
+    async with sessions() as session:
+        await session.execute(insert(Subscriber), [{"email": f"reader{i}@example.com"} for i in range(50)])
+        session.add(Newsletter(id=newsletter_id, subject="Hello", content="Hello {{ email }}"))
+        await session.commit()
+    sender = NewsletterSender(
+        sessions, pool_size=2, pipeline_depth=5, batch_size=10,
+        connection_factory=lambda: FailingConnection("127.0.0.1", 1, security="none"),
+        throttle=DomainThrottle.unlimited(),
+    )
+    before = asyncio.all_tasks()
+    with pytest.raises(RuntimeError):
+        await sender.send(newsletter_id)
+    await asyncio.sleep(0)
+    assert not asyncio.all_tasks() - before
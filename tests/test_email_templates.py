@@ -0,0 +1,84 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from jinja2.exceptions import SecurityError
+
+from api.utils.email_templates import (
+    compile_template, default_layout, newsletter_context, recipient_context, template_cache,
+)
+
+
+def stored_template(html_content, subject="{{ subject }}", text_content=None):
+    return SimpleNamespace(
+        id=html_content, updated_at=datetime(2026, 1, 1), subject=subject,
+        html_content=html_content, text_content=text_content,
+    )
+
+
+CONTEXT = newsletter_context("Hello", "Body text", None)
+
+
+@pytest.mark.parametrize("source", [
+    "{{ ''.__class__.__mro__[1].__subclasses__() }}",
+    "{{ cycler.__init__.__globals__.os.popen('id').read() }}",
+])
+def test_stored_templates_cannot_reach_python_internals(source):
+    compiled = compile_template(stored_template(source))
+    with pytest.raises(SecurityError):
+        compiled.prepare(CONTEXT).personalize(recipient_context("a@example.org"))
+
+
+def test_stored_templates_still_render():
+    compiled = compile_template(stored_template("<p>{{ subject|upper }}</p><p>{{ email }}</p>"))
+    rendered = compiled.prepare(CONTEXT).personalize(recipient_context("a&b@example.org"))
+    assert rendered.html == "<p>HELLO</p><p>a&amp;b@example.org</p>"
+
+
+def test_default_layout_renders():
+    rendered = default_layout().prepare(CONTEXT).personalize(recipient_context("a@example.org"))
+    assert "Body text" in rendered.html
+    assert rendered.subject == "Hello"
+
+
+def test_plain_recipient_fields_are_filled_into_static_segments():
+    compiled = compile_template(stored_template(
+        "<p>Hi {{ email }}</p><a href=\"{{ unsubscribe_url }}\">Unsubscribe</a>",
+        subject="{{ subject }} for {{ email }}",
+    ))
+    prepared = compiled.prepare(CONTEXT)
+    assert prepared.segments is not None
+
+    recipients = [recipient_context("a@example.org"), recipient_context("<b>@example.org")]
+    first, second = prepared.personalize_batch(recipients)
+    assert first.subject == "Hello for a@example.org"
+    assert "<p>Hi &lt;b&gt;@example.org</p>" in second.html
+    assert "Hi <b>@example.org" in second.text
+    assert [rendered.html for rendered in (first, second)] == [
+        compiled.render({**CONTEXT, **recipient}).html for recipient in recipients
+    ]
+
+
+def test_templates_that_branch_on_recipient_fields_render_in_full():
+    compiled = compile_template(stored_template(
+        "{% if email.endswith('@example.org') %}<p>Colleague</p>{% endif %}<p>{{ email|upper }}</p>"
+    ))
+    prepared = compiled.prepare(CONTEXT)
+    assert prepared.segments is None
+
+    inside, outside = prepared.personalize_batch([
+        recipient_context("a@example.org"), recipient_context("b@example.com"),
+    ])
+    assert inside.html == "<p>Colleague</p><p>A@EXAMPLE.ORG</p>"
+    assert outside.html == "<p>B@EXAMPLE.COM</p>"
+
+
+def test_editing_a_template_replaces_its_cache_entry():
+    row = stored_template("<p>v1</p>")
+    first = compile_template(row)
+    assert compile_template(row) is first
+
+    row.html_content = "<p>v2</p>"
+    row.updated_at = datetime(2026, 1, 2)
+    assert compile_template(row).render(CONTEXT).html == "<p>v2</p>"
+    assert not any(key == (row.id, datetime(2026, 1, 1)) for key in template_cache._entries)
@@ -0,0 +1,90 @@
+import sqlite3
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import delete, select, text
+
+from api.utils.change_tracker import table_version
+from api.utils.entity_counters import (
+    claim_reconcile, clear_reconcile_marker, exact_counts, read_counts, reconcile,
+)
+from api.utils.settings import settings
+from api.v1.models.models import Subscriber, Volunteer
+
+
+@pytest.mark.anyio
+async def test_orm_writes_keep_counters_exact(sessions):
+    async with sessions() as session:
+        session.add_all([Subscriber(email=f"reader{i}@example.com") for i in range(5)])
+        session.add(Volunteer(full_name="Val", email="val@example.com", is_active=False))
+        await session.commit()
+        first = await session.scalar(select(Subscriber).order_by(Subscriber.id).limit(1))
+        first.is_active = False
+        await session.delete(await session.scalar(select(Subscriber).order_by(Subscriber.id.desc()).limit(1)))
+        await session.commit()
+
+        assert await read_counts(session, "subscribers") == await exact_counts(session, "subscribers") == (4, 3)
+        assert await read_counts(session, "volunteers") == (1, 0)
+
+
+@pytest.mark.anyio
+async def test_reconcile_corrects_drift_and_invalidates_etags(sessions):
+    async with sessions() as session:
+        # Raw SQL bypasses both the flush listener and adjust()
+        await session.execute(text(
+            "INSERT INTO subscribers (id, email, is_active) VALUES "
+            f"('{uuid4().hex}', 'a@example.com', 1), ('{uuid4().hex}', 'b@example.com', 0)"
+        ))
+        await session.commit()
+        assert await read_counts(session, "subscribers") == (0, 0)
+
+    version = table_version("subscribers")
+    assert await reconcile(sessions) == {"subscribers": (2, 1)}
+    assert table_version("subscribers") > version
+    async with sessions() as session:
+        assert await read_counts(session, "subscribers") == (2, 1)
+
+    # Nothing drifted, nothing bumped
+    version = table_version("subscribers")
+    assert await reconcile(sessions) == {}
+    assert table_version("subscribers") == version
+
+
+@pytest.mark.anyio
+async def test_one_claim_per_interval(sessions):
+    assert await claim_reconcile(sessions, 3600)
+    assert not await claim_reconcile(sessions, 3600)
+    assert await claim_reconcile(sessions, 0)
+
+    async with sessions() as session:
+        await session.run_sync(lambda sync_session: clear_reconcile_marker(sync_session.connection()))
+        await session.commit()
+    assert await claim_reconcile(sessions, 3600)
+
+
+def test_stats_are_not_served_stale_after_reconcile(client, admin_headers):
+    from api.db.database import AsyncSessionLocal
+
+    url = "/api/v1/subscribers/stats/summary"
+    first = client.get(url, headers=admin_headers)
+    etag = first.headers["etag"]
+    assert client.get(url, headers={**admin_headers, "If-None-Match": etag}).status_code == 304
+
+    # A write from outside the application: no counter, no version bump
+    with sqlite3.connect(settings.SQLITE_PATH) as connection:
+        connection.execute("INSERT INTO subscribers (id, email, is_active) VALUES (?, 'outside@example.com', 1)", (uuid4().hex,))
+    assert client.get(url, headers={**admin_headers, "If-None-Match": etag}).status_code == 304
+
+    client.portal.call(reconcile, AsyncSessionLocal)
+    response = client.get(url, headers={**admin_headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["total_subscribers"] == first.json()["total_subscribers"] + 1
+
+    client.portal.call(_delete_outside_row, AsyncSessionLocal)
+
+
+async def _delete_outside_row(session_factory):
+    async with session_factory() as session:
+        await session.execute(delete(Subscriber).where(Subscriber.email == "outside@example.com"))
+        await session.commit()
+    await reconcile(session_factory)
@@ -0,0 +1,82 @@
+import pytest
+
+from api.utils.settings import settings
+
+
+def test_metrics_require_an_admin_or_the_scrape_token(client, admin_headers, monkeypatch):
+    assert client.get("/metrics").status_code == 401
+
+    response = client.get("/metrics", headers=admin_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "scrape-secret")
+    assert client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"}).status_code == 200
+    assert client.get("/metrics", headers={"Authorization": "Bearer guessed"}).status_code == 401
+    assert client.get("/metrics", headers=admin_headers).status_code == 200
+
+
+def test_metrics_token_is_not_accepted_when_unset(client):
+    assert settings.METRICS_TOKEN == ""
+    assert client.get("/metrics", headers={"Authorization": "Bearer "}).status_code == 401
+
+
+def test_statement_latency_is_exported_without_buckets():
+    from api.utils.metrics import MetricsRegistry
+
+    registry = MetricsRegistry()
+    latency = registry.summary("db_query_duration_seconds", "SQL statement latency", ("fingerprint",))
+    for fingerprint in ("aaaaaaaaaaaa", "bbbbbbbbbbbb"):
+        for value in (0.001, 0.002, 0.5):
+            latency.observe((fingerprint,), value)
+
+    lines = [line for line in registry.render().splitlines() if not line.startswith("#")]
+    assert not any("_bucket" in line for line in lines)
+    assert len(lines) == 2 * 5
+    assert "# TYPE db_query_duration_seconds summary" in registry.render()
+    assert 'db_query_duration_seconds{fingerprint="aaaaaaaaaaaa",quantile="0.5"} 0.003' in lines
+    assert 'db_query_duration_seconds_count{fingerprint="aaaaaaaaaaaa"} 3' in lines
+
+
+def test_space_saving_keeps_heavy_hitters_in_bounded_memory():
+    from api.utils.metrics import SpaceSaving
+
+    sketch = SpaceSaving(capacity=8)
+    for step in range(200):
+        sketch.offer("10.0.0.1", 5)
+        sketch.offer("10.0.0.2", 3)
+        sketch.offer(f"scanner-{step}")
+
+    top = sketch.top()
+    assert len(top) == 8
+    assert sketch.total == 200 * 9
+    assert [key for key, _, _ in top[:2]] == ["10.0.0.1", "10.0.0.2"]
+    for key, count, error in top:
+        true_count = {"10.0.0.1": 1000, "10.0.0.2": 600}.get(key, 1)
+        # Counts never under-estimate, and over-estimate by at most ``error``
+        assert count - error <= true_count <= count
+
+
+def test_unmatched_paths_share_one_route_label(client):
+    from api.utils.metrics import UNMATCHED_ROUTE, http_requests_total
+
+    before = http_requests_total.value(("GET", UNMATCHED_ROUTE, "404"))
+    for attempt in range(3):
+        assert client.get(f"/wp-admin/probe-{attempt}.php").status_code == 404
+    assert http_requests_total.value(("GET", UNMATCHED_ROUTE, "404")) == before + 3
+    assert not any("probe" in labels[1] for labels in http_requests_total._values)
+
+
+@pytest.mark.parametrize("statement, normalized", [
+    ("SELECT id::text FROM donations WHERE amount > %(amount_1)s::numeric",
+     "SELECT id::text FROM donations WHERE amount > ?::numeric"),
+    ("SELECT * FROM subscribers WHERE email = :email AND created_at::date = $1",
+     "SELECT * FROM subscribers WHERE email = ? AND created_at::date = ?"),
+    ("UPDATE t SET note = CAST(:note AS TEXT), tag = :tag::text WHERE id IN (?, ?, ?)",
+     "UPDATE t SET note = CAST(? AS TEXT), tag = ?::text WHERE id IN (?...)"),
+    ("SELECT 'a::b', 42", "SELECT ?, ?"),
+])
+def test_normalize_sql_keeps_casts(statement, normalized):
+    from api.db.instrumentation import normalize_sql
+
+    assert normalize_sql(statement)[0] == normalized
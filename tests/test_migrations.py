@@ -0,0 +1,103 @@
+""" Upgrading a deployment whose startup create_all already made the new tables """
+import os
+from pathlib import Path
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from api.v1.models.models import Base
+
+alembic_command = pytest.importorskip("alembic.command")
+from alembic.config import Config
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Columns and indexes the migrations add to tables that existed before them
+ADDED_INDEXES = ("ix_newsletters_status_scheduled_at", "ix_subscribers_updated_at_id", "ix_subscribers_email_lower")
+ADDED_COLUMNS = {
+    "newsletters": ("lease_owner", "lease_expires_at", "queued_count", "sent_count", "deferred_count",
+                    "bounced_count", "checkpoint_subscriber_id"),
+    "subscribers": ("updated_at",),
+}
+
+
+def test_upgrade_after_startup_create_all(tmp_path, monkeypatch):
+    url = f"sqlite:///{tmp_path / 'deployed.db'}"
+    engine = create_engine(url)
+    # What the new code's startup leaves behind on an old database: the old
+    # tables as they were, plus the new tables made by create_all
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        for index in ADDED_INDEXES:
+            connection.execute(text(f"DROP INDEX {index}"))
+        for table, columns in ADDED_COLUMNS.items():
+            for column in columns:
+                connection.execute(text(f"ALTER TABLE {table} DROP COLUMN {column}"))
+        for i, active in enumerate((1, 1, 0)):
+            connection.execute(text("INSERT INTO subscribers (id, email, is_active) VALUES (:id, :email, :active)"),
+                               {"id": uuid4().hex, "email": f"reader{i}@example.com", "active": active})
+        # Increments written by the app between startup and the migration
+        connection.execute(text(
+            "INSERT INTO entity_counters (name, shard, total, active) VALUES ('subscribers', 3, 1, 1)"
+        ))
+
+    monkeypatch.setenv("DB_URL", url)
+    config = Config(str(ROOT / "alembic.ini"))
+    alembic_command.upgrade(config, "head")
+
+    with engine.connect() as connection:
+        assert connection.execute(text(
+            "SELECT SUM(total), SUM(active) FROM entity_counters WHERE name = 'subscribers'"
+        )).one() == (3, 2)
+        indexes = set(connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'")).scalars())
+        assert {"ix_subscribers_updated_at_id", "ix_subscribers_email_lower"} <= indexes
+        assert "checkpoint_subscriber_id" in {column["name"] for column in inspect(connection).get_columns("newsletters")}
+
+    # And again from scratch is a no-op for the tables and a fresh seed for the counters
+    alembic_command.downgrade(config, "e5b9f2c4a817")
+    alembic_command.upgrade(config, "head")
+    engine.dispose()
+
+
+def test_sqlite_uuid_columns_are_rebuilt_as_text(tmp_path, monkeypatch):
+    url = f"sqlite:///{tmp_path / 'old.db'}"
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        # Tables as SQLite databases created before the CHAR(32) mapping have them
+        for table in ("subscribers", "newsletter_deliveries"):
+            create_sql, = connection.execute(
+                text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": table}
+            ).one()
+            indexes = connection.execute(text(
+                "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = :name AND sql IS NOT NULL"
+            ), {"name": table}).scalars().all()
+            connection.execute(text(f"DROP TABLE {table}"))
+            connection.execute(text(create_sql.replace("CHAR(32)", "UUID")))
+            for sql in indexes:
+                connection.execute(text(sql))
+        connection.execute(text("INSERT INTO subscribers (id, email, is_active) VALUES (:id, 'a@example.com', 1)"),
+                           {"id": uuid4().hex})
+
+    monkeypatch.setenv("DB_URL", url)
+    config = Config(str(ROOT / "alembic.ini"))
+    alembic_command.stamp(config, "f2a8d6b3c915")
+    alembic_command.upgrade(config, "head")
+
+    digits_only = "12345678901234567890123456789012"
+    with engine.begin() as connection:
+        for table in ("subscribers", "newsletter_deliveries"):
+            types = {row.name: row.type for row in connection.execute(text(f"PRAGMA table_info({table})"))}
+            assert "UUID" not in types.values()
+        assert types["subscriber_id"] == "CHAR(32)"
+        connection.execute(text("INSERT INTO subscribers (id, email, is_active) VALUES (:id, 'b@example.com', 1)"),
+                           {"id": digits_only})
+        stored = connection.execute(text("SELECT typeof(id) FROM subscribers WHERE email = 'b@example.com'"))
+        assert stored.scalar() == "text"
+        assert connection.execute(text("SELECT count(*) FROM subscribers")).scalar() == 2
+        indexes = set(connection.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'subscribers'"
+        )).scalars())
+        assert {"ix_subscribers_email", "ix_subscribers_email_lower", "ix_subscribers_updated_at_id"} <= indexes
+    engine.dispose()
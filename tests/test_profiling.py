@@ -0,0 +1,65 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from api.utils.profiling import ProfilingMiddleware, StackSampler
+
+pytestmark = pytest.mark.anyio
+
+
+def spin(seconds: float) -> None:
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def own_work():
+    spin(0.05)
+
+
+def other_request_work():
+    spin(0.05)
+
+
+async def test_sampler_keeps_only_its_own_task_on_the_loop_thread():
+    async def other_request():
+        await asyncio.sleep(0.01)
+        other_request_work()
+
+    sampler = StackSampler(0.001, asyncio.current_task())
+    sampler.start()
+    other = asyncio.create_task(other_request())
+    await asyncio.sleep(0.08)  # the other task runs while this one waits
+    own_work()
+    await other
+    sampler.stop()
+
+    folded = sampler.folded()
+    assert "own_work" in folded
+    assert "other_request_work" not in folded
+
+
+async def test_profiles_get_distinct_files_written_off_the_loop(tmp_path, monkeypatch):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    middleware = ProfilingMiddleware(app, profile_dir=str(tmp_path), sample_rate=1, interval=0.001)
+    writers = []
+    write = middleware._write
+    monkeypatch.setattr(middleware, "_write", lambda *args: (writers.append(threading.get_ident()), write(*args)))
+
+    scope = {"type": "http", "method": "GET", "path": "/api/v1/donations/", "headers": [], "query_string": b""}
+    for _ in range(3):
+        await middleware(scope, receive, send)
+
+    assert len(list(tmp_path.glob("*_GET_api_v1_donations.folded"))) == 3
+    assert threading.get_ident() not in writers
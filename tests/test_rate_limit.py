@@ -0,0 +1,65 @@
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from api.utils.rate_limit import (
+    MemoryBucketStore, RateLimitMiddleware, SharedBucketStore, per_minute, rate_limited_total,
+)
+
+POLICY = per_minute("test", 6, 3)  # one token every 10 seconds, bursts of 3
+
+
+@pytest.fixture(params=["memory", "shared"])
+def store(request):
+    if request.param == "memory":
+        return MemoryBucketStore(max_idle=POLICY.refill_seconds)
+    return SharedBucketStore(slots=64)
+
+
+def test_bucket_allows_a_burst_then_refills(store):
+    assert [store.take("client", POLICY, 100.0)[0] for _ in range(3)] == [True, True, True]
+
+    allowed, retry_after = store.take("client", POLICY, 100.0)
+    assert not allowed
+    assert retry_after == pytest.approx(10.0)
+
+    assert store.take("client", POLICY, 105.0) == (False, pytest.approx(5.0))
+    assert store.take("client", POLICY, 110.0)[0]
+    assert store.take("other", POLICY, 110.0)[0]
+
+
+def test_idle_buckets_are_evicted_once_full_again():
+    store = MemoryBucketStore(max_idle=POLICY.refill_seconds)
+    for client in range(10):
+        store.take(f"client-{client}", POLICY, 0.0)
+    assert len(store) == 10
+    store.take("late", POLICY, POLICY.refill_seconds + 1)
+    assert len(store) == 1
+
+
+def test_rejected_requests_get_429_without_reaching_the_app():
+    calls = []
+
+    async def subscribe(request):
+        calls.append(request.url.path)
+        return PlainTextResponse("ok")
+
+    app = Starlette(routes=[Route("/api/v1/subscribers/", subscribe, methods=["GET", "POST"])])
+    policies = {("POST", "/api/v1/subscribers"): POLICY}
+    client = TestClient(RateLimitMiddleware(app, MemoryBucketStore(max_idle=60), policies))
+
+    before = rate_limited_total.value(("test",))
+    statuses = [client.post("/api/v1/subscribers/").status_code for _ in range(4)]
+    assert statuses == [200, 200, 200, 429]
+    assert len(calls) == 3
+    assert rate_limited_total.value(("test",)) == before + 1
+
+    response = client.post("/api/v1/subscribers")
+    assert response.status_code == 429
+    assert 1 <= int(response.headers["retry-after"]) <= 10
+    assert response.json() == {"detail": "Too many requests, please try again later"}
+
+    # Other methods on the same path are not limited
+    assert client.get("/api/v1/subscribers/").status_code == 200
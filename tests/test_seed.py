@@ -0,0 +1,28 @@
+import random
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from benchmarks.seed import make_id
+
+
+@pytest.fixture
+def local_timezone(monkeypatch):
+    def use(name):
+        monkeypatch.setenv("TZ", name)
+        time.tzset()
+
+    yield use
+    monkeypatch.undo()
+    time.tzset()
+
+
+@pytest.mark.parametrize("name", ["UTC", "America/New_York", "Asia/Kolkata"])
+def test_ids_do_not_depend_on_the_local_timezone(local_timezone, name):
+    local_timezone(name)
+    moment = datetime(2025, 6, 1)
+    generated = make_id(random.Random(1), moment, 0)
+    assert str(generated) == "019728c9-c000-7000-a46d-d6122265b1f5"
+    # The id's timestamp is the naive created_at read as UTC
+    assert generated.int >> 80 == int(moment.replace(tzinfo=timezone.utc).timestamp() * 1000)
@@ -0,0 +1,96 @@
+import time
+from collections import Counter
+
+import pytest
+
+from api.utils.email_service import Envelope
+from api.utils.send_throttle import DEFERRAL_COOLDOWN, DomainDispatcher, DomainThrottle, TokenBucket
+
+pytestmark = pytest.mark.anyio
+
+
+def bucket():
+    return TokenBucket(rate=10.0, burst=2.0, min_rate=1.0, max_rate=12.0, increase=0.5)
+
+
+def test_successes_raise_the_rate_additively_up_to_the_cap():
+    limited = bucket()
+    for _ in range(3):
+        limited.on_success()
+    assert limited.rate == 11.5
+    for _ in range(10):
+        limited.on_success()
+    assert limited.rate == 12.0
+
+
+def test_a_deferral_halves_the_rate_and_pauses_the_domain():
+    limited = bucket()
+    now = time.monotonic()
+    limited.on_deferral(now)
+    assert limited.rate == 5.0
+    assert not limited.try_take(now + DEFERRAL_COOLDOWN / 2)
+    assert limited.wait_time(now + DEFERRAL_COOLDOWN / 2) == pytest.approx(DEFERRAL_COOLDOWN / 2)
+
+    # The rest of a pipelined burst is deferred too; that counts once
+    limited.on_deferral(now + 0.1)
+    assert limited.rate == 5.0
+
+    # Allowed again once the pause is over, no more than a burst at a time
+    after = now + DEFERRAL_COOLDOWN + 0.2
+    assert [limited.try_take(after) for _ in range(3)] == [True, True, False]
+    assert limited.wait_time(after) == pytest.approx(1 / 5.0)
+
+
+def test_repeated_deferrals_stop_at_the_minimum_rate():
+    limited = bucket()
+    now = time.monotonic()
+    for step in range(10):
+        limited.on_deferral(now + step * DEFERRAL_COOLDOWN)
+    assert limited.rate == 1.0
+
+
+def test_feedback_only_slows_down_on_domain_deferrals():
+    throttle = DomainThrottle(rate=10, burst=10, min_rate=1, max_rate=100, increase=1)
+    throttle.feedback("example.com", 250)
+    assert throttle.bucket("example.com").rate == 11
+    throttle.feedback("example.com", 421)  # the connection, not the domain
+    throttle.feedback("example.com", 550)
+    assert throttle.bucket("example.com").rate == 11
+    throttle.feedback("example.com", 451)
+    assert throttle.bucket("example.com").rate == 5.5
+    assert throttle.bucket("example.org").rate == 10
+
+
+def envelopes(domain, count):
+    return [Envelope(f"reader{i}@{domain}", b"", f"{domain}-{i}") for i in range(count)]
+
+
+async def test_dispatcher_mixes_domains_and_skips_a_throttled_one():
+    throttle = DomainThrottle(rate=1000, burst=1000, min_rate=1, max_rate=1000, increase=0)
+    dispatcher = DomainDispatcher(throttle, depth=6, limit=100)
+    for domain in ("a.test", "b.test", "c.test"):
+        for envelope in envelopes(domain, 4):
+            await dispatcher.put(envelope)
+
+    first = dispatcher._take()
+    assert [envelope.recipient.partition("@")[2] for envelope in first] == ["a.test", "b.test", "c.test"] * 2
+
+    throttle.feedback("a.test", 451)
+    second = dispatcher._take()
+    assert Counter(envelope.recipient.partition("@")[2] for envelope in second) == {"b.test": 2, "c.test": 2}
+    assert list(dispatcher.queues) == ["a.test"]
+
+
+async def test_dispatcher_ends_once_everything_is_done():
+    dispatcher = DomainDispatcher(DomainThrottle.unlimited(), depth=4, limit=100)
+    for envelope in envelopes("a.test", 5):
+        await dispatcher.put(envelope)
+    dispatcher.finish()
+
+    chunks = []
+    async for chunk in dispatcher.chunks():
+        chunks.append(chunk)
+        if len(chunks) == 1:
+            dispatcher.requeue(chunk[0])  # deferred and retried inline
+        dispatcher.done(len(chunk) - (len(chunks) == 1))
+    assert [len(chunk) for chunk in chunks] == [4, 2]
@@ -0,0 +1,52 @@
+import subprocess
+import sys
+import textwrap
+from argparse import Namespace
+from pathlib import Path
+
+import pytest
+
+import serve
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_quick_failures_back_off_then_give_up():
+    master = serve.Master(None, None, Namespace(max_startup_failures=3))
+    assert master.respawn_delay(serve.STARTUP_FAILURE, 0.1) == serve.RESPAWN_BACKOFF
+    assert master.respawn_delay(1, 0.1) == serve.RESPAWN_BACKOFF * 2
+    with pytest.raises(RuntimeError):
+        master.respawn_delay(1, 0.1)
+
+
+def test_recycled_and_long_lived_workers_reset_the_count():
+    master = serve.Master(None, None, Namespace(max_startup_failures=2))
+    master.respawn_delay(1, 0.1)
+    assert master.respawn_delay(0, 0.1) == 0.0  # recycled after max requests
+    master.respawn_delay(1, 0.1)
+    # Crashed after serving for a while: replaced after the first back-off step
+    assert master.respawn_delay(1, serve.STABLE_SECONDS + 1) == serve.RESPAWN_BACKOFF
+    assert master.failures == 1
+
+
+def test_master_exits_when_workers_cannot_start():
+    script = textwrap.dedent("""
+        import sys
+        from argparse import Namespace
+        from contextlib import asynccontextmanager
+        from starlette.applications import Starlette
+        import serve
+
+        @asynccontextmanager
+        async def lifespan(app):
+            raise RuntimeError("database unreachable")
+            yield
+
+        args = Namespace(host="127.0.0.1", port=0, workers=2, max_requests=0, max_requests_jitter=0,
+                         graceful_timeout=1, log_level="critical", no_access_log=True, max_startup_failures=3)
+        sock = serve.bind_socket("127.0.0.1", 0, 16)
+        sys.exit(serve.Master(Starlette(lifespan=lifespan), sock, args).run())
+    """)
+    result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 1, result.stderr
+    assert "Giving up: 3 workers in a row failed" in result.stderr
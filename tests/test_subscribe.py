@@ -0,0 +1,61 @@
+import asyncio
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import func, select
+
+from api.utils.entity_counters import exact_counts, read_counts
+from api.utils.subscriber_import import upsert_subscribers
+from api.v1.models.models import Subscriber
+
+
+def test_subscribe_inserts_reactivates_and_refuses_duplicates(client):
+    email = {"email": f"reader-{uuid4().hex[:8]}@example.com"}
+
+    response = client.post("/api/v1/subscribers/", json=email)
+    assert response.status_code == 200
+    assert response.json() == {"message": "Successfully subscribed to newsletter"}
+
+    response = client.post("/api/v1/subscribers/", json=email)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "This email is already subscribed"
+
+    assert client.post("/api/v1/subscribers/unsubscribe", json=email).status_code == 200
+    response = client.post("/api/v1/subscribers/", json=email)
+    assert response.status_code == 200
+    assert response.json() == {"message": "Successfully resubscribed to newsletter"}
+
+
+@pytest.mark.anyio
+async def test_reactivation_clears_the_unsubscribe(sessions):
+    async with sessions() as session:
+        await upsert_subscribers(session, ["left@example.com"])
+        await session.commit()
+        subscriber = await session.scalar(select(Subscriber))
+        subscriber.is_active = False
+        subscriber.unsubscribed_at = subscriber.subscribed_at
+        first_subscribed = subscriber.subscribed_at
+        await session.commit()
+
+        assert await upsert_subscribers(session, ["left@example.com"]) == (0, 1, 0)
+        await session.commit()
+        session.expire_all()
+        subscriber = await session.scalar(select(Subscriber))
+        assert subscriber.is_active
+        assert subscriber.unsubscribed_at is None
+        assert subscriber.subscribed_at >= first_subscribed
+        assert await read_counts(session, "subscribers") == await exact_counts(session, "subscribers") == (1, 1)
+
+
+@pytest.mark.anyio
+async def test_concurrent_subscribes_insert_once(sessions):
+    async def subscribe():
+        async with sessions() as session:
+            outcome = await upsert_subscribers(session, ["race@example.com"])
+            await session.commit()
+            return outcome
+
+    outcomes = await asyncio.gather(*(subscribe() for _ in range(5)))
+    assert sorted(outcomes) == [(0, 0, 1)] * 4 + [(1, 0, 0)]
+    async with sessions() as session:
+        assert await session.scalar(select(func.count()).select_from(Subscriber)) == 1
@@ -0,0 +1,83 @@
+import json
+
+import pytest
+from sqlalchemy import select
+
+from api.utils.entity_counters import exact_counts, read_counts
+from api.utils.subscriber_import import ImportFormatError, import_subscribers, iter_lines, normalize_email
+from api.v1.models.models import Subscriber
+
+pytestmark = pytest.mark.anyio
+
+
+async def chunked(data: bytes, size: int = 7):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+async def existing(sessions):
+    async with sessions() as session:
+        session.add_all([
+            Subscriber(email="active@example.com", is_active=True),
+            Subscriber(email="left@example.com", is_active=False),
+        ])
+        await session.commit()
+
+
+async def test_csv_import_counts_every_outcome(sessions):
+    await existing(sessions)
+    body = (
+        "Name,E-mail\r\n"
+        "Ada,ada@Example.COM\r\n"
+        "Active,active@example.com\r\n"
+        "Left,left@example.com\r\n"
+        "\r\n"
+        "Ada again,ada@example.com\r\n"
+        "Broken,not-an-address\r\n"
+        "Short\r\n"
+        "Grace,grace@example.com\r\n"
+    ).encode()
+
+    async with sessions() as session:
+        report = await import_subscribers(session, chunked(body), "csv", batch_size=3)
+
+    assert (report.rows, report.inserted, report.reactivated, report.already_active) == (7, 2, 1, 1)
+    assert (report.duplicates, report.invalid) == (1, 2)
+    assert [error["line"] for error in report.errors] == [7, 8]
+
+    async with sessions() as session:
+        emails = set((await session.execute(select(Subscriber.email).where(Subscriber.is_active == True))).scalars())
+        assert emails == {"ada@example.com", "active@example.com", "left@example.com", "grace@example.com"}
+        assert await read_counts(session, "subscribers") == await exact_counts(session, "subscribers")
+
+
+async def test_ndjson_import_accepts_objects_and_strings(sessions):
+    lines = [json.dumps({"email": "a@example.com"}), json.dumps("b@example.com"), "{broken", json.dumps({"name": "x"})]
+    async with sessions() as session:
+        report = await import_subscribers(session, chunked("\n".join(lines).encode()), "ndjson")
+    assert (report.rows, report.inserted, report.invalid) == (4, 2, 2)
+    assert report.errors[1]["reason"] == "no email field"
+
+
+async def test_headerless_csv_uses_the_first_column(sessions):
+    async with sessions() as session:
+        report = await import_subscribers(session, chunked(b"a@example.com,Ada\nb@example.com,Bob"), "csv")
+    assert report.inserted == 2
+
+
+async def test_csv_without_an_email_column_is_refused(sessions):
+    async with sessions() as session:
+        with pytest.raises(ImportFormatError):
+            await import_subscribers(session, chunked(b"name,phone\nAda,0800\n"), "csv")
+
+
+async def test_lines_survive_chunk_boundaries():
+    data = "\ufeffzoë@example.com\r\nsecond@example.com".encode()
+    # One byte at a time splits the BOM and the two-byte "ë"
+    lines = [line async for line in iter_lines(chunked(data, 1))]
+    assert lines == ["zoë@example.com", "second@example.com"]
+
+
+def test_normalize_email_matches_the_subscribe_endpoint():
+    assert normalize_email("  Reader@EXAMPLE.com ") == "Reader@example.com"
+    assert normalize_email("user@bücher.example") == "user@bücher.example"
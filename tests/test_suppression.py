@@ -0,0 +1,105 @@
+import json
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import insert, select
+
+from api.utils.bounces import BounceEvent
+from api.utils.email_service import NewsletterSender, SMTPConnection
+from api.utils.entity_counters import exact_counts, read_counts
+from api.utils.send_throttle import DomainThrottle
+from api.utils.settings import settings
+from api.utils.suppression import SuppressionList, ingest, suppression_list
+from api.v1.models.models import EmailSuppression, Newsletter, Subscriber, SuppressionReason
+from benchmarks.smtp_sink import SMTPSink
+
+
+@pytest.mark.anyio
+async def test_ingest_suppresses_and_deactivates(sessions):
+    async with sessions() as session:
+        session.add_all([
+            Subscriber(email="Gone@Bounce.test"),
+            Subscriber(email="angry@bounce.test"),
+            Subscriber(email="busy@bounce.test"),
+        ])
+        await session.commit()
+
+        report = await ingest(session, [
+            BounceEvent("gone@bounce.test", "bounce", True, "5.1.1"),
+            BounceEvent("angry@bounce.test", "bounce", True, "5.7.1"),
+            BounceEvent("ANGRY@bounce.test", "complaint", True, "abuse"),
+            BounceEvent("busy@bounce.test", "bounce", False, "4.2.2"),
+        ], batch_size=1)
+        assert (report.events, report.bounces, report.complaints, report.transient) == (4, 2, 1, 1)
+        assert (report.suppressed, report.deactivated) == (2, 2)
+
+        reasons = dict((await session.execute(select(EmailSuppression.email, EmailSuppression.reason))).all())
+        assert reasons == {"gone@bounce.test": SuppressionReason.BOUNCE, "angry@bounce.test": SuppressionReason.COMPLAINT}
+        active = set((await session.execute(select(Subscriber.email).where(Subscriber.is_active == True))).scalars())
+        assert active == {"busy@bounce.test"}
+        assert await read_counts(session, "subscribers") == await exact_counts(session, "subscribers") == (3, 1)
+        assert "GONE@bounce.test" in suppression_list
+
+        # Ingesting the same address again keeps its first reason
+        again = await ingest(session, [BounceEvent("gone@bounce.test", "complaint", True, "abuse")])
+        assert again.deactivated == 0
+        assert await session.scalar(
+            select(EmailSuppression.reason).where(EmailSuppression.email == "gone@bounce.test")
+        ) == SuppressionReason.BOUNCE
+
+
+@pytest.mark.anyio
+async def test_refresh_loads_rows_added_by_other_processes(sessions):
+    local = SuppressionList()
+    async with sessions() as session:
+        await ingest(session, [BounceEvent("first@bounce.test", "bounce", True)])
+    await local.refresh(sessions, force=True)
+    assert "first@bounce.test" in local
+
+    async with sessions() as session:
+        await ingest(session, [BounceEvent("second@bounce.test", "complaint", True)])
+    await local.refresh(sessions)  # within SUPPRESSION_REFRESH_SECONDS: not yet
+    assert "second@bounce.test" not in local
+    await local.refresh(sessions, force=True)
+    assert "second@bounce.test" in local
+    assert len(local) == 2
+
+
+@pytest.mark.anyio
+async def test_send_skips_suppressed_recipients(sessions):
+    newsletter_id = uuid4()
+    async with sessions() as session:
+        await session.execute(insert(Subscriber), [{"email": f"reader{i}@skip.test"} for i in range(5)])
+        session.add(EmailSuppression(email="reader2@skip.test", reason=SuppressionReason.BOUNCE))
+        session.add(Newsletter(id=newsletter_id, subject="Hello", content="Hello"))
+        await session.commit()
+
+    sink = SMTPSink()
+    server = await sink.start()
+    port = server.sockets[0].getsockname()[1]
+    sender = NewsletterSender(
+        sessions, pool_size=1, batch_size=10, throttle=DomainThrottle.unlimited(),
+        connection_factory=lambda: SMTPConnection("127.0.0.1", port, security="none", sender="news@example.org"),
+    )
+    try:
+        report = await sender.send(newsletter_id)
+    finally:
+        server.close()
+        await server.wait_closed()
+    assert (report.delivered, report.suppressed) == (4, 1)
+    assert sink.stats.recipients == 4
+    assert report.complete
+
+
+def test_bounce_webhook_requires_the_token_or_an_admin(client, admin_headers, monkeypatch):
+    body = json.dumps({"type": "bounce", "email": "hook@bounce.test", "status": "5.1.1"})
+    assert client.post("/api/v1/subscribers/bounces", content=body).status_code == 401
+
+    monkeypatch.setattr(settings, "BOUNCE_WEBHOOK_TOKEN", "hook-secret")
+    assert client.post("/api/v1/subscribers/bounces?token=guessed", content=body).status_code == 401
+    response = client.post("/api/v1/subscribers/bounces?token=hook-secret", content=body)
+    assert response.status_code == 200
+    assert response.json()["suppressed"] == 1
+
+    response = client.post("/api/v1/subscribers/bounces", content=b"{not json", headers=admin_headers)
+    assert response.status_code == 400